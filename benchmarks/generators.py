@@ -0,0 +1,274 @@
+import json
+from pathlib import Path
+
+# Synthetic inputs shaped like what the sites return: OpenDota league match lists and match payloads,
+# Stratz series and match payloads, HLTV results, match and stats pages. The scale is set by the number
+# of teams (players per role follow from the rosters), matches and events. Every generator takes a
+# random.Random, the same seed gives the same data.
+COSTS = list(range(10, 40, 5))
+CS2_ROLES = [('sniper', 1), ('rifler', 4)]
+CS2_MAPS = ['Ancient', 'Anubis', 'Dust2', 'Inferno', 'Mirage', 'Nuke', 'Train']
+DOTA2_ROLES = [('carry', 1), ('mid', 1), ('offlane', 1), ('support', 2)]
+
+
+def team_names(teams):
+    return [f'Team{index}' for index in range(teams)]
+
+
+def write_json(path, data):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf8') as file:
+        json.dump(data, file)
+
+
+def pairings(rng, teams, matches):
+    names = team_names(teams)
+    return [rng.sample(names, 2) for _ in range(matches)]
+
+
+def rosters(pro_players):
+    team_players = {}
+    for player_name, player_info in pro_players.items():
+        team_players.setdefault(player_info['team'], []).append(player_name)
+    return team_players
+
+
+def cs2_pro_players(rng, teams):
+    pro_players = {}
+    for team in team_names(teams):
+        for role, size in CS2_ROLES:
+            for index in range(size):
+                pro_players[f'{team}_{role}{index}'] = {'team': team, 'role': role, 'cost': rng.choice(COSTS)}
+    return pro_players
+
+
+def cs2_player_stat(rng, rounds):
+    assists = rng.randint(0, rounds // 4)
+    return {
+        'kills': rng.randint(rounds // 3, rounds),
+        'assists': assists,
+        'flashes': rng.randint(0, assists),
+        'deaths': rng.randint(rounds // 3, rounds),
+        'fkdiff': rng.randint(-4, 4)
+    }
+
+
+def cs2_map_stats(rng, map_name, team1, team2, team_players):
+    winner_rounds, loser_rounds = (16, 14) if rng.random() < 0.1 else (13, rng.randint(2, 11))
+    team1_rounds, team2_rounds = (winner_rounds, loser_rounds) if rng.random() < 0.5 else (loser_rounds, winner_rounds)
+    rounds = team1_rounds + team2_rounds
+    return {
+        'name': map_name,
+        'team1_name': team1,
+        'team1_rounds': team1_rounds,
+        'team2_name': team2,
+        'team2_rounds': team2_rounds,
+        'rounds': rounds,
+        # the team1 players come first, compute_overall_fantasy_points tells the teams apart by it
+        'players': {player_name: cs2_player_stat(rng, rounds) for player_name in team_players[team1] + team_players[team2]}
+    }
+
+
+def cs2_total_stats(maps):
+    total = dict(maps[0], name='All maps', players={})
+    for key in ['team1_rounds', 'team2_rounds', 'rounds']:
+        total[key] = sum(map_stats[key] for map_stats in maps)
+    for player_name in maps[0]['players']:
+        total['players'][player_name] = {key: sum(map_stats['players'][player_name][key] for map_stats in maps) for key in maps[0]['players'][player_name]}
+    return total
+
+
+def cs2_event(rng, pro_players, matches, days=4, first_match_id=2370000):
+    # An event as hltv.parse_event returns it, the matches sorted by their url as get_matches does
+    team_players = rosters(pro_players)
+    event_matches = []
+    for index, (team1, team2) in enumerate(pairings(rng, len(team_players), matches)):
+        match_id = first_match_id + index
+        slug = f'{team1}-vs-{team2}'.lower()
+        maps = [cs2_map_stats(rng, map_name, team1, team2, team_players) for map_name in rng.sample(CS2_MAPS, rng.choice([1, 2, 2, 3]))]
+        event_matches.append({
+            'url': f'/matches/{match_id}/{slug}',
+            'id': match_id,
+            'day': f'Results for October {10 + index * days // matches}th 2026',
+            'details_url': f'/stats/matches/{match_id}/{slug}',
+            'total': cs2_total_stats(maps) if len(maps) > 1 else maps[0],
+            'maps': maps,
+            'maps_num': len(maps)
+        })
+    return {'matches': sorted(event_matches, key=lambda x: x['url'])}
+
+
+def hltv_cache_name(url):
+    # the file hltv.get_soup caches the page of the url in
+    return url.replace('/', '_').replace('?', '_').replace('=', '_')[1:]
+
+
+def hltv_stats_page(map_stats, map_urls=()):
+    # match-info-box text splits on newlines into ['', 'Map', name, team1, rounds1, '-', team2, rounds2]
+    info = (f'<div class="match-info-box">\n<span class="bold">Map</span>\n{map_stats["name"]}\n<a class="block">{map_stats["team1_name"]}</a>\n'
+            f'{map_stats["team1_rounds"]}\n<span>-</span>\n<a class="block">{map_stats["team2_name"]}</a>\n{map_stats["team2_rounds"]}\n</div>')
+    tables = []
+    player_names = list(map_stats['players'])
+    for team_players in [player_names[:5], player_names[5:]]:
+        rows = ['<tr><th class="st-player">Player</th><th class="st-kills">K (hs)</th><th class="st-assists">A (f)</th><th class="st-deaths">D</th><th class="st-fkdiff">FK diff</th></tr>']
+        for player_name in team_players:
+            player_stat = map_stats['players'][player_name]
+            rows.append(f'<tr><td class="st-player"><a href="/stats/players/0/{player_name}">{player_name}</a></td>'
+                        f'<td class="st-kills">{player_stat["kills"]} ({player_stat["kills"] // 2})</td>'
+                        f'<td class="st-assists">{player_stat["assists"]} ({player_stat["flashes"]})</td>'
+                        f'<td class="st-deaths">{player_stat["deaths"]}</td><td class="st-fkdiff">{player_stat["fkdiff"]:+d}</td></tr>')
+        tables.append(f'<table class="stats-table totalstats">{"".join(rows)}</table>')
+    links = ''.join(f'<a class="stats-match-map" href="{url}">map</a>' for url in map_urls)
+    return f'<html><body><div class="stats-match-maps">{links}</div>{info}{"".join(tables)}</body></html>'
+
+
+def hltv_pages(event_id, event_data):
+    # {cache file name: html} of the results page, the match pages and the stats pages of the event
+    days = {}
+    pages = {}
+    for match in event_data['matches']:
+        days.setdefault(match['day'], []).append(f'<div class="result-con"><a href="{match["url"]}" class="a-reset">result</a></div>')
+        pages[hltv_cache_name(match['url'])] = f'<html><body><div class="stats-detailed-stats"><a href="{match["details_url"]}">Detailed stats</a></div></body></html>'
+        map_urls = []
+        if match['maps_num'] > 1:
+            # the first link is the match overview, then one per map
+            map_urls = [match['details_url']] + [f'/stats/matches/mapstatsid/{match["id"]}{index}/{match["url"].split("/")[-1]}' for index in range(match['maps_num'])]
+            for url, map_stats in zip(map_urls[1:], match['maps']):
+                pages[hltv_cache_name(url)] = hltv_stats_page(map_stats)
+        pages[hltv_cache_name(match['details_url'])] = hltv_stats_page(match['total'], map_urls)
+
+    results = ''.join(f'<div class="results-sublist"><div class="standard-headline">{day}</div>{"".join(day_matches)}</div>' for day, day_matches in days.items())
+    pages[hltv_cache_name(f'/results?event={event_id}')] = f'<html><body>{results}</body></html>'
+    return pages
+
+
+def dota2_pro_players(rng, teams, first_account_id=100000000):
+    pro_players = {}
+    for team in team_names(teams):
+        for role, size in DOTA2_ROLES:
+            for index in range(size):
+                pro_players[f'{team}_{role}{index}'] = {'team': team, 'role': role, 'cost': rng.choice(COSTS), 'account_id': first_account_id + len(pro_players)}
+    return pro_players
+
+
+def dota2_series(rng, teams, series_count, first_series_id=900000, first_match_id=8000000000):
+    # (series id, radiant team, dire team, [(match id, duration, radiant win)]) of Bo2 and Bo3 series
+    all_series = []
+    match_id = first_match_id
+    for index, (team1, team2) in enumerate(pairings(rng, teams, series_count)):
+        games = []
+        for _ in range(rng.choice([2, 3])):
+            match_id += rng.randint(1, 500)
+            games.append((match_id, rng.randint(1500, 3600), rng.random() < 0.5))
+        all_series.append((first_series_id + index, team1, team2, games))
+    return all_series
+
+
+def opendota_league(all_series, start_time=1790000000):
+    return [
+        {'match_id': match_id, 'series_id': series_id, 'series_type': len(games) - 1, 'radiant_name': team1, 'dire_name': team2,
+         'start_time': start_time + match_id % 100000, 'duration': duration, 'radiant_win': radiant_win, 'leagueid': 1, 'version': 21}
+        for series_id, team1, team2, games in all_series for match_id, duration, radiant_win in games
+    ]
+
+
+def dota2_player_stats(rng, duration):
+    minutes = duration / 60
+    return {
+        'kills': rng.randint(0, 15),
+        'deaths': rng.randint(0, 12),
+        'assists': rng.randint(0, 25),
+        'last_hits': rng.randint(int(minutes), int(minutes * 10)),
+        'gold_per_min': rng.randint(250, 850),
+        # 0 double damage 1 haste 2 illusion 3 invisibility 4 shield 5 gold 6 magic 7 water 8 wisdom 9 regen
+        'runes': {str(rune): rng.randint(1, 3) for rune in rng.sample(range(10), rng.randint(0, 5))},
+        'camps_stacked': rng.randint(0, 10),
+        'obs_placed': rng.randint(0, 20),
+        'courier_kills': rng.randint(0, 1),
+        'towers_killed': rng.randint(0, 4),
+        'roshans_killed': rng.randint(0, 2)
+    }
+
+
+def opendota_match(rng, match_id, team1, team2, duration, radiant_win, team_players, pro_players, anonymous=0.1):
+    # A parsed /matches/{id} payload, some players without a pro name as OpenDota has them
+    players = []
+    for slot, player_name in enumerate(team_players[team1] + team_players[team2]):
+        stats = dota2_player_stats(rng, duration)
+        neutral_kills = rng.randint(0, stats['last_hits'] // 3)
+        players.append({
+            'match_id': match_id,
+            'player_slot': slot if slot < 5 else 128 + slot - 5,
+            'account_id': pro_players[player_name]['account_id'],
+            'name': None if rng.random() < anonymous else player_name,
+            'hero_id': rng.randint(1, 138),
+            'isRadiant': slot < 5,
+            'kills': stats['kills'],
+            'deaths': stats['deaths'],
+            'assists': stats['assists'],
+            'last_hits': stats['last_hits'],
+            'lane_kills': stats['last_hits'] - neutral_kills,
+            'neutral_kills': neutral_kills,
+            'ancient_kills': 0,
+            'gold_per_min': stats['gold_per_min'],
+            'xp_per_min': rng.randint(300, 900),
+            'runes': stats['runes'],
+            'camps_stacked': stats['camps_stacked'],
+            'obs_placed': stats['obs_placed'],
+            'sen_placed': rng.randint(0, 20),
+            'courier_kills': stats['courier_kills'],
+            'towers_killed': stats['towers_killed'],
+            'roshans_killed': stats['roshans_killed'],
+            'teamfight_participation': round(rng.uniform(0.3, 0.9), 3),
+            'purchase_log': [{'time': rng.randint(0, duration), 'key': 'item'} for _ in range(20)]
+        })
+    return {'match_id': match_id, 'duration': duration, 'radiant_win': radiant_win, 'game_mode': 2, 'lobby_type': 1, 'players': players}
+
+
+def stratz_series(all_series):
+    return [
+        {'id': series_id, 'type': len(games) - 1, 'matches': [{'id': match_id, 'durationSeconds': duration, 'didRadiantWin': radiant_win} for match_id, duration, radiant_win in games]}
+        for series_id, _, _, games in all_series
+    ]
+
+
+def stratz_match(rng, match_id, team1, team2, duration, radiant_win, team_players, pro_players):
+    # A /match/{id} payload with the parsed stats the normalization reads
+    players = []
+    for slot, player_name in enumerate(team_players[team1] + team_players[team2]):
+        stats = dota2_player_stats(rng, duration)
+        minutes = duration // 60
+        players.append({
+            'steamAccount': {'id': pro_players[player_name].get('account_id', slot), 'proSteamAccount': {'name': player_name}},
+            'playerSlot': slot,
+            'heroId': rng.randint(1, 138),
+            'isRadiant': slot < 5,
+            'numKills': stats['kills'],
+            'numDeaths': stats['deaths'],
+            'numAssists': stats['assists'],
+            'numLastHits': stats['last_hits'],
+            'goldPerMinute': stats['gold_per_min'],
+            'stats': {
+                'campStackPerMin': [stats['camps_stacked'] * minute // minutes for minute in range(1, minutes + 1)],
+                'runeEvents': [{'type': rune, 'time': rng.randint(0, duration)} for rune, count in stats['runes'].items() for _ in range(count)],
+                'wardPlaced': [{'type': 0, 'time': rng.randint(0, duration)} for _ in range(stats['obs_placed'])] + [{'type': 1, 'time': rng.randint(0, duration)} for _ in range(rng.randint(0, 20))],
+                'courierKills': [{'time': rng.randint(0, duration)} for _ in range(stats['courier_kills'])],
+                'farmDistributionReport': {
+                    'buildings': [{'id': 0, 'count': stats['towers_killed']}],
+                    'creepType': [{'id': 133, 'count': stats['roshans_killed']}, {'id': 1, 'count': stats['last_hits']}]
+                },
+                'networthPerMinute': [stats['gold_per_min'] * minute for minute in range(minutes)]
+            }
+        })
+    return {'id': match_id, 'durationSeconds': duration, 'didRadiantWin': radiant_win, 'players': players}
+
+
+def group_table(rng, teams, played_points=4):
+    # A group of a Bo2 round robin with points so far and the remaining matches with bookmaker odds
+    names = team_names(teams)
+    table = {team: rng.randint(0, played_points) for team in names}
+    matches = []
+    for index, team1 in enumerate(names):
+        for team2 in names[index + 1:]:
+            matches.append({'teams': [team1, team2], 'coefficients': [round(rng.uniform(1.5, 6.0), 2), round(rng.uniform(2.0, 2.6), 2), round(rng.uniform(1.5, 6.0), 2)]})
+    return table, matches
@@ -0,0 +1,332 @@
+import argparse
+import contextlib
+import copy
+import importlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import generators
+
+# Timed benchmarks of the hot paths over synthetic data from generators.py, run in a temporary
+# directory that stands in for parsed_data and the output folders, so no live site or private cache
+# is needed:
+#   python benchmarks/run.py --scale medium --output results.json
+#   python benchmarks/run.py --output new.json --compare results.json
+#   python benchmarks/run.py --only startup cs2 dota2.generate_teams
+# Every benchmark runs once to warm up and then --repeat times, the results (with the commit, the
+# machine and the scale) are written as JSON, --compare prints the medians against an earlier run.
+ROOT = Path(__file__).resolve().parent.parent
+SCALES = {
+    'small': {'teams': 8, 'matches': 24, 'events': 2, 'series': 16, 'group teams': 4},
+    'medium': {'teams': 16, 'matches': 64, 'events': 3, 'series': 48, 'group teams': 5},
+    'large': {'teams': 32, 'matches': 160, 'events': 6, 'series': 120, 'group teams': 7}
+}
+# Start-up of the game scripts: a fresh `import main` has to stay under the limit and must not load the
+# scraping, API and report libraries, which are imported by the functions that use them
+STARTUP_GAMES = ['cs2', 'dota2']
+STARTUP_MODULES = ['bs4', 'lxml', 'selenium', 'selenium_stealth', 'undetected_chromedriver', 'requests', 'xlsxwriter', 'pyarrow']
+STARTUP_CODE = f'''import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({{'time': time.perf_counter() - start, 'modules': [name for name in {STARTUP_MODULES} if name in sys.modules]}}))
+'''
+STARTUP_LIMIT = 0.3
+TOURNAMENT_ID = 1
+FIRST_EVENT_ID = 7000
+
+modules = {}
+failed_checks = []
+
+
+def load_module(name, path):
+    # cs2 and dota2 both name their script main.py, each is loaded under its own name with its folder on
+    # sys.path for the modules next to it
+    if name not in modules:
+        sys.path.insert(0, str(path.parent))
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        modules[name] = module
+    return modules[name]
+
+
+def check(passed, message):
+    # timings of code giving wrong results are worth nothing, a failed check fails the run
+    if not passed:
+        print(f'check failed: {message}')
+        failed_checks.append(message)
+
+
+def check_parallel_lineups(game, groups, constraints, loop_order=None):
+    # top_lineups_parallel has to return what top_lineups does for every constraints spec ({label: spec}),
+    # it is made to split the search whatever the size of the pool
+    lineups = importlib.import_module('shared.lineups')
+    min_lineups = lineups.parallel_min_lineups
+    lineups.parallel_min_lineups = 0
+    try:
+        for label, spec in constraints.items():
+            check(lineups.top_lineups_parallel(groups, 100, 100, loop_order, spec, workers=2) == lineups.top_lineups(groups, 100, 100, loop_order, spec),
+                  f'{game}: top_lineups_parallel differs from top_lineups with {label}')
+    finally:
+        lineups.parallel_min_lineups = min_lineups
+
+
+def role_names(pro_players, role):
+    return [player_name for player_name, player_info in pro_players.items() if player_info['role'] == role]
+
+
+def cs2_benchmarks(scale, rng):
+    cs2 = load_module('cs2_main', ROOT / 'cs2' / 'main.py')
+    pro_players = generators.cs2_pro_players(rng, scale['teams'])
+    events = [generators.cs2_event(rng, pro_players, scale['matches'], first_match_id=2370000 + index * 10000) for index in range(scale['events'])]
+    days = sorted(set(match['day'] for match in events[0]['matches']))
+
+    overalls = [cs2.compute_overall_fantasy_points(event_data) for event_data in events]
+    overall_fantasy_points = copy.deepcopy(cs2.merge_overalls(overalls))
+    for player_name, player_info in overall_fantasy_points.items():
+        player_info['role'] = pro_players[player_name]['role']
+        player_info['cost'] = pro_players[player_name]['cost']
+    cs2.postproc_overall_fantasy_points(overall_fantasy_points)
+    cs2.postproc_rating_intervals(overall_fantasy_points, pro_players)
+    fantasy_points_by_role = {role: {player_name: overall_fantasy_points[player_name] for player_name in role_names(pro_players, role)} for role in ['rifler', 'sniper']}
+    day_fantasy_points = cs2.calculate_fantasy_points(pro_players, events[0], days[-1])
+    Path('cs2_fantasy').mkdir(exist_ok=True)
+
+    riflers = role_names(pro_players, 'rifler')
+    lineups = importlib.import_module('shared.lineups')
+    check_parallel_lineups('cs2', cs2.get_lineup_groups(fantasy_points_by_role, pro_players, 'mean points'), {
+        'no constraints': None,
+        'include_any': lineups.lineup_constraints(pro_players, include_any=riflers[-3:]),
+        'max_per_team, exclude and include_any': lineups.lineup_constraints(pro_players, max_per_team=2, exclude=riflers[:1], include_any=riflers[-3:] + ['unknown'])
+    }, loop_order=[1, 0])
+
+    benchmarks = {
+        'cs2.compute_fantasy_points': lambda: [cs2.compute_fantasy_points(events[0], pro_players, day) for day in days],
+        'cs2.compute_overall_fantasy_points': lambda: [cs2.compute_overall_fantasy_points(event_data) for event_data in events],
+        'cs2.merge_overalls': lambda: cs2.merge_overalls(overalls),
+        'cs2.generate_teams': lambda: cs2.generate_teams(fantasy_points_by_role, pro_players, 1000, 100, 'mean points'),
+        'cs2.count_valid_teams': lambda: cs2.count_valid_teams(pro_players, role_names(pro_players, 'rifler'), role_names(pro_players, 'sniper'), 100),
+        'cs2.dump_day': lambda: cs2.dump_day('cs2_fantasy/day.xlsx', pro_players, day_fantasy_points, 'total points', 100),
+        'cs2.dump_overall': lambda: cs2.dump_overall('cs2_fantasy/overall.xlsx', overall_fantasy_points, pro_players, 0)
+    }
+
+    if importlib.util.find_spec('bs4') is None or importlib.util.find_spec('lxml') is None:
+        print('bs4 or lxml is not installed, HLTV pages are not parsed')
+        return benchmarks
+
+    # the pages of the first event go to the page cache hltv.get_soup reads
+    hltv = importlib.import_module('hltv')
+    Path('parsed_data').mkdir(exist_ok=True)
+    for file_name, page in generators.hltv_pages(FIRST_EVENT_ID, events[0]).items():
+        with open(f'parsed_data/{file_name}', 'w', encoding='utf-8') as file:
+            file.write(page)
+    check(hltv.parse_event(FIRST_EVENT_ID, False) == events[0], 'hltv pages do not parse back to the generated event')
+    benchmarks['cs2.hltv_parse_event'] = lambda: hltv.parse_event(FIRST_EVENT_ID, False)
+    return benchmarks
+
+
+def tournament_data(scale, rng):
+    pro_players = generators.dota2_pro_players(rng, scale['teams'])
+    all_series = generators.dota2_series(rng, scale['teams'], scale['series'])
+    team_players = generators.rosters(pro_players)
+    games = [(series_id, team1, team2, game) for series_id, team1, team2, series_games in all_series for game in series_games]
+    return pro_players, all_series, team_players, games
+
+
+def dota2_benchmarks(scale, rng):
+    dota2 = load_module('dota2_main', ROOT / 'dota2' / 'main.py')
+    ingest = importlib.import_module('ingest')
+    pro_players, all_series, team_players, games = tournament_data(scale, rng)
+    generators.write_json(f'parsed_data/{TOURNAMENT_ID}.json', {'matches': generators.opendota_league(all_series)})
+    payloads = [generators.opendota_match(rng, match_id, team1, team2, duration, radiant_win, team_players, pro_players) for _, team1, team2, (match_id, duration, radiant_win) in games]
+    for payload in payloads:
+        ingest.save_match_record('parsed_data', payload['match_id'], ingest.normalize_opendota(payload))
+
+    # the tournaments merge_overalls gets are the series split in events parts
+    match_ids = [match_id for _, _, _, (match_id, _, _) in games]
+    bounds = [match_ids[len(match_ids) * index // scale['events']] for index in range(scale['events'])] + [match_ids[-1] + 1]
+    with contextlib.redirect_stdout(io.StringIO()):
+        overalls = [dota2.compute_fantasy_points(TOURNAMENT_ID, pro_players, False, min_bound, max_bound) for min_bound, max_bound in zip(bounds, bounds[1:])]
+        fantasy_points = dota2.compute_fantasy_points(TOURNAMENT_ID, pro_players, False)
+    dota2.post_calculate_points(fantasy_points, pro_players)
+    dota2.postproc_rating_intervals(fantasy_points)
+    table, matches = generators.group_table(rng, scale['group teams'])
+    dota2.calculate_probabilities(matches)
+    Path('dota2_fantasy').mkdir(exist_ok=True)
+
+    names = [role_names(pro_players, role) for role in ['carry', 'mid', 'offlane', 'support']]
+    lineups = importlib.import_module('shared.lineups')
+    check_parallel_lineups('dota2', dota2.get_lineup_groups(fantasy_points, pro_players), {
+        'no constraints': None,
+        'include_any': lineups.lineup_constraints(pro_players, include_any=names[3][-3:]),
+        'max_per_team, exclude and include_any': lineups.lineup_constraints(pro_players, max_per_team=2, exclude=names[0][:1], include_any=names[3][-3:] + ['unknown'])
+    })
+    return {
+        'dota2.normalize_opendota': lambda: [ingest.normalize_opendota(payload) for payload in payloads],
+        'dota2.compute_fantasy_points': lambda: dota2.compute_fantasy_points(TOURNAMENT_ID, pro_players, False),
+        'dota2.merge_overalls': lambda: dota2.merge_overalls(overalls),
+        'dota2.generate_teams': lambda: dota2.generate_teams(fantasy_points, pro_players, 1000, 100),
+        'dota2.count_valid_teams': lambda: dota2.count_valid_teams(pro_players, *names, 100),
+        'dota2.calculate_table_ties': lambda: dota2.calculate_table_ties(table, matches),
+        'dota2.dump_day': lambda: dota2.dump_day('dota2_fantasy/day.xlsx', TOURNAMENT_ID, pro_players, False, 0, 1e30, 'total points', 100),
+        # tables collects the typed tables instead of writing them, only the workbooks are timed
+        'dota2.dump_overalls_by_points': lambda: dota2.dump_overalls_by_points('dota2_fantasy', '', pro_players, fantasy_points, tables={})
+    }
+
+
+def stratz_benchmarks(scale, rng):
+    stratz = load_module('stratz_main', ROOT / 'dota2' / 'stratz_main.py')
+    ingest = importlib.import_module('ingest')
+    pro_players, all_series, team_players, games = tournament_data(scale, rng)
+    generators.write_json('parsed_data_stratz/series.json', {'series': generators.stratz_series(all_series)})
+    generators.write_json('pro_players_stratz.json', pro_players)
+    payloads = [generators.stratz_match(rng, match_id, team1, team2, duration, radiant_win, team_players, pro_players) for _, team1, team2, (match_id, duration, radiant_win) in games]
+    for payload in payloads:
+        ingest.save_match_record('parsed_data_stratz', payload['id'], ingest.normalize_stratz(payload))
+    Path('dota2_fantasy').mkdir(exist_ok=True)
+
+    return {
+        'stratz.normalize_stratz': lambda: [ingest.normalize_stratz(payload) for payload in payloads],
+        'stratz.compute_fantasy_points': lambda: stratz.compute_fantasy_points(TOURNAMENT_ID, pro_players, False),
+        'stratz.dump_day': lambda: stratz.dump_day('stratz_day.xlsx', TOURNAMENT_ID, False, 0, 1e30, 'total points', 100)
+    }
+
+
+GAMES = {'cs2': cs2_benchmarks, 'dota2': dota2_benchmarks, 'stratz': stratz_benchmarks}
+
+
+def selected(name, only):
+    return not only or any(name == prefix or name.startswith(f'{prefix}.') for prefix in only)
+
+
+def game_selected(game, only):
+    return not only or any(prefix.split('.')[0] == game for prefix in only)
+
+
+def time_benchmark(function, repeat):
+    # the warm-up run pays for the first imports, file caches and process pool start
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return {'repeat': repeat, 'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times), 'times': times}
+
+
+def time_startup(game, repeat, limit):
+    times = []
+    modules_loaded = set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_CODE], cwd=ROOT / game, capture_output=True, text=True, check=True).stdout
+        startup = json.loads(output.splitlines()[-1])
+        times.append(startup['time'])
+        modules_loaded.update(startup['modules'])
+    check(not modules_loaded, f'{game}: import main loads {", ".join(sorted(modules_loaded))}')
+    result = {'repeat': repeat, 'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times), 'times': times}
+    check(result['median'] <= limit, f'{game}: import main takes {result["median"]:.3f} s, the limit is {limit} s')
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+def run_benchmarks(scale, seed, repeat, only, startup_limit=STARTUP_LIMIT):
+    results = {}
+    for game in STARTUP_GAMES:
+        if selected(f'startup.{game}', only):
+            results[f'startup.{game}'] = time_startup(game, repeat, startup_limit)
+            print(f'startup.{game}: {results[f"startup.{game}"]["median"] * 1000:.1f} ms')
+
+    with tempfile.TemporaryDirectory() as work_path:
+        cwd = os.getcwd()
+        os.chdir(work_path)
+        try:
+            for game, game_benchmarks in GAMES.items():
+                if not game_selected(game, only):
+                    continue
+
+                benchmarks = game_benchmarks(scale, random.Random(seed))
+                for name, function in benchmarks.items():
+                    if selected(name, only):
+                        results[name] = time_benchmark(function, repeat)
+                        print(f'{name}: {results[name]["median"] * 1000:.1f} ms')
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    for name, result in results.items():
+        if name not in baseline['benchmarks']:
+            continue
+        ratio = result['median'] / baseline['benchmarks'][name]['median']
+        mark = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        print(f'{name}: {baseline["benchmarks"][name]["median"] * 1000:.1f} ms -> {result["median"] * 1000:.1f} ms ({ratio:.2f}x) {mark}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the hot paths over synthetic OpenDota, Stratz and HLTV data.')
+    parser.add_argument('--scale', choices=SCALES, default='medium')
+    parser.add_argument('--teams', type=int, help='teams in the rosters, sets the players per role')
+    parser.add_argument('--matches', type=int, help='matches of a cs2 event')
+    parser.add_argument('--events', type=int, help='cs2 events and dota2 tournament parts to merge')
+    parser.add_argument('--series', type=int, help='series of the dota2 tournament')
+    parser.add_argument('--group-teams', type=int, help='teams of the group for calculate_table_ties')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='games (startup, cs2, dota2, stratz) or benchmarks (cs2.generate_teams) to run')
+    parser.add_argument('--startup-limit', type=float, default=STARTUP_LIMIT, help='seconds a fresh import of a game script may take')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change of the median reported as slower or faster')
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    overrides = {'teams': args.teams, 'matches': args.matches, 'events': args.events, 'series': args.series, 'group teams': args.group_teams}
+    scale.update({key: value for key, value in overrides.items() if value is not None})
+
+    results = run_benchmarks(scale, args.seed, args.repeat, args.only, args.startup_limit)
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scale': scale,
+        'seed': args.seed,
+        'failed checks': failed_checks,
+        'benchmarks': results
+    }
+    with open(args.output, 'w', encoding='utf8') as file:
+        json.dump(report, file, indent=2)
+    print(f'results: {args.output}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf8') as file:
+            compare_results(results, json.load(file), args.threshold)
+
+    if failed_checks:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import concurrent.futures
+import json
+import os
+from pathlib import Path
+
+# HLTV scraping and the event caches. Selenium, undetected_chromedriver and BeautifulSoup take most of
+# the start-up time, they are imported by the functions that scrape, runs over cached events never load them.
+HLTV_URL = 'https://www.hltv.org'
+
+
+def get_selenium_driver() -> 'uc.Chrome':
+    import undetected_chromedriver as uc
+    from selenium_stealth import stealth
+
+    options = uc.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-renderer-backgrounding')
+    driver_executable_path = f'{Path.home()}/appdata/roaming/undetected_chromedriver/undetected_chromedriver.exe'
+    driver = uc.Chrome(driver_executable_path=driver_executable_path, options=options, no_sandbox=False, user_multi_procs=False, use_subprocess=False)
+    stealth(
+        driver,
+        languages=['en-US', 'en'],
+        platform='Win32',
+        fix_hairline=True,
+    )
+
+    return driver
+
+
+def get_page(url: str) -> 'BeautifulSoup':
+    from bs4 import BeautifulSoup
+
+    print(f'load: {url}')
+    driver = get_selenium_driver()
+    driver.get(url)
+    soup = BeautifulSoup(markup=driver.page_source, features='lxml')
+    driver.close()
+    driver.quit()
+
+    return soup
+
+
+def get_soup(base_url: str, url: str, reload: bool = False) -> 'BeautifulSoup':
+    from bs4 import BeautifulSoup
+
+    cache_file_path = f"parsed_data/{url.replace('/', '_').replace('?', '_').replace('=', '_')[1:]}"
+
+    if reload or not os.path.exists(cache_file_path):
+        soup = get_page(f'{base_url}{url}')
+        with open(cache_file_path, 'w', encoding='utf-8') as file:
+            file.write(str(soup))
+    else:
+        with open(cache_file_path, 'r', encoding='utf-8') as file:
+            page_source = file.read()
+            soup = BeautifulSoup(markup=page_source, features='lxml')
+
+    return soup
+
+
+def get_matches(event_id: int, reload: bool):
+    event_soup = get_soup(HLTV_URL, f'/results?event={event_id}', reload)
+    matches = []
+    for day_div in event_soup.find_all('div', 'results-sublist'):
+        for match_div in day_div.find_all('div', 'result-con'):
+            url = match_div.find('a').get('href')
+            match_data = {'url': url, 'id': int(url.split('/')[2]), 'day': day_div.find('div', 'standard-headline').text}
+            matches.append(match_data)
+
+    return sorted(matches, key=lambda x: x['url'])
+
+
+def get_map_stats(details_soup: 'BeautifulSoup') -> dict:
+    map_stats = dict()
+
+    map_info_soup = details_soup.find('div', 'match-info-box')
+    map_info_strings = map_info_soup.text.split('\n')
+    map_stats['name'] = map_info_strings[2]
+    map_stats['team1_name'] = map_info_strings[3].strip()
+    map_stats['team1_rounds'] = int(map_info_strings[4])
+    map_stats['team2_name'] = map_info_strings[6]
+    map_stats['team2_rounds'] = int(map_info_strings[7])
+    map_stats['rounds'] = map_stats['team1_rounds'] + map_stats['team2_rounds']
+
+    map_stats['players'] = {}
+    for table_soup in details_soup.find_all('table', 'totalstats'):
+        for row_soup in table_soup.find_all('tr')[1:]:
+            player_stats = {
+                'kills': int(row_soup.find('td', 'st-kills').text.split(' ')[0]),
+                'assists': int(row_soup.find('td', 'st-assists').text.split(' ')[0]),
+                'flashes': int(row_soup.find('td', 'st-assists').text.split(' ')[1].replace('(', '').replace(')', '')),
+                'deaths': int(row_soup.find('td', 'st-deaths').text),
+                'fkdiff': int(row_soup.find('td', 'st-fkdiff').text)
+            }
+
+            player_name = row_soup.find('td', 'st-player').find('a').text
+            map_stats['players'][player_name] = player_stats
+
+    return map_stats
+
+
+def parse_match(match: dict, reload: bool = False) -> bool:
+    # reload fetches the match page again, a match without detailed stats yet may have them by now
+    match_soup = get_soup(HLTV_URL, match['url'], reload)
+    detailed_stats_div = match_soup.find('div', 'stats-detailed-stats')
+    if detailed_stats_div is None:
+        print(f'filtered: {match["url"]}')
+        return False
+
+    match['details_url'] = detailed_stats_div.find('a').get('href')
+
+    details_soup = get_soup(HLTV_URL, match['details_url'])
+
+    match['total'] = get_map_stats(details_soup)
+    match['maps'] = []
+    maps_soup = details_soup.findAll('a', 'stats-match-map')
+    if maps_soup:
+        for map_soup in maps_soup[1:]:
+            map_url = map_soup.get('href')
+            map_soup = get_soup(HLTV_URL, map_url)
+            match['maps'].append(get_map_stats(map_soup))
+    else:
+        match['maps'].append(match['total'])
+
+    match['maps_num'] = len(match['maps'])
+
+    return True
+
+
+def parse_event(event_id: int, reload: bool) -> dict:
+    # matches = get_matches(event_id, reload)
+    # approved_matches = []
+    # for match in matches:
+    #     if parse_match(match):
+    #         approved_matches.append(match)
+    #
+    # return {'matches': approved_matches}
+
+    matches = get_matches(event_id, reload)
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = list(executor.map(parse_match, matches))
+        return {'matches': [match for match, approved in zip(matches, results) if approved]}
+
+
+def get_event_data(event_id: int, reload: bool):
+    Path('parsed_data').mkdir(parents=True, exist_ok=True)
+    statistic_cache_file_path = f'parsed_data/event_{event_id}_statistic.json'
+    if reload or not os.path.exists(statistic_cache_file_path):
+        event_data = parse_event(event_id, reload)
+
+        with open(statistic_cache_file_path, 'w', encoding='utf8') as file:
+            json.dump(event_data, file, indent=2)
+
+        return event_data
+    else:
+        with open(statistic_cache_file_path, 'r', encoding='utf8') as file:
+            return json.load(file)
+
+
+def update_event_data(event_id: int) -> list:
+    # New finished matches of a live event: the results page is fetched again but only the matches not in
+    # the event cache are parsed, the approved ones are added to the cache and returned
+    event_data = get_event_data(event_id, False)
+    known_ids = {match['id'] for match in event_data['matches']}
+    new_matches = [match for match in get_matches(event_id, True) if match['id'] not in known_ids]
+    if not new_matches:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        results = list(executor.map(parse_match, new_matches, [True] * len(new_matches)))
+    new_matches = [match for match, approved in zip(new_matches, results) if approved]
+    if new_matches:
+        event_data['matches'] += new_matches
+        with open(f'parsed_data/event_{event_id}_statistic.json', 'w', encoding='utf8') as file:
+            json.dump(event_data, file, indent=2)
+
+    return new_matches
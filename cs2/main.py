@@ -1,159 +1,33 @@
+import argparse
+import collections
+import copy
 import itertools
 import json
+import math
 import os
+import sys
+import time
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
-from bs4 import BeautifulSoup
-from selenium_stealth import stealth
-import undetected_chromedriver as uc
-from styleframe import StyleFrame, Styler, utils
-import multiprocessing
-import concurrent.futures
-
-HLTV_URL = 'https://www.hltv.org'
-
-
-def get_selenium_driver() -> uc.Chrome:
-    options = uc.ChromeOptions()
-    options.add_argument('--headless=new')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--disable-renderer-backgrounding')
-    driver_executable_path = f'{Path.home()}/appdata/roaming/undetected_chromedriver/undetected_chromedriver.exe'
-    driver = uc.Chrome(driver_executable_path=driver_executable_path, options=options, no_sandbox=False, user_multi_procs=False, use_subprocess=False)
-    stealth(
-        driver,
-        languages=['en-US', 'en'],
-        platform='Win32',
-        fix_hairline=True,
-    )
-
-    return driver
-
-
-def get_page(url: str) -> BeautifulSoup:
-    print(f'load: {url}')
-    driver = get_selenium_driver()
-    driver.get(url)
-    soup = BeautifulSoup(markup=driver.page_source, features='lxml')
-    driver.close()
-    driver.quit()
-
-    return soup
-
-
-def get_soup(base_url: str, url: str, reload: bool = False) -> BeautifulSoup:
-    cache_file_path = f"parsed_data/{url.replace('/', '_').replace('?', '_').replace('=', '_')[1:]}"
-
-    if reload or not os.path.exists(cache_file_path):
-        soup = get_page(f'{base_url}{url}')
-        with open(cache_file_path, 'w', encoding='utf-8') as file:
-            file.write(str(soup))
-    else:
-        with open(cache_file_path, 'r', encoding='utf-8') as file:
-            page_source = file.read()
-            soup = BeautifulSoup(markup=page_source, features='lxml')
-
-    return soup
-
-
-def get_matches(event_id: int, reload: bool):
-    event_soup = get_soup(HLTV_URL, f'/results?event={event_id}', reload)
-    matches = []
-    for day_div in event_soup.find_all('div', 'results-sublist'):
-        for match_div in day_div.find_all('div', 'result-con'):
-            url = match_div.find('a').get('href')
-            match_data = {'url': url, 'id': int(url.split('/')[2]), 'day': day_div.find('div', 'standard-headline').text}
-            matches.append(match_data)
-
-    return sorted(matches, key=lambda x: x['url'])
-
-
-def get_map_stats(details_soup: BeautifulSoup) -> dict:
-    map_stats = dict()
-
-    map_info_soup = details_soup.find('div', 'match-info-box')
-    map_info_strings = map_info_soup.text.split('\n')
-    map_stats['name'] = map_info_strings[2]
-    map_stats['team1_name'] = map_info_strings[3].strip()
-    map_stats['team1_rounds'] = int(map_info_strings[4])
-    map_stats['team2_name'] = map_info_strings[6]
-    map_stats['team2_rounds'] = int(map_info_strings[7])
-    map_stats['rounds'] = map_stats['team1_rounds'] + map_stats['team2_rounds']
-
-    map_stats['players'] = {}
-    for table_soup in details_soup.find_all('table', 'totalstats'):
-        for row_soup in table_soup.find_all('tr')[1:]:
-            player_stats = {
-                'kills': int(row_soup.find('td', 'st-kills').text.split(' ')[0]),
-                'assists': int(row_soup.find('td', 'st-assists').text.split(' ')[0]),
-                'flashes': int(row_soup.find('td', 'st-assists').text.split(' ')[1].replace('(', '').replace(')', '')),
-                'deaths': int(row_soup.find('td', 'st-deaths').text),
-                'fkdiff': int(row_soup.find('td', 'st-fkdiff').text)
-            }
-
-            player_name = row_soup.find('td', 'st-player').find('a').text
-            map_stats['players'][player_name] = player_stats
-
-    return map_stats
-
-
-def parse_match(match: dict) -> bool:
-    match_soup = get_soup(HLTV_URL, match['url'])
-    detailed_stats_div = match_soup.find('div', 'stats-detailed-stats')
-    if detailed_stats_div is None:
-        print(f'filtered: {match["url"]}')
-        return False
-
-    match['details_url'] = detailed_stats_div.find('a').get('href')
-
-    details_soup = get_soup(HLTV_URL, match['details_url'])
-
-    match['total'] = get_map_stats(details_soup)
-    match['maps'] = []
-    maps_soup = details_soup.findAll('a', 'stats-match-map')
-    if maps_soup:
-        for map_soup in maps_soup[1:]:
-            map_url = map_soup.get('href')
-            map_soup = get_soup(HLTV_URL, map_url)
-            match['maps'].append(get_map_stats(map_soup))
-    else:
-        match['maps'].append(match['total'])
-
-    match['maps_num'] = len(match['maps'])
-
-    return True
-
-
-def parse_event(event_id: int, reload: bool) -> dict:
-    # matches = get_matches(event_id, reload)
-    # approved_matches = []
-    # for match in matches:
-    #     if parse_match(match):
-    #         approved_matches.append(match)
-    #
-    # return {'matches': approved_matches}
 
-    matches = get_matches(event_id, reload)
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = list(executor.map(parse_match, matches))
-        return {'matches': [match for match, approved in zip(matches, results) if approved]}
+from hltv import get_event_data, update_event_data
 
+# the modules both games share are in the shared package next to the game directories
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared import manifest
+from shared.columnar import columnar_outputs, lineups_table, write_columnar_tables
+from shared.excel import descending_order, sheet_table, write_sheet, write_table, write_workbook, write_workbooks
+from shared.lineups import count_lineups_by_balance, lineup_constraints, lineup_portfolio, lineups_above, top_lineups_by_percentile, top_lineups_for_balances, top_lineups_parallel
+from shared.manifest import inputs_hash, outdated, record_outputs
+from shared.ratings import rating_intervals
+from shared.scheduler import required_tasks, run_tasks, task
+from shared.service import query_constraints, query_records, query_service, serve
+from shared.simulator import map_win_probability, odds_probabilities, simulate_from_odds
 
-def get_event_data(event_id: int, reload: bool):
-    Path('parsed_data').mkdir(parents=True, exist_ok=True)
-    statistic_cache_file_path = f'parsed_data/event_{event_id}_statistic.json'
-    if reload or not os.path.exists(statistic_cache_file_path):
-        event_data = parse_event(event_id, reload)
-
-        with open(statistic_cache_file_path, 'w', encoding='utf8') as file:
-            json.dump(event_data, file, indent=2)
-
-        return event_data
-    else:
-        with open(statistic_cache_file_path, 'r', encoding='utf8') as file:
-            return json.load(file)
+# the scoring rules of the game are part of the code the manifest hashes cover
+manifest.code_paths.append(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_PATH = 'cs2_fantasy/manifest.json'
 
 
 def convert_pro_players_from_cyber():
@@ -267,10 +141,7 @@ def dump_points_to_excel(writer, fantasy_points, sorting_key):
             data.append(row)
 
         columns = ['name'] + main_columns + details_columns
-        df = pd.DataFrame(data, columns=columns)
-        sf = StyleFrame(df)
-        sf.A_FACTOR = 6
-        sf.to_excel(writer, sheet_name=role, best_fit=columns)
+        write_sheet(writer, role, columns, data, a_factor=6)
 
 
 def dump_captains_to_excel(writer, fantasy_points):
@@ -281,10 +152,7 @@ def dump_captains_to_excel(writer, fantasy_points):
     captains_info = sorted(captains_info, key=lambda x: x[1], reverse=True)
 
     columns = ['name', 'points', 'role']
-    df = pd.DataFrame(captains_info, columns=columns)
-    sf = StyleFrame(df)
-    sf.A_FACTOR = 4
-    sf.to_excel(writer, sheet_name='captains rating', best_fit=columns)
+    write_sheet(writer, 'captains rating', columns, captains_info)
 
 
 def calculate_team_points(players_points, pro_players, players_names, captain_name):
@@ -303,63 +171,117 @@ def calculate_team_points(players_points, pro_players, players_names, captain_na
     return team_info
 
 
-def generate_teams(fantasy_points, pro_players, teams_count, balance, sort_key):
-    dream_teams_rating = []
-    teams_rating = []
-
+def get_lineup_groups(fantasy_points, pro_players, sort_key):
     sorted_riflers_points = dict(sorted(fantasy_points['rifler'].items(), key=lambda x: x[1][sort_key], reverse=True))
-    riflers_names = list(sorted_riflers_points.keys())
     sorted_sniper_points = dict(sorted(fantasy_points['sniper'].items(), key=lambda x: x[1][sort_key], reverse=True))
-    snipers_names = list(sorted_sniper_points.keys())
-
-    for riflers_combination in itertools.combinations(riflers_names, 4):
-        for sniper_name in snipers_names:
-            team_names = [sniper_name] + list(riflers_combination)
-            players_points = [sorted_sniper_points[sniper_name][sort_key]]
-            for rifler_name in riflers_combination:
-                players_points.append(sorted_riflers_points[rifler_name][sort_key])
+    snipers = [(player_name, player_info[sort_key], pro_players[player_name]['cost']) for player_name, player_info in sorted_sniper_points.items()]
+    riflers = [(player_name, player_info[sort_key], pro_players[player_name]['cost']) for player_name, player_info in sorted_riflers_points.items()]
+    return [(snipers, 1), (riflers, 4)]
+
+
+def lineups_to_teams(lineups, pro_players):
+    return [calculate_team_points(players_points, pro_players, names, names[captain_index]) for _, _, names, players_points, captain_index in lineups]
+
+
+def generate_teams(fantasy_points, pro_players, teams_count, balance, sort_key, constraints=None):
+    # The old loops ran over rifler combinations first and snipers second, loop_order keeps that tie order
+    dream_lineups, lineups = top_lineups_parallel(get_lineup_groups(fantasy_points, pro_players, sort_key), teams_count, balance, loop_order=[1, 0], constraints=constraints)
+    return [lineups_to_teams(dream_lineups, pro_players), lineups_to_teams(lineups, pro_players)]
+
+
+def generate_teams_for_balances(fantasy_points, pro_players, teams_count, balances, sort_key, constraints=None):
+    dream_lineups, lineups_by_balance = top_lineups_for_balances(get_lineup_groups(fantasy_points, pro_players, sort_key), teams_count, balances, loop_order=[1, 0], constraints=constraints)
+    return [lineups_to_teams(dream_lineups, pro_players), {balance: lineups_to_teams(lineups, pro_players) for balance, lineups in lineups_by_balance.items()}]
+
+
+def generate_teams_above(fantasy_points, pro_players, min_points, balance, sort_key):
+    # Every lineup (with its best captain) scoring at least min_points, without top-K pruning
+    return lineups_to_teams(lineups_above(get_lineup_groups(fantasy_points, pro_players, sort_key), min_points, balance, loop_order=[1, 0]), pro_players)
+
+
+def generate_portfolio(fantasy_points, pro_players, entries, max_overlap, balance, sort_key, max_exposure=None, constraints=None):
+    # Multi-entry teams sharing at most max_overlap players with each other, best first
+    lineups = lineup_portfolio(get_lineup_groups(fantasy_points, pro_players, sort_key), entries, max_overlap, balance, max_exposure, loop_order=[1, 0], constraints=constraints)
+    return lineups_to_teams(lineups, pro_players)
+
+
+def points_covariance(fantasy_points: dict, players: list = None, min_common_maps: int = 3) -> dict:
+    # Players x players covariance of map points over the maps both played (players of the same match
+    # share map ids), pairs with fewer common maps count as independent. Eigenvalues are clipped at 0
+    # so every lineup variance is valid.
+    players = list(fantasy_points) if players is None else players
+    map_ids = sorted({map_id for player_name in players for map_id in fantasy_points[player_name]['map ids']})
+    map_indices = {map_id: index for index, map_id in enumerate(map_ids)}
+    points = np.zeros((len(players), len(map_ids)))
+    played = np.zeros((len(players), len(map_ids)))
+    for player_index, player_name in enumerate(players):
+        columns = [map_indices[map_id] for map_id in fantasy_points[player_name]['map ids']]
+        points[player_index, columns] = fantasy_points[player_name]['points']
+        played[player_index, columns] = 1.0
+
+    means = (points * played).sum(axis=1) / np.maximum(played.sum(axis=1), 1)
+    centered = (points - means[:, None]) * played
+    common = played @ played.T
+    matrix = (centered @ centered.T) / np.maximum(common - 1, 1)
+    variances = np.diag(matrix).copy()
+    matrix[common < min_common_maps] = 0.0
+    np.fill_diagonal(matrix, variances)
+    values, vectors = np.linalg.eigh(matrix)
+    return {'names': players, 'matrix': (vectors * np.clip(values, 0.0, None)) @ vectors.T}
+
+
+def generate_teams_by_percentile(fantasy_points, pro_players, teams_count, balance, sort_key, covariance, percentile, constraints=None):
+    # Teams by a percentile of their points instead of the mean: low percentiles prefer steady lineups,
+    # high ones stacks of teammates who win and lose together
+    rated = top_lineups_by_percentile(get_lineup_groups(fantasy_points, pro_players, sort_key), teams_count, covariance, percentile, balance, loop_order=[1, 0], constraints=constraints)
+    teams = []
+    for score, variance, lineup in rated:
+        team_info = lineups_to_teams([lineup], pro_players)[0]
+        team_info['std'] = np.round(math.sqrt(variance), 3)
+        team_info[f'p{percentile * 100:g}'] = np.round(score, 3)
+        team_info['stack'] = max(collections.Counter(pro_players[player_name]['team'] for player_name in lineup[2]).values())
+        teams.append(team_info)
+    return teams
+
+
+def print_stacking(fantasy_points, pro_players, balance, sort_key, covariance, percentiles=(0.1, 0.5, 0.9)):
+    # The best team for every percentile with at most 1..5 players of one team
+    for percentile in percentiles:
+        print(f'p{percentile * 100:g}')
+        for max_per_team in range(1, 6):
+            constraints = lineup_constraints(pro_players, max_per_team=max_per_team)
+            for team in generate_teams_by_percentile(fantasy_points, pro_players, 1, balance, sort_key, covariance, percentile, constraints):
+                print(f'{max_per_team}: {team['points']:.3f} ± {team['std']:.3f} -> {team[f'p{percentile * 100:g}']:.3f} (stack {team['stack']})')
+        print('')
 
-            for captain_name in team_names:
-                team_info = calculate_team_points(players_points, pro_players, team_names, captain_name)
-                dream_teams_rating.append(team_info)
-                if team_info['cost'] <= balance:
-                    teams_rating.append(team_info)
 
-    teams_rating = sorted(teams_rating, key=lambda x: x['points'], reverse=True)
-    dream_teams_rating = sorted(dream_teams_rating, key=lambda x: x['points'], reverse=True)
-    return [dream_teams_rating[:teams_count], teams_rating[:teams_count]]
+def dump_teams_to_excel(writer, teams_rating, columns, sheet_name):
+    data = [[team_info[column_name] for column_name in columns] for team_info in teams_rating]
+    write_sheet(writer, sheet_name, columns, data)
 
 
-def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, teams_count, balance, sort_key):
-    dream_teams_rating, teams_rating = generate_teams(fantasy_points, pro_players, teams_count, balance, sort_key)
+def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, teams_count, balance, sort_key, constraints=None):
+    # balance may be a list, then every balance gets its own top teams sheet from one lineup frontier,
+    # constraints is a lineups.lineup_constraints spec applied inside the search
+    if isinstance(balance, list):
+        dream_teams_rating, teams_rating_by_balance = generate_teams_for_balances(fantasy_points, pro_players, teams_count, balance, sort_key, constraints)
+    else:
+        dream_teams_rating, teams_rating = generate_teams(fantasy_points, pro_players, teams_count, balance, sort_key, constraints)
+        teams_rating_by_balance = {balance: teams_rating}
+    sheet_names = {team_balance: f'Top teams {team_balance}' for team_balance in balance} if isinstance(balance, list) else {balance: 'Top teams'}
 
     columns = ['sniper', 'rifler1', 'rifler2', 'rifler3', 'rifler4', 'cost', 'points']
-    top_teams_data = list()
-    for team_info in teams_rating:
-        if team_info['cost'] <= balance:
-            row = list()
-            for column_name in columns:
-                row.append(team_info[column_name])
-            top_teams_data.append(row)
-
-    if len(top_teams_data):
-        top_teams_df = pd.DataFrame(top_teams_data, columns=columns)
-        sf_top_teams_df = StyleFrame(top_teams_df)
-        sf_top_teams_df.A_FACTOR = 4
-        sf_top_teams_df.to_excel(writer, sheet_name='Top teams', best_fit=columns)
-
-    top_dream_teams_data = list()
-
-    for team_info in dream_teams_rating:
-        row = list()
-        for column_name in columns:
-            row.append(team_info[column_name])
-        top_dream_teams_data.append(row)
-
-    top_dream_teams_df = pd.DataFrame(top_dream_teams_data, columns=columns)
-    sf_top_dream_teams_df = StyleFrame(top_dream_teams_df)
-    sf_top_dream_teams_df.A_FACTOR = 4
-    sf_top_dream_teams_df.to_excel(writer, sheet_name='Top dream teams', best_fit=columns)
+    for team_balance, teams_rating in teams_rating_by_balance.items():
+        if len(teams_rating):
+            dump_teams_to_excel(writer, teams_rating, columns, sheet_names[team_balance])
+
+    dump_teams_to_excel(writer, dream_teams_rating, columns, 'Top dream teams')
+    return dream_teams_rating, teams_rating_by_balance
+
+
+def dump_portfolio_to_excel(writer, fantasy_points, pro_players, entries, max_overlap, balance, sort_key, max_exposure=None, constraints=None):
+    teams_rating = generate_portfolio(fantasy_points, pro_players, entries, max_overlap, balance, sort_key, max_exposure, constraints)
+    dump_teams_to_excel(writer, teams_rating, ['sniper', 'rifler1', 'rifler2', 'rifler3', 'rifler4', 'cost', 'points'], 'Portfolio')
 
 
 def calculate_fantasy_points(pro_players: dict, event_data: dict, day: str) -> dict:
@@ -371,7 +293,7 @@ def calculate_fantasy_points(pro_players: dict, event_data: dict, day: str) -> d
 def compute_overall_fantasy_points(event_data: dict) -> dict:
     fantasy_points = {}
     for match in event_data['matches']:
-        for map_stat in match['maps']:
+        for map_index, map_stat in enumerate(match['maps']):
             for player_index, [player_name, player_stat] in enumerate(map_stat['players'].items()):
                 is_team1 = player_index < 5
                 if player_name not in fantasy_points:
@@ -383,6 +305,8 @@ def compute_overall_fantasy_points(event_data: dict) -> dict:
                         'wins count': 0,
                         'loses count': 0,
                         'rounds won': [],
+                        'map ids': [],
+                        'map names': [],
                         'maps points': '',
                         'maps': {}
                     }
@@ -397,6 +321,8 @@ def compute_overall_fantasy_points(event_data: dict) -> dict:
                 player_info['wins'].append(is_win)
                 player_info['wins count' if is_win else 'loses count'] += 1
                 player_info['rounds won'].append(rounds_won)
+                player_info['map ids'].append(f'{match['id']}/{map_index}')
+                player_info['map names'].append(map_stat['name'])
                 player_info['maps points'] += '{0: <7}'.format(points_sum)
 
                 if map_stat['name'] not in player_info['maps']:
@@ -462,10 +388,20 @@ def postproc_overall_fantasy_points(fantasy_points: dict):
             player_info['maps'][map_name]['map rating'] = map_ratings[map_name]
 
 
-def dump_overall_to_excel(writer, fantasy_points, sort_key):
-    fantasy_points = dict(sorted(fantasy_points.items(), key=lambda x: x[1][sort_key], reverse=True))
+def postproc_rating_intervals(fantasy_points: dict, pro_players: dict, resamples: int = 1000, confidence: float = 0.9, seed: int = 0):
+    # Bootstrap intervals and shrunk estimates (see ratings.py) of mean points, mean points per win and per
+    # lose, shrunk toward the role mean
+    groups = {player_name: pro_players.get(player_name, {}).get('role') for player_name in fantasy_points}
+    rating_intervals(fantasy_points, groups, ['mean points', 'mean points per win', 'mean points per lose'], resamples, confidence, seed)
+
+
+OVERALL_SORT_KEYS = ['mean points', 'mean points per win', 'mean points per lose', 'mean points shrunk', 'mean points low']
+
+
+def dump_overall_to_excel(writer, fantasy_points, sort_keys):
+    # One sheet per sort key, all of them share the rows and differ by an argsort
     data = list()
-    main_columns = ['team', 'role', 'cost', 'mean points', 'mean points per win', 'mean points per lose', 'winrate', 'mean points per round', 'mean points per cost', 'min points', 'max points', 'rounds winrate', 'maps points']
+    main_columns = ['team', 'role', 'cost', 'mean points', 'mean points ci', 'mean points shrunk', 'mean points per win', 'mean points per win ci', 'mean points per win shrunk', 'mean points per lose', 'mean points per lose ci', 'mean points per lose shrunk', 'winrate', 'mean points per round', 'mean points per cost', 'min points', 'max points', 'rounds winrate', 'maps points']
     for player_name, player_info in fantasy_points.items():
         row = [player_name]
         for column_name in main_columns:
@@ -475,15 +411,9 @@ def dump_overall_to_excel(writer, fantasy_points, sort_key):
                 row.append('')
         data.append(row)
 
-    columns = ['name'] + main_columns
-    df = pd.DataFrame(data, columns=columns)
-    sf = StyleFrame(df)
-    sf.A_FACTOR = 4
-    sf.apply_column_style(
-        cols_to_style=['maps points'],
-        styler_obj=Styler(font='Courier New', horizontal_alignment=utils.horizontal_alignments.left),
-    )
-    sf.to_excel(writer, sheet_name=f'{sort_key}', best_fit=columns)
+    table = sheet_table(['name'] + main_columns, data)
+    for sort_key in sort_keys:
+        write_table(writer, f'{sort_key}', table, descending_order([player_info[sort_key] for player_info in fantasy_points.values()]), ['maps points'])
 
 
 def dump_maps_perfomance_to_excel(writer, fantasy_points):
@@ -511,76 +441,191 @@ def dump_maps_perfomance_to_excel(writer, fantasy_points):
     columns = ['name'] + main_columns + map_columns
     for map_name, map_data in maps_data.items():
         map_data = sorted(map_data, key=lambda x: x[5], reverse=True)
-        df = pd.DataFrame(map_data, columns=columns)
-        sf = StyleFrame(df)
-        sf.A_FACTOR = 4
-        sf.apply_column_style(
-            cols_to_style=['map points'],
-            styler_obj=Styler(font='Courier New', horizontal_alignment=utils.horizontal_alignments.left),
-        )
-        sf.to_excel(writer, sheet_name=map_name, best_fit=columns)
-
-
-def dump_overall(excel_file_name: str, overall_fantasy_points: dict, pro_players: dict, balance: int):
-    with pd.ExcelWriter(excel_file_name) as writer:
-        for player_name, player_stat in overall_fantasy_points.items():
-            if player_name in pro_players:
-                player_stat['role'] = pro_players[player_name]['role']
-                player_stat['cost'] = pro_players[player_name]['cost']
+        write_sheet(writer, map_name, columns, map_data, monospace=['map points'])
 
-        dump_overall_to_excel(writer, overall_fantasy_points, 'mean points')
-        dump_overall_to_excel(writer, overall_fantasy_points, 'mean points per win')
-        dump_overall_to_excel(writer, overall_fantasy_points, 'mean points per lose')
 
-        dump_maps_perfomance_to_excel(writer, overall_fantasy_points)
+LINEUP_POSITIONS = ['sniper', 'rifler1', 'rifler2', 'rifler3', 'rifler4']
+DAY_TABLES = ['players', 'lineups']
+OVERALL_TABLES = ['players', 'maps']
 
-        fantasy_points_by_role = {'rifler': {}, 'sniper': {}}
-        for player_name in pro_players:
-            if player_name in overall_fantasy_points:
-                role = pro_players[player_name]['role']
-                fantasy_points_by_role[role][player_name] = overall_fantasy_points[player_name]
 
-        if balance:
-            dump_teams_rating_to_excel(writer, fantasy_points_by_role, pro_players, 1000, balance, 'mean points')
+def table_paths(excel_file_name: str, table_names: list) -> list:
+    # The typed tables of a workbook go next to it: day1.xlsx -> day1.players.parquet, ...
+    return [f'{os.path.splitext(excel_file_name)[0]}.{table_name}' for table_name in table_names]
 
 
-def dump_day(excel_file_name: str, pro_players: dict, fantasy_points: dict, sort_key: str, balance: int):
-    with pd.ExcelWriter(excel_file_name) as writer:
-        dump_points_to_excel(writer, fantasy_points, sort_key)
-        dump_captains_to_excel(writer, fantasy_points)
-        dump_teams_rating_to_excel(writer, fantasy_points, pro_players, 1000, balance, 'total points')
+def day_players_table(fantasy_points: dict):
+    details_columns = ['kills', 'assists', 'flashes', 'deaths', 'fkdiff']
+    columns = [('name', 'string'), ('role', 'string'), ('team', 'string'), ('cost', 'int'), ('total points', 'float'), ('points per cost', 'float'), ('match num', 'int'), ('maps num', 'int')]
+    columns += [(column_name, 'float') for column_name in details_columns]
+    rows = []
+    for role in fantasy_points.keys():
+        for player_name, player_info in fantasy_points[role].items():
+            row = [player_name, role] + [player_info[column_name] for column_name, _ in columns[2:8]]
+            rows.append(row + [player_info['points details sum'][column_name] for column_name in details_columns])
+    return columns, rows
+
+
+def overall_players_table(fantasy_points: dict):
+    # The overall sheets with numbers for numbers: winrates in percent, intervals as low and high columns
+    stat_columns = []
+    for key in ['mean points', 'mean points per win', 'mean points per lose']:
+        stat_columns += [key, f'{key} low', f'{key} high', f'{key} shrunk']
+    stat_columns += ['mean points per round', 'mean points per cost', 'min points', 'max points']
+    columns = [('name', 'string'), ('team', 'string'), ('role', 'string'), ('cost', 'int'), ('maps', 'int'), ('wins', 'int'), ('winrate', 'float'), ('rounds winrate', 'float')]
+    columns += [(column_name, 'float') for column_name in stat_columns]
+    rows = []
+    for player_name, player_info in fantasy_points.items():
+        maps_count = len(player_info['points'])
+        row = [player_name, player_info['team'], player_info.get('role'), player_info.get('cost'), maps_count, player_info['wins count'],
+               player_info['wins count'] / maps_count * 100, float(np.mean(player_info['rounds won']))]
+        rows.append(row + [player_info[column_name] for column_name in stat_columns])
+    return columns, rows
+
+
+def overall_maps_table(fantasy_points: dict):
+    # One row per player and played map, the map id is '<match id>/<map index>'
+    columns = [('name', 'string'), ('team', 'string'), ('map id', 'string'), ('map', 'string'), ('points', 'float'), ('points per round', 'float'), ('win', 'bool'), ('rounds won', 'float')]
+    rows = []
+    for player_name, player_info in fantasy_points.items():
+        for map_values in zip(player_info['map ids'], player_info['map names'], player_info['points'], player_info['points per round'], player_info['wins'], player_info['rounds won']):
+            rows.append([player_name, player_info['team'], *map_values])
+    return columns, rows
+
+
+def store_workbook(excel_file_name: str, sheets: list, workbooks: dict = None):
+    # workbooks ({file name: sheets}) collects the workbook for write_workbooks, otherwise it is written here
+    if workbooks is None:
+        write_workbook(excel_file_name, sheets)
+    else:
+        workbooks[excel_file_name] = sheets
+
+
+def dump_overall(excel_file_name: str, overall_fantasy_points: dict, pro_players: dict, balance: int, workbooks: dict = None, tables: dict = None):
+    # tables ({path: (columns, rows)}) collects the typed tables of the workbook for write_columnar_tables
+    for player_name, player_stat in overall_fantasy_points.items():
+        if player_name in pro_players:
+            player_stat['role'] = pro_players[player_name]['role']
+            player_stat['cost'] = pro_players[player_name]['cost']
+
+    sheets = []
+    dump_overall_to_excel(sheets, overall_fantasy_points, OVERALL_SORT_KEYS)
+    dump_maps_perfomance_to_excel(sheets, overall_fantasy_points)
+
+    fantasy_points_by_role = {'rifler': {}, 'sniper': {}}
+    for player_name in pro_players:
+        if player_name in overall_fantasy_points:
+            role = pro_players[player_name]['role']
+            fantasy_points_by_role[role][player_name] = overall_fantasy_points[player_name]
+
+    table_names = OVERALL_TABLES
+    table_values = [overall_players_table(overall_fantasy_points), overall_maps_table(overall_fantasy_points)]
+    if balance:
+        teams_ratings = dump_teams_rating_to_excel(sheets, fantasy_points_by_role, pro_players, 1000, balance, 'mean points')
+        table_names = OVERALL_TABLES + ['lineups']
+        table_values.append(lineups_table(*teams_ratings, LINEUP_POSITIONS))
+    store_workbook(excel_file_name, sheets, workbooks)
+    if tables is not None:
+        tables.update(zip(table_paths(excel_file_name, table_names), table_values))
+
+
+def dump_day(excel_file_name: str, pro_players: dict, fantasy_points: dict, sort_key: str, balance: int, constraints: dict = None, workbooks: dict = None, tables: dict = None):
+    sheets = []
+    dump_points_to_excel(sheets, fantasy_points, sort_key)
+    dump_captains_to_excel(sheets, fantasy_points)
+    teams_ratings = dump_teams_rating_to_excel(sheets, fantasy_points, pro_players, 1000, balance, 'total points', constraints)
+    store_workbook(excel_file_name, sheets, workbooks)
+    if tables is not None:
+        tables.update(zip(table_paths(excel_file_name, DAY_TABLES), [day_players_table(fantasy_points), lineups_table(*teams_ratings, LINEUP_POSITIONS)]))
 
 
 def dump_event(event_name: str, event_id: int, reload: bool, pro_players: dict, balance: int = 100, re_dump: bool = False, dump_days: bool = False, last_day_only: bool = False) -> dict:
+    # re_dump asks for the event workbooks, they are rebuilt only when the event cache, the roster, the
+    # arguments or the code changed since they were written (see manifest.py)
     print(event_name)
     event_data = get_event_data(event_id, reload)
 
     output_path = f'cs2_fantasy/{event_name}'
+    unique_days = []
+    if dump_days:
+        unique_days = sorted(set(match['day'] for match in event_data['matches']))
+        if last_day_only:
+            unique_days = unique_days[-1:]
+
+    outputs = [f'{output_path}/{day}.xlsx' for day in unique_days] + [f'{output_path}/overall.xlsx']
+    outputs += columnar_outputs([path for day in unique_days for path in table_paths(f'{output_path}/{day}.xlsx', DAY_TABLES)])
+    outputs += columnar_outputs(table_paths(f'{output_path}/overall.xlsx', OVERALL_TABLES))
+    digest = inputs_hash([f'parsed_data/event_{event_id}_statistic.json'], [pro_players, balance, unique_days])
+    re_dump = re_dump and outdated(MANIFEST_PATH, outputs, digest)
     if re_dump:
         Path('cs2_fantasy').mkdir(parents=True, exist_ok=True)
         Path(output_path).mkdir(parents=True, exist_ok=True)
 
+    workbooks = {}
+    tables = {}
     if dump_days and re_dump:
-        unique_days = set()
-        for match in event_data['matches']:
-            unique_days.add(match['day'])
-        unique_days = sorted(list(unique_days))
-        if last_day_only:
-            unique_days = [list(unique_days)[-1]]
-
         for day in unique_days:
             fantasy_points = calculate_fantasy_points(pro_players, event_data, day)
-            dump_day(f'{output_path}/{day}.xlsx', pro_players, fantasy_points, 'total points', balance)
+            dump_day(f'{output_path}/{day}.xlsx', pro_players, fantasy_points, 'total points', balance, workbooks=workbooks, tables=tables)
 
     overall_fantasy_points = compute_overall_fantasy_points(event_data)
     postproc_overall_fantasy_points(overall_fantasy_points)
+    postproc_rating_intervals(overall_fantasy_points, pro_players)
     if re_dump:
-        dump_overall(f'{output_path}/overall.xlsx', overall_fantasy_points, pro_players, 0)
+        dump_overall(f'{output_path}/overall.xlsx', overall_fantasy_points, pro_players, 0, workbooks, tables)
+        write_workbooks(workbooks)
+        write_columnar_tables(tables)
+        record_outputs(MANIFEST_PATH, outputs, digest)
         print(f'dump: {event_name}')
 
     return overall_fantasy_points
 
 
+def watch_event(event_name: str, event_id: int, pro_players: dict, balance: int = 100, merged: list = (), interval: float = 30, polls: int = None):
+    # Live event days: every interval seconds the new finished matches are parsed (update_event_data) and
+    # only the workbooks they change are written again: the days they were played on, the event overall
+    # and the merged overalls in merged, (file name, overalls of the other events, pro_players, balance)
+    # as for dump_merged_overalls, which hold the lineups for the next day
+    output_path = f'cs2_fantasy/{event_name}'
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    event_points = compute_overall_fantasy_points(get_event_data(event_id, False))
+    poll = 0
+    while polls is None or poll < polls:
+        if poll:
+            time.sleep(interval)
+        poll += 1
+
+        try:
+            new_matches = update_event_data(event_id)
+        except Exception as e:
+            print(f'Error: {e}')
+            continue
+
+        if not new_matches:
+            continue
+
+        print(f'{event_name}: {len(new_matches)} new matches')
+        event_data = get_event_data(event_id, False)
+        workbooks = {}
+        tables = {}
+        for day in sorted(set(match['day'] for match in new_matches)):
+            fantasy_points = calculate_fantasy_points(pro_players, event_data, day)
+            dump_day(f'{output_path}/{day}.xlsx', pro_players, fantasy_points, 'total points', balance, workbooks=workbooks, tables=tables)
+
+        # the per-map points of the new matches are added to the ones of the event so far
+        event_points = merge_overalls([event_points, compute_overall_fantasy_points({'matches': new_matches})])
+        overall_fantasy_points = copy.deepcopy(event_points)
+        postproc_overall_fantasy_points(overall_fantasy_points)
+        postproc_rating_intervals(overall_fantasy_points, pro_players)
+        dump_overall(f'{output_path}/overall.xlsx', overall_fantasy_points, pro_players, 0, workbooks, tables)
+        write_workbooks(workbooks)
+        write_columnar_tables(tables)
+
+        for file_name, overalls, merged_pro_players, merged_balance in merged:
+            dump_merged_overalls(file_name, overalls + [overall_fantasy_points], merged_pro_players, merged_balance)
+        print(f'dump: {", ".join(workbooks)}')
+
+
 def merge_dicts(dict1, dict2, excluded_keys):
     merged_dict = {}
     for key in set(dict1) | set(dict2):
@@ -613,21 +658,37 @@ def dump_merged_overalls(file_name: str, overalls: list[dict], pro_players: dict
 
     overall_fantasy_points = merge_overalls(overalls)
     overall_fantasy_points = {key: value for key, value in overall_fantasy_points.items() if key in pro_players}
+    # players of a single event share their dicts with it, a copy keeps the windows independent, and the
+    # cost of the window's roster is set before the points per cost are computed
+    overall_fantasy_points = copy.deepcopy(overall_fantasy_points)
+    for player_name, player_info in overall_fantasy_points.items():
+        player_info['role'] = pro_players[player_name]['role']
+        player_info['cost'] = pro_players[player_name]['cost']
+    # the merged per-map points stand for the event caches they came from
+    maps_points = {player_name: [player_info['team'], player_info['map ids'], player_info['points'], player_info['wins'], player_info['rounds won']] for player_name, player_info in overall_fantasy_points.items()}
+    digest = inputs_hash(data=[maps_points, pro_players, balance])
 
     postproc_overall_fantasy_points(overall_fantasy_points)
-    dump_overall(f'{output_path}/{file_name}.xlsx', overall_fantasy_points, pro_players, balance)
+    postproc_rating_intervals(overall_fantasy_points, pro_players)
+    excel_file_name = f'{output_path}/{file_name}.xlsx'
+    outputs = [excel_file_name] + columnar_outputs(table_paths(excel_file_name, OVERALL_TABLES + (['lineups'] if balance else [])))
+    if outdated(MANIFEST_PATH, outputs, digest):
+        tables = {}
+        dump_overall(excel_file_name, overall_fantasy_points, pro_players, balance, tables=tables)
+        write_columnar_tables(tables)
+        record_outputs(MANIFEST_PATH, outputs, digest)
 
     return overall_fantasy_points
 
 
+def get_cost_groups(pro_players_actual, riflers_names, snipers_names):
+    snipers = [(player_name, 0, pro_players_actual[player_name]['cost']) for player_name in snipers_names]
+    riflers = [(player_name, 0, pro_players_actual[player_name]['cost']) for player_name in riflers_names]
+    return [(snipers, 1), (riflers, 4)]
+
+
 def count_valid_teams(pro_players_actual, riflers_names, snipers_names, max_cost):
-    teams_count = 0
-    for comb in itertools.combinations(riflers_names, 4):
-        for sniper_name in snipers_names:
-            cost = sum(pro_players_actual[player]['cost'] for player in comb) + pro_players_actual[sniper_name]['cost']
-            if cost <= max_cost:
-                teams_count += 1
-    return teams_count
+    return count_lineups_by_balance(get_cost_groups(pro_players_actual, riflers_names, snipers_names), [max_cost])[max_cost]
 
 
 def print_balance_distribution():
@@ -637,9 +698,11 @@ def print_balance_distribution():
     riflers_names = [player_name for player_name, player_data in pro_players_actual.items() if player_data['role'] == 'rifler']
     print(f'snipers count = {len(snipers_names)}')
     print(f'riflers count = {len(riflers_names)}')
-    teams_count = sum(1 for _ in itertools.combinations(riflers_names, 4)) * len(snipers_names)
-    for balance in range(100, 200, 5):
-        teams_count_for_balance = count_valid_teams(pro_players_actual, riflers_names, snipers_names, balance)
+    teams_count = math.comb(len(riflers_names), 4) * len(snipers_names)
+    balances = list(range(100, 200, 5))
+    teams_counts = count_lineups_by_balance(get_cost_groups(pro_players_actual, riflers_names, snipers_names), balances)
+    for balance in balances:
+        teams_count_for_balance = teams_counts[balance]
         print(f'{balance}: {teams_count_for_balance}/{teams_count} {round(1.0 * teams_count_for_balance / teams_count * 100, 3)}%')
 
 
@@ -652,29 +715,142 @@ def print_cost_distribution():
     print(costs_distribution)
 
 
-def calculate_predict_points_for_map(result_points: dict, pro_players: dict, players: list, fantasy_points: dict, match: dict, win_points_key: str, lose_points_key: str):
-    for player_name in players:
-        player_role = pro_players[player_name]['role']
-        if player_name not in result_points[player_role].keys():
-            result_points[player_role][player_name] = {'points': 0}
-        for map_index, map_result in enumerate(match['wins']):
-            map_name = match['maps'][map_index]
-            map_info = fantasy_points[player_name]['maps'][map_name]
-            result_points[player_role][player_name]['points'] += map_info[win_points_key if map_result else lose_points_key] / len(match['wins'])
+def team_rosters(pro_players: dict) -> dict:
+    rosters = {}
+    for player_name, player_info in pro_players.items():
+        rosters.setdefault(player_info['team'], []).append(player_name)
+    return rosters
+
+
+def series_scenarios(best_of: int):
+    # Every way a series can end: map wins of the first team and played maps over the map slots
+    wins_needed = best_of // 2 + 1
+    scenarios = set()
+    for results in itertools.product([True, False], repeat=best_of):
+        played = best_of
+        for maps_num in range(1, best_of + 1):
+            if max(sum(results[:maps_num]), maps_num - sum(results[:maps_num])) == wins_needed:
+                played = maps_num
+                break
+        scenarios.add(results[:played])
+
+    wins = np.zeros((len(scenarios), best_of), dtype=bool)
+    played = np.zeros((len(scenarios), best_of), dtype=bool)
+    for index, results in enumerate(sorted(scenarios, reverse=True)):
+        wins[index, :len(results)] = results
+        played[index, :len(results)] = True
+    return wins, played
+
+
+def match_scenarios(match: dict):
+    # A match with 'wins' is one known scenario, otherwise every scenario of a best_of (all listed maps by
+    # default) with the first team winning map i with 'map_probabilities'[i], or with the same chance
+    # for every map taken from the series 'coefficients'
+    if 'wins' in match:
+        wins = np.array([match['wins']], dtype=bool)
+        return wins, np.ones_like(wins), np.ones(1)
+
+    wins, played = series_scenarios(match.get('best_of', len(match['maps'])))
+    if 'map_probabilities' in match:
+        probabilities = np.array(match['map_probabilities'], dtype=np.float64)[:wins.shape[1]]
+    else:
+        series = {'probabilities': odds_probabilities(match['coefficients']), 'best_of': wins.shape[1]}
+        probabilities = np.full(wins.shape[1], map_win_probability(series))
+    return wins, played, np.where(played, np.where(wins, probabilities, 1 - probabilities), 1.0).prod(axis=1)
+
+
+def map_points_cube(fantasy_points: dict, players: list, maps: list):
+    # cube[player, map, 0 / 1] - mean points per win / lose on the map, the player's overall means for
+    # maps they have not played
+    cube = np.zeros((len(players), len(maps), 2))
+    for player_index, player_name in enumerate(players):
+        player_info = fantasy_points[player_name]
+        for map_index, map_name in enumerate(maps):
+            map_info = player_info['maps'].get(map_name, player_info)
+            cube[player_index, map_index] = map_info['mean points per win'], map_info['mean points per lose']
+    return cube
+
+
+def predict_slate(fantasy_points: dict, pro_players: dict, matches: list, rosters: dict = None) -> dict:
+    # Expected points (mean over the played maps of a match, as day points are) and their variance over
+    # the map outcomes of every match of the slate. All (player, scenario) pairs of all matches are scored
+    # at once, 'points' / 'variance' / 'std' can be the sort_key of the lineup search.
+    rosters = team_rosters(pro_players) if rosters is None else rosters
+    maps = sorted({map_name for match in matches for map_name in match['maps']})
+    map_indices = {map_name: index for index, map_name in enumerate(maps)}
+    slots = max(len(match['maps']) for match in matches)
+
+    players, player_matches, player_sides = [], [], []
+    scenario_wins, scenario_played, scenario_probabilities, scenario_maps, scenario_matches = [], [], [], [], []
+    for match_index, match in enumerate(matches):
+        for side, team_name in enumerate([match['team1_name'], match['team2_name']]):
+            for player_name in rosters.get(team_name, []):
+                if player_name in fantasy_points:
+                    players.append(player_name)
+                    player_matches.append(match_index)
+                    player_sides.append(side)
+
+        wins, played, probabilities = match_scenarios(match)
+        padding = ((0, 0), (0, slots - wins.shape[1]))
+        scenario_wins.append(np.pad(wins, padding))
+        scenario_played.append(np.pad(played, padding))
+        scenario_probabilities.append(probabilities)
+        scenario_maps.append(np.tile(np.pad([map_indices[map_name] for map_name in match['maps']][:wins.shape[1]], (0, slots - wins.shape[1])), (len(wins), 1)))
+        scenario_matches.append(np.full(len(wins), match_index))
+
+    scenario_wins = np.concatenate(scenario_wins)
+    scenario_played = np.concatenate(scenario_played)
+    scenario_probabilities = np.concatenate(scenario_probabilities)
+    scenario_maps = np.concatenate(scenario_maps)
+    scenario_matches = np.concatenate(scenario_matches)
+    player_matches = np.array(player_matches, dtype=np.int64)
+    player_sides = np.array(player_sides, dtype=np.int64)
+
+    # every player against every scenario of their match
+    match_scenario_counts = np.bincount(scenario_matches, minlength=len(matches))
+    match_scenario_starts = np.cumsum(match_scenario_counts) - match_scenario_counts
+    player_counts = match_scenario_counts[player_matches]
+    pair_players = np.repeat(np.arange(len(players)), player_counts)
+    pair_scenarios = np.repeat(match_scenario_starts[player_matches] - np.cumsum(player_counts) + player_counts, player_counts) + np.arange(player_counts.sum())
+
+    cube = map_points_cube(fantasy_points, players, maps)
+    won = scenario_wins[pair_scenarios] != (player_sides[pair_players, None] == 1)
+    played = scenario_played[pair_scenarios]
+    map_points = cube[pair_players[:, None], scenario_maps[pair_scenarios], np.where(won, 0, 1)]
+    points = np.where(played, map_points, 0.0).sum(axis=1) / played.sum(axis=1)
+    probabilities = scenario_probabilities[pair_scenarios]
+    means = np.bincount(pair_players, weights=probabilities * points, minlength=len(players))
+    variances = np.bincount(pair_players, weights=probabilities * (points - means[pair_players]) ** 2, minlength=len(players))
+
+    # a team playing twice a day adds up both matches, the matches are independent
+    result_points = {'rifler': {}, 'sniper': {}}
+    for player_index, player_name in enumerate(players):
+        player_info = result_points[pro_players[player_name]['role']].setdefault(player_name, {'team': pro_players[player_name]['team'], 'points': 0.0, 'variance': 0.0})
+        player_info['points'] += means[player_index]
+        player_info['variance'] += variances[player_index]
+        player_info['std'] = math.sqrt(player_info['variance'])
+    return result_points
+
+
+def print_maps_prediction(teams: list, matches: list, stages: list, simulations: int = 1_000_000) -> dict:
+    # teams in seeding order, matches with coefficients rate the teams, stages as in simulator.py
+    prediction = simulate_from_odds(teams, matches, stages, simulations)
+    for team in sorted(teams, key=lambda x: prediction['expected maps'][x], reverse=True):
+        places = ' '.join(f'{place * 100:.0f}%' for place in prediction['places'][team])
+        print(f'{team}: {prediction['expected maps'][team]:.2f} maps, places: {places}')
+    return prediction
 
 
 def print_predict(fantasy_points: dict, pro_players: dict, matches: list, balance: int):
     print('')
-    result_points = {'rifler': {}, 'sniper': {}}
+    result_points = predict_slate(fantasy_points, pro_players, matches)
     for match in matches:
-        team1_players = [player_name for player_name, player_info in pro_players.items() if player_info['team'] == match['team1_name']]
-        calculate_predict_points_for_map(result_points, pro_players, team1_players, fantasy_points, match, 'mean points per win', 'mean points per lose')
-        team2_players = [player_name for player_name, player_info in pro_players.items() if player_info['team'] == match['team2_name']]
-        calculate_predict_points_for_map(result_points, pro_players, team2_players, fantasy_points, match, 'mean points per lose', 'mean points per win')
-
-        for map_index, map_result in enumerate(match['wins']):
-            map_name = match['maps'][map_index]
-            print(f'{map_name} - {match['team1_name'] if map_result else match['team2_name']} won')
+        if 'wins' in match:
+            for map_index, map_result in enumerate(match['wins']):
+                map_name = match['maps'][map_index]
+                print(f'{map_name} - {match['team1_name'] if map_result else match['team2_name']} won')
+        else:
+            print(f'{match['team1_name']} - {match['team2_name']}: {', '.join(match['maps'])}')
 
     print('')
     dream_teams_rating, teams_rating = generate_teams(result_points, pro_players, 20, balance, 'points')
@@ -682,71 +858,178 @@ def print_predict(fantasy_points: dict, pro_players: dict, matches: list, balanc
         print(role)
         role_info = dict(sorted(role_info.items(), key=lambda x: x[1]['points'], reverse=True))
         for player_name, player_info in role_info.items():
-            print(f'{player_name} {player_info['points']:.3f}')
+            print(f'{player_name} {player_info['points']:.3f} ± {player_info['std']:.3f}')
         print('')
 
     for team in teams_rating:
         print(f'{team['sniper']}\t{team['rifler1']}\t{team['rifler2']}\t{team['rifler3']}\t{team['rifler4']}\t{team['cost']}\t{team['points']:.3f}')
 
 
+def load_query_events(events: list, loaded: dict = None, reload_events: tuple = ()) -> dict:
+    # {event name: {'digest', 'points'}} with the per-map points of every event, an event whose cache did
+    # not change since it was loaded is kept as it is, reload_events are fetched from HLTV again
+    loaded = loaded or {}
+    query_events = {}
+    for event_name, event_id in events:
+        if event_name in reload_events:
+            get_event_data(event_id, True)
+        digest = inputs_hash([f'parsed_data/event_{event_id}_statistic.json'])
+        if event_name in loaded and loaded[event_name]['digest'] == digest:
+            query_events[event_name] = loaded[event_name]
+        else:
+            query_events[event_name] = {'digest': digest, 'points': compute_overall_fantasy_points(get_event_data(event_id, False))}
+    return query_events
+
+
+def query_window(data: dict, pro_players: dict, params: dict) -> dict:
+    # Overall points of events=name,name,... or of the last=N events (all events by default), merged once
+    # per data version
+    event_names = list(data['events'])
+    if 'events' in params:
+        event_names = params['events'].split(',')
+    elif 'last' in params:
+        event_names = event_names[-int(params['last']):]
+
+    window = tuple(event_names)
+    if window not in data['windows']:
+        fantasy_points = copy.deepcopy(merge_overalls([data['events'][event_name]['points'] for event_name in event_names]))
+        for player_name, player_info in fantasy_points.items():
+            if player_name in pro_players:
+                player_info['role'] = pro_players[player_name]['role']
+                player_info['cost'] = pro_players[player_name]['cost']
+        postproc_overall_fantasy_points(fantasy_points)
+        postproc_rating_intervals(fantasy_points, pro_players)
+        data['windows'][window] = fantasy_points
+    return data['windows'][window]
+
+
+def query_routes(state: dict, pro_players: dict) -> dict:
+    # state['data'] is replaced as a whole by a refresh, a query works on the data it started with
+    def players(params):
+        return query_records(overall_players_table(query_window(state['data'], pro_players, params)), params, ['name', 'team', 'role'], 'mean points')
+
+    def maps(params):
+        return query_records(overall_maps_table(query_window(state['data'], pro_players, params)), params, ['name', 'team', 'map'])
+
+    def lineups(params):
+        fantasy_points = query_window(state['data'], pro_players, params)
+        fantasy_points_by_role = {'rifler': {}, 'sniper': {}}
+        for player_name, player_info in fantasy_points.items():
+            if player_name in pro_players:
+                fantasy_points_by_role[pro_players[player_name]['role']][player_name] = player_info
+        sort_key = params.get('sort', 'mean points')
+        # balance=100,110,120 answers every balance from one search, the teams are then {balance: teams}
+        balances = [int(balance) for balance in params.get('balance', '100').split(',')]
+        if len(balances) > 1:
+            dream_teams, teams_by_balance = generate_teams_for_balances(fantasy_points_by_role, pro_players, int(params.get('count', 10)), balances, sort_key, query_constraints(pro_players, params))
+            return {'teams': {str(balance): teams for balance, teams in teams_by_balance.items()}, 'dream teams': dream_teams}
+        dream_teams, teams = generate_teams(fantasy_points_by_role, pro_players, int(params.get('count', 10)), balances[0], sort_key, query_constraints(pro_players, params))
+        return {'teams': teams, 'dream teams': dream_teams}
+
+    def balances(params):
+        balances = [int(balance) for balance in params['balances'].split(',')] if 'balances' in params else list(range(100, 200, 5))
+        snipers_names = [player_name for player_name, player_data in pro_players.items() if player_data['role'] == 'sniper']
+        riflers_names = [player_name for player_name, player_data in pro_players.items() if player_data['role'] == 'rifler']
+        teams_counts = count_lineups_by_balance(get_cost_groups(pro_players, riflers_names, snipers_names), balances)
+        return {'teams count': math.comb(len(riflers_names), 4) * len(snipers_names), 'balances': {str(balance): teams_counts[balance] for balance in balances}}
+
+    def events(params):
+        return [{'name': event_name, 'maps': len({map_id for player_info in event['points'].values() for map_id in player_info['map ids']})} for event_name, event in state['data']['events'].items()]
+
+    return {'players': players, 'maps': maps, 'lineups': lineups, 'balances': balances, 'events': events}
+
+
+def serve_queries(pro_players_file: str = 'pro_players_day.json', events: list = None, port: int = 8000, refresh_interval: float = None, cache_size: int = 256):
+    # Resident query service over the event caches (see service.py), for example
+    #   /players?last=9&role=sniper&sort=mean points per win&limit=20
+    #   /maps?name=ZywOo&map=Nuke
+    #   /lineups?events=iem-cologne-2024-play-in,iem-cologne-2024&balance=110&max_per_team=2&exclude=s1mple
+    #   /lineups?balance=100,110,120
+    #   /balances?balances=100,105,110
+    #   /refresh?reload=iem-cologne-2024 (fetches the event again, without reload only changed caches)
+    events = events or [(event['name'], event['id']) for event in load_reports()['events']]
+    pro_players = get_pro_players(pro_players_file)
+    state = {'data': {'events': load_query_events(events), 'windows': {}}}
+
+    def refresh(params):
+        reload_events = params['reload'].split(',') if params.get('reload') else []
+        query_events = load_query_events(events, state['data']['events'], reload_events)
+        if all(query_events[event_name] is state['data']['events'][event_name] for event_name in query_events):
+            return False
+        state['data'] = {'events': query_events, 'windows': {}}
+        return True
+
+    serve(query_service(query_routes(state, pro_players), refresh, cache_size), port=port, refresh_interval=refresh_interval)
+
+
+def load_reports(config_path: str = 'reports.json') -> dict:
+    # The events, merged windows and prediction main() builds, see reports.json
+    with open(config_path, 'r', encoding='utf8') as file:
+        return json.load(file)
+
+
+def window_event_names(reports: dict, window: dict) -> list:
+    # events: names of the events of the window, last: the last N events, all events by default
+    event_names = [event['name'] for event in reports['events']]
+    if 'events' in window:
+        return window['events']
+    if 'last' in window:
+        return event_names[-window['last']:]
+    return event_names
+
+
+def fetch_event(event_id: int, reload: bool):
+    get_event_data(event_id, reload)
+
+
+def report_event(event: dict, pro_players_file: str, *fetched) -> dict:
+    return dump_event(event['name'], event['id'], False, get_pro_players(pro_players_file), event.get('balance', 100), event.get('re_dump', False), event.get('dump_days', False), event.get('last_day_only', False))
+
+
+def report_window(window: dict, *overalls) -> dict:
+    # balance may be a list, every balance then gets its top teams sheet from one search (see dump_teams_rating_to_excel)
+    return dump_merged_overalls(window['name'], list(overalls), get_pro_players(window.get('pro_players', 'pro_players.json')), window.get('balance', 0))
+
+
+def report_tasks(reports: dict) -> dict:
+    # fetch:<event> (only for events to reload or not cached yet) -> event:<event> (scoring and the event
+    # workbooks) -> window:<window> (merged overalls), workbooks up to date are not written (manifest.py)
+    tasks = {}
+    pro_players_file = reports.get('pro_players', 'pro_players.json')
+    for event in reports['events']:
+        deps = []
+        if event.get('reload', False) or not os.path.exists(f'parsed_data/event_{event['id']}_statistic.json'):
+            deps.append(f'fetch:{event['name']}')
+            tasks[deps[0]] = task(fetch_event, event['id'], event.get('reload', False), pool='thread')
+        tasks[f'event:{event['name']}'] = task(report_event, event, pro_players_file, deps=deps)
+
+    for window in reports.get('windows', []):
+        tasks[f'window:{window['name']}'] = task(report_window, window, deps=[f'event:{event_name}' for event_name in window_event_names(reports, window)])
+    return tasks
+
+
 def main():
-    pro_players = get_pro_players('pro_players.json')
-
-    overalls = [
-        dump_event('betboom-dacha-2023', 7499, False, pro_players),  # Dec 5th - Dec 10th 2023
-        dump_event('pgl-cs2-major-copenhagen-2024-na-rmr-closed-qualifier', 7409, False, pro_players),  # Jan 12th - Jan 14th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-europe-rmr-closed-qualifier-a', 7392, False, pro_players),  # Jan 18th - Jan 20th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-europe-rmr-closed-qualifier-b', 7619, False, pro_players),  # Jan 18th - Jan 20th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-east-asia-rmr-closed-qualifier', 7399, False, pro_players),  # Jan 19th - Jan 21st 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-sa-rmr-closed-qualifier', 7410, False, pro_players),  # Jan 19th - Jan 21st 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-europe-rmr-decider-qualifier', 7391, False, pro_players),  # Jan 21st 2024
-        dump_event('blast-premier-spring-groups-2024', 7552, False, pro_players),  # Jan 22nd - Jan 28th 2024
-        dump_event('iem-katowice-2024-play-in', 7551, False, pro_players),  # Jan 31st - Feb 2nd 2024
-        dump_event('iem-katowice-2024', 7435, False, pro_players),  # Feb 3rd - Feb 11th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-europe-rmr-a', 7259, False, pro_players),  # Feb 14th - Feb 17th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-europe-rmr-b', 7577, False, pro_players),  # Feb 19th - Feb 22nd 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-asia-rmr', 7260, False, pro_players),  # Feb 26th - Feb 28th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-americas-rmr', 7261, False, pro_players),  # Mar 1st - Mar 4th 2024
-        dump_event('blast-premier-spring-showdown-2024', 7553, False, pro_players),  # Mar 6th - Mar 10th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024-opening-stage', 7258, False, pro_players),  # Mar 17th - Mar 20th 2024
-        dump_event('pgl-cs2-major-copenhagen-2024', 7148, False, pro_players),  # Mar 21st - Mar 31st 2024
-        dump_event('betboom-dacha-belgrade-2024-south-america-closed-qualifier', 7771, False, pro_players),  # Apr 4th - Apr 11th 2024
-        dump_event('betboom-dacha-belgrade-2024-europe-closed-qualifier', 7757, False, pro_players),  # Apr 2nd - Apr 12th 2024
-        dump_event('iem-chengdu-2024', 7437, False, pro_players),  # Apr 8th - Apr 14th 2024
-        dump_event('skyesports-masters-2024', 7711, False, pro_players),  # Apr 8th - Apr 14th 2024
-        dump_event('global-esports-tour-rio-2024', 7742, False, pro_players),  # Apr 18th - Apr 20th 2024
-        dump_event('esl-challenger-melbourne-2024', 7600, False, pro_players),  # Apr 26th - Apr 28th 2024
-        dump_event('cct-season-2-europe-series-1', 7781, False, pro_players),  # Apr 21st - May 4th 2024
-        dump_event('cct-season-2-europe-series-2', 7795, False, pro_players),  # Apr 29th - May 12th 2024
-        dump_event('esl-pro-league-season-19', 7440, False, pro_players),  # Apr 23rd - May 12th 2024
-        dump_event('betboom-dacha-belgrade-2024', 7755, False, pro_players),  # May 14th - May 19th 2024
-        dump_event('iem-dallas-2024', 7438, False, pro_players),  # May 27th - Jun 2nd 2024
-        dump_event('blast-premier-spring-final-2024', 7485, False, pro_players),  # Jun 12th - Jun 16th 2024
-
-        dump_event('cct-season-2-europe-series-6', 7899, False, pro_players),  # Jul 15th - Jul 28th 2024
-        dump_event('cct-season-2-south-america-series-2', 7948, False, pro_players),  # Jul 15th - Aug 2nd 2024
-        dump_event('esports-world-cup-2024', 7732, False, pro_players),  # Jul 17th - Jul 21st 2024
-        dump_event('skyesports-championship-2024', 7847, False, pro_players),  # Jul 23rd - Jul 28th 2024
-        dump_event('betboom-dacha-belgrade-season-2-south-america-closed-qualifier', 7994, False, pro_players),  # Jul 28th - Aug 3rd 2024
-        dump_event('betboom-dacha-belgrade-season-2-europe-closed-qualifier', 7992, False, pro_players),  # Jul 28th - Aug 5th 2024
-        dump_event('blast-premier-fall-groups-2024', 7554, False, pro_players),  # Jul 29th - Aug 4th 2024
-        dump_event('iem-cologne-2024-play-in', 7675, False, pro_players),  # Aug 7th - Aug 9th 2024
-        dump_event('iem-cologne-2024', 7436, True, pro_players, 110, True, True, True)  # Aug 10th - Aug 18th 2024
-    ]
-
-    overall_fantasy_points = dump_merged_overalls('overall', overalls, pro_players, 0)
-    dump_merged_overalls('overall_post_july', overalls[-9:], pro_players, 0)
-    dump_merged_overalls('overall_cologne', overalls[-2:], pro_players, 0)
-
-    next_day_balance = 110
-    pro_players_day = get_pro_players('pro_players_day.json')
-    dump_merged_overalls('day_overall', overalls, pro_players_day, next_day_balance)
-    dump_merged_overalls('day_overall_post_july', overalls[-9:], pro_players_day, next_day_balance)
-    dump_merged_overalls('day_overall_cologne', overalls[-2:], pro_players_day, next_day_balance)
-    matches = [
-        {'team1_name': 'Vitality', 'team2_name': 'NAVI', 'maps': ['Nuke', 'Dust2', 'Mirage', 'Inferno'], 'wins': [True, False, True, True]}
-    ]
-    print_predict(overall_fantasy_points, pro_players, matches, 110)
+    parser = argparse.ArgumentParser(description='Builds the reports of a reports file: events are fetched, scored and dumped in parallel, merged windows as soon as their events are done.')
+    parser.add_argument('config', nargs='?', default='reports.json')
+    parser.add_argument('--workers', type=int, default=None, help='processes for scoring and reports, all cores by default')
+    parser.add_argument('--threads', type=int, default=8, help='threads for fetching')
+    parser.add_argument('--only', nargs='+', help='tasks to run (event:<name>, window:<name>) with the tasks they depend on')
+    args = parser.parse_args()
+
+    reports = load_reports(args.config)
+    tasks = report_tasks(reports)
+    if args.only:
+        unknown = [name for name in args.only if name not in tasks]
+        if unknown:
+            parser.error(f'unknown tasks: {", ".join(unknown)}')
+        tasks = required_tasks(tasks, args.only)
+
+    results = run_tasks(tasks, args.workers, args.threads)
+
+    predict = reports.get('predict')
+    if predict and f'window:{predict['window']}' in results:
+        print_predict(results[f'window:{predict['window']}'], get_pro_players(reports.get('pro_players', 'pro_players.json')), predict['matches'], predict['balance'])
+
 
 if __name__ == '__main__':
     main()
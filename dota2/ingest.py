@@ -0,0 +1,242 @@
+import concurrent.futures
+import gzip
+import json
+import os
+from pathlib import Path
+
+OPENDOTA_URL = 'https://api.opendota.com/api'
+STRATZ_URL = 'https://api.stratz.com/api/v1'
+
+stratz_token = ''
+keep_raw = False
+remove_legacy = False
+hedge_delay = 5.0
+request_timeout = 60
+
+
+def set_teamfight_participation(players):
+    team_kills = {True: 0, False: 0}
+    for player in players:
+        team_kills[player['isRadiant']] += player['kills']
+
+    for player in players:
+        kills = team_kills[player['isRadiant']]
+        player['teamfight_participation'] = (player['kills'] + player['assists']) / kills if kills else 0
+
+
+def normalize_opendota(match_info):
+    players = []
+    for player in match_info.get('players') or []:
+        # Not parsed yet: the replay-only fields are still empty
+        if player.get('runes') is None or player.get('obs_placed') is None or player.get('teamfight_participation') is None:
+            return None
+
+        players.append({
+            'name': player['name'],
+            'account_id': player['account_id'],
+            'isRadiant': player['isRadiant'],
+            'kills': player['kills'],
+            'deaths': player['deaths'],
+            'assists': player['assists'],
+            'last_hits': player['lane_kills'] + player['neutral_kills'] + player['ancient_kills'],
+            'gold_per_min': player['gold_per_min'],
+            'runes': player['runes'],
+            'camps_stacked': player['camps_stacked'],
+            'obs_placed': player['obs_placed'],
+            'courier_kills': player['courier_kills'],
+            'towers_killed': player['towers_killed'],
+            'roshans_killed': player['roshans_killed'],
+            'teamfight_participation': player['teamfight_participation']
+        })
+
+    if not players:
+        return None
+
+    return {
+        'match_id': match_info['match_id'],
+        'source': 'opendota',
+        'radiant_win': match_info['radiant_win'],
+        'duration': match_info['duration'],
+        'players': players
+    }
+
+
+def normalize_stratz(match_info):
+    players = []
+    for player in match_info.get('players') or []:
+        stats = player.get('stats')
+        if not stats or not stats.get('campStackPerMin') or stats.get('farmDistributionReport') is None:
+            return None
+
+        # 0 double damage 1 haste 2 illusion 3 invisibility 4 shield 5 gold 6 magic 7 water 8 wisdom 9 regen
+        runes = {}
+        for rune in stats['runeEvents']:
+            runes[rune['type']] = runes.get(rune['type'], 0) + 1
+
+        players.append({
+            'name': player['steamAccount']['proSteamAccount']['name'] if player['steamAccount'].get('proSteamAccount') else None,
+            'account_id': player['steamAccount']['id'],
+            'isRadiant': player['isRadiant'],
+            'kills': player['numKills'],
+            'deaths': player['numDeaths'],
+            'assists': player['numAssists'],
+            'last_hits': player['numLastHits'],
+            'gold_per_min': player['goldPerMinute'],
+            'runes': runes,
+            'camps_stacked': stats['campStackPerMin'][-1],
+            'obs_placed': sum(1 for ward in stats['wardPlaced'] if ward['type'] == 0),
+            'courier_kills': len(stats['courierKills']),
+            'towers_killed': next((x['count'] for x in stats['farmDistributionReport']['buildings'] if x['id'] == 0), 0),
+            'roshans_killed': next((x['count'] for x in stats['farmDistributionReport']['creepType'] if x['id'] == 133), 0)
+        })
+
+    if not players:
+        return None
+
+    set_teamfight_participation(players)
+
+    return {
+        'match_id': match_info['id'],
+        'source': 'stratz',
+        'radiant_win': match_info['didRadiantWin'],
+        'duration': match_info['durationSeconds'],
+        'players': players
+    }
+
+
+def normalize_cached(match_info):
+    players = match_info.get('players') or []
+    if not players:
+        return None
+
+    if 'stats' in players[0]:
+        return normalize_stratz(match_info)
+
+    if 'lane_kills' in players[0]:
+        return normalize_opendota(match_info)
+
+    # Compact Stratz record written before the shared format
+    if 'teamfight_participation' not in players[0]:
+        set_teamfight_participation(players)
+
+    return {
+        'match_id': match_info.get('match_id', match_info.get('id')),
+        'source': match_info.get('source', 'stratz'),
+        'radiant_win': match_info.get('radiant_win', match_info.get('didRadiantWin')),
+        'duration': match_info.get('duration', match_info.get('durationSeconds')),
+        'players': players
+    }
+
+
+def save_raw_match_info(cache_path, source, match_id, match_info):
+    Path(f'{cache_path}/raw').mkdir(parents=True, exist_ok=True)
+    with gzip.open(f'{cache_path}/raw/{source}_{match_id}.json.gz', 'wt', encoding='utf8') as file:
+        json.dump(match_info, file)
+
+
+def fetch_opendota(match_id, cache_path):
+    # requests is imported by the fetchers only, runs over cached matches never load it
+    import requests
+
+    r = requests.get(f'{OPENDOTA_URL}/matches/{match_id}', timeout=request_timeout)
+    match_info = r.json()
+    if keep_raw:
+        save_raw_match_info(cache_path, 'opendota', match_id, match_info)
+
+    return normalize_opendota(match_info)
+
+
+def fetch_stratz(match_id, cache_path):
+    import requests
+
+    r = requests.get(f'{STRATZ_URL}/match/{match_id}', headers={'Authorization': f'Bearer {stratz_token}'}, timeout=request_timeout)
+    match_info = r.json()
+    if keep_raw:
+        save_raw_match_info(cache_path, 'stratz', match_id, match_info)
+
+    return normalize_stratz(match_info)
+
+
+fetchers = {
+    'opendota': fetch_opendota,
+    'stratz': fetch_stratz
+}
+
+
+def fetch_match_record(match_id, sources, cache_path):
+    # The next source is asked as soon as the previous one is slower than hedge_delay or answers with
+    # an unparsed match, the first complete record wins
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(sources))
+    try:
+        pending = {executor.submit(fetchers[sources[0]], match_id, cache_path): sources[0]}
+        next_source = 1
+        while pending:
+            timeout = hedge_delay if next_source < len(sources) else None
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            hedge = not done
+            for future in done:
+                source = pending.pop(future)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    print(f'Error: {e}')
+                    print(f'Match {match_id}: {source} request failed.')
+                    record = None
+
+                if record is not None:
+                    return record
+
+                hedge = True
+
+            if hedge and next_source < len(sources):
+                pending[executor.submit(fetchers[sources[next_source]], match_id, cache_path)] = sources[next_source]
+                next_source += 1
+
+        return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def default_sources():
+    return ['opendota', 'stratz'] if stratz_token else ['opendota']
+
+
+def save_match_record(cache_path, match_id, record):
+    Path(f'{cache_path}/records').mkdir(parents=True, exist_ok=True)
+    with open(f'{cache_path}/records/{match_id}.json', 'w', encoding='utf8') as file:
+        json.dump(record, file, separators=(',', ':'))
+
+
+def get_match_record(match_id, reload_data, sources=None, cache_path='parsed_data'):
+    if sources is None:
+        sources = default_sources()
+
+    record_path = f'{cache_path}/records/{match_id}.json'
+    if os.path.exists(record_path):
+        with open(record_path, 'r', encoding='utf8') as file:
+            return json.load(file)
+
+    # Full payload cached before records existed: reduce it once to a record. The payload stays where it
+    # is unless remove_legacy is set, and is removed only once its record is written.
+    legacy_path = f'{cache_path}/{match_id}.json'
+    if os.path.exists(legacy_path):
+        with open(legacy_path, 'r', encoding='utf8') as file:
+            match_info = json.load(file)
+
+        record = normalize_cached(match_info)
+        if record is not None:
+            save_match_record(cache_path, match_id, record)
+            if keep_raw:
+                save_raw_match_info(cache_path, record['source'], match_id, match_info)
+            if remove_legacy:
+                os.remove(legacy_path)
+            return record
+
+    if not reload_data:
+        raise FileNotFoundError(f'Match {match_id} is not cached')
+
+    record = fetch_match_record(match_id, sources, cache_path)
+    if record is not None:
+        save_match_record(cache_path, match_id, record)
+
+    return record
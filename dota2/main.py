@@ -1,17 +1,36 @@
-import os
 from pathlib import Path
+import argparse
+import copy
 import json
-import requests
+import math
+import os
+import sys
+import time
 import numpy as np
-import pandas as pd
-from styleframe import StyleFrame, Styler, utils
 
 import itertools
 
+import ingest
+from standings import placement_probabilities, standings_distribution, tie_probabilities
+
+# the modules both games share are in the shared package next to the game directories
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared import manifest
+from shared.columnar import columnar_outputs, lineups_table, write_columnar_tables
+from shared.excel import descending_order, sheet_table, write_sheet, write_workbook, write_workbooks
+from shared.manifest import inputs_hash, outdated, record_outputs
+from shared.ratings import rating_intervals
+from shared.scheduler import required_tasks, run_tasks, task
+from shared.service import query_constraints, query_records, query_service, serve
+from shared.simulator import odds_probabilities, simulate_from_odds
+from shared.lineups import count_lineups_by_balance, lineup_portfolio, lineups_above, top_lineups_for_balances, top_lineups_parallel
+
 
 def get_matches(tournament_id, reload_data):
     if reload_data:
         # Retrieve matches data from the API
+        import requests
+
         url = f'https://api.opendota.com/api/leagues/{tournament_id}/matches'
         response = requests.get(url)
         matches = {'matches': response.json()}
@@ -30,23 +49,6 @@ def get_matches(tournament_id, reload_data):
     return matches
 
 
-def get_match_info(match_id, reload_data):
-    if reload_data and not os.path.exists(f'parsed_data/{match_id}.json'):
-        # Retrieve match information from the API
-        r = requests.get(f'https://api.opendota.com/api/matches/{match_id}')
-        match_info = r.json()
-
-        # Save match information in a JSON file
-        with open(f'parsed_data/{match_id}.json', 'w', encoding='utf8') as file:
-            json.dump(match_info, file, indent=2)
-
-        return match_info
-    else:
-        # Load match information from the existing JSON file
-        with open(f'parsed_data/{match_id}.json', 'r', encoding='utf8') as file:
-            return json.load(file)
-
-
 def get_pro_players(file_name: str):
     with open(file_name, 'r', encoding='utf8') as file:
         return json.load(file)
@@ -59,6 +61,7 @@ def create_fantasy_points_template(pro_players):
         if 'save_as' in pro_players[player_name]:
             player_name = pro_players[player_name]['save_as']
         fantasy_points[role][player_name] = {
+            'match ids': [],
             'durations': [],
             'wins': [],
             'wins count': 0,
@@ -83,6 +86,10 @@ def calculate_series_counts(matches):
     return series_counts
 
 
+# the scoring rules of the game are part of the code the manifest hashes cover
+manifest.code_paths.append(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_PATH = 'dota2_fantasy/manifest.json'
+
 printed_id = {}
 printed_names = {}
 
@@ -106,11 +113,15 @@ def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0,
             continue
 
         try:
-            match_info = get_match_info(match_id, reload_data)
+            match_info = ingest.get_match_record(match_id, reload_data)
         except Exception as e:
             print(f"Error: {e}")
             print(f"Match {match_id} has no saved data.")
         else:
+            if match_info is None:
+                print(f"Match {match_id} is not ready.")
+                continue
+
             try:
                 for player in match_info['players']:
                     # 0 double damage 1 haste 2 illusion 3 invisibility 4 shield 5 gold 6 magic 7 water 8 wisdom 9 regen
@@ -124,7 +135,7 @@ def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0,
                         'runes': runes_count * 1.25,
                         'camps_stacked': player['camps_stacked'] * 1.5,
                         'obs_placed': player['obs_placed'] * 1.5,
-                        'last_hits': (player['lane_kills'] + player['neutral_kills'] + player['ancient_kills']) * 0.015,
+                        'last_hits': player['last_hits'] * 0.015,
                         'courier_kills': player['courier_kills'] * 2,
                         'towers_killed': player['towers_killed'] * 2.5,
                         'roshans_killed': player['roshans_killed'] * 5,
@@ -158,6 +169,7 @@ def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0,
                     if 'save_as' in pro_players[player_name]:
                         player_name = pro_players[player_name]['save_as']
                     player_info = fantasy_points[role][player_name]
+                    player_info['match ids'].append(match_id)
                     player_info['durations'].append(match['duration'])
                     is_win = match['radiant_win'] == player['isRadiant']
                     player_info['wins'].append(is_win)
@@ -178,7 +190,6 @@ def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0,
             except Exception as e:
                 print(f"Error: {e}")
                 print(f"Match {match_id} is not ready.")
-                os.remove(f"parsed_data/{match_id}.json")
 
     for role in ['carry', 'mid', 'offlane', 'support']:
         fantasy_points[role] = {k: v for k, v in fantasy_points[role].items() if len(v) > 0}
@@ -213,6 +224,14 @@ def post_calculate_points(fantasy_points, pro_players):
             player_info['match count'] = len(player_info['fantasy points'])
 
 
+def postproc_rating_intervals(fantasy_points, resamples=1000, confidence=0.9, seed=0):
+    # Bootstrap intervals and shrunk estimates (see ratings.py) of the mean points per match, per win and
+    # per lose for the overall sheets, shrunk toward the role mean
+    players = {player_name: player_info for role in ['carry', 'mid', 'offlane', 'support'] for player_name, player_info in fantasy_points[role].items()}
+    groups = {player_name: role for role in ['carry', 'mid', 'offlane', 'support'] for player_name in fantasy_points[role]}
+    rating_intervals(players, groups, ['mean points per match', 'mean points per win', 'mean points per lose'], resamples, confidence, seed)
+
+
 def dump_points_to_excel(writer, fantasy_points, pro_players, sorting_key):
     for role in ['carry', 'mid', 'offlane', 'support']:
         if len(fantasy_points[role]) == 0:
@@ -234,10 +253,7 @@ def dump_points_to_excel(writer, fantasy_points, pro_players, sorting_key):
             for column_name in details_columns:
                 row.append(player_info['points details sum'][column_name])
             data.append(row)
-        df = pd.DataFrame(data, columns=columns)
-        sf = StyleFrame(df)
-        sf.A_FACTOR = 4
-        sf.to_excel(writer, sheet_name=role, best_fit=columns)
+        write_sheet(writer, role, columns, data)
 
 
 def dump_captains_to_excel(writer, fantasy_points, pro_players):
@@ -248,10 +264,7 @@ def dump_captains_to_excel(writer, fantasy_points, pro_players):
     captains_info = sorted(captains_info, key=lambda x: x[3], reverse=True)
 
     columns = ['name', 'team', 'cost', 'points', 'role']
-    df = pd.DataFrame(captains_info, columns=columns)
-    sf = StyleFrame(df)
-    sf.A_FACTOR = 4
-    sf.to_excel(writer, sheet_name='captains rating', best_fit=columns)
+    write_sheet(writer, 'captains rating', columns, captains_info)
 
 
 def calculate_team_points(players_points, pro_players, players_names, captain_name):
@@ -270,56 +283,66 @@ def calculate_team_points(players_points, pro_players, players_names, captain_na
     return team_info
 
 
-def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count, balance):
-    teams_rating = []
-
-    pos4_names = list(fantasy_points['support'])
-    for pos1 in fantasy_points['carry']:
-        for pos2 in fantasy_points['mid']:
-            for pos3 in fantasy_points['offlane']:
-                for pos4_index, pos4 in enumerate(pos4_names):
-                    for pos5_index in range(pos4_index + 1, len(pos4_names)):
-                        pos5 = pos4_names[pos5_index]
-                        players_names = [pos1, pos2, pos3, pos4, pos5]
-                        players_points = [fantasy_points['carry'][pos1]['total points'], fantasy_points['mid'][pos2]['total points'],
-                                          fantasy_points['offlane'][pos3]['total points'], fantasy_points['support'][pos4]['total points'],
-                                          fantasy_points['support'][pos5]['total points']]
-                        for captain_name in players_names:
-                            team_info = calculate_team_points(players_points, pro_players, players_names, captain_name)
-                            teams_rating.append(team_info)
-
-    teams_rating = sorted(teams_rating, key=lambda x: x['points'], reverse=True)
+def get_lineup_groups(fantasy_points, pro_players):
+    groups = []
+    for role, size in [('carry', 1), ('mid', 1), ('offlane', 1), ('support', 2)]:
+        candidates = [(player_name, player_info['total points'], pro_players[player_name]['cost']) for player_name, player_info in fantasy_points[role].items()]
+        groups.append((candidates, size))
+    return groups
+
+
+def lineups_to_teams(lineups, pro_players):
+    return [calculate_team_points(players_points, pro_players, names, names[captain_index]) for _, _, names, players_points, captain_index in lineups]
+
+
+def generate_teams(fantasy_points, pro_players, count, balance, constraints=None):
+    dream_lineups, lineups = top_lineups_parallel(get_lineup_groups(fantasy_points, pro_players), count, balance, constraints=constraints)
+    return lineups_to_teams(dream_lineups, pro_players), lineups_to_teams(lineups, pro_players)
+
+
+def generate_teams_for_balances(fantasy_points, pro_players, count, balances, constraints=None):
+    dream_lineups, lineups_by_balance = top_lineups_for_balances(get_lineup_groups(fantasy_points, pro_players), count, balances, constraints=constraints)
+    return lineups_to_teams(dream_lineups, pro_players), {balance: lineups_to_teams(lineups, pro_players) for balance, lineups in lineups_by_balance.items()}
+
+
+def generate_teams_above(fantasy_points, pro_players, min_points, balance):
+    # Every lineup (with its best captain) scoring at least min_points, without top-K pruning
+    return lineups_to_teams(lineups_above(get_lineup_groups(fantasy_points, pro_players), min_points, balance), pro_players)
+
+
+def generate_portfolio(fantasy_points, pro_players, entries, max_overlap, balance, max_exposure=None, constraints=None):
+    # Multi-entry teams sharing at most max_overlap players with each other, best first
+    lineups = lineup_portfolio(get_lineup_groups(fantasy_points, pro_players), entries, max_overlap, balance, max_exposure, constraints=constraints)
+    return lineups_to_teams(lineups, pro_players)
+
+
+def dump_teams_to_excel(writer, teams_rating, columns, sheet_name):
+    data = [[team_info[column_name] for column_name in columns] for team_info in teams_rating]
+    write_sheet(writer, sheet_name, columns, data)
+
+
+def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count, balance, constraints=None):
+    # balance may be a list, then every balance gets its own top teams sheet from one lineup frontier,
+    # constraints is a lineups.lineup_constraints spec applied inside the search
+    if isinstance(balance, list):
+        dream_teams_rating, teams_rating_by_balance = generate_teams_for_balances(fantasy_points, pro_players, count, balance, constraints)
+    else:
+        dream_teams_rating, teams_rating = generate_teams(fantasy_points, pro_players, count, balance, constraints)
+        teams_rating_by_balance = {balance: teams_rating}
+    sheet_names = {team_balance: f'Top teams {team_balance}' for team_balance in balance} if isinstance(balance, list) else {balance: 'Top teams'}
+
     columns = ['carry', 'mid', 'offlane', 'support 1', 'support 2', 'cost', 'points']
-    top_teams_data = list()
-    for team_info in teams_rating:
-        if team_info['cost'] <= balance:
-            row = list()
-            for column_name in columns:
-                row.append(team_info[column_name])
-            top_teams_data.append(row)
-            if len(top_teams_data) == count:
-                break
-
-    if len(top_teams_data):
-        top_teams_df = pd.DataFrame(top_teams_data, columns=columns)
-        sf_top_teams_df = StyleFrame(top_teams_df)
-        sf_top_teams_df.A_FACTOR = 4
-        sf_top_teams_df.to_excel(writer, sheet_name='Top teams', best_fit=columns)
-
-    top_dream_teams_data = list()
-
-    for team_info in teams_rating:
-        row = list()
-        for column_name in columns:
-            row.append(team_info[column_name])
-        top_dream_teams_data.append(row)
-        if len(top_dream_teams_data) == count:
-            break
-
-    top_dream_teams_df = pd.DataFrame(top_dream_teams_data, columns=columns)
-    sf_top_dream_teams_df = StyleFrame(top_dream_teams_df)
-    sf_top_dream_teams_df.A_FACTOR = 4
-    sf_top_dream_teams_df.to_excel(writer, sheet_name='Top dream teams', best_fit=columns)
+    for team_balance, teams_rating in teams_rating_by_balance.items():
+        if len(teams_rating):
+            dump_teams_to_excel(writer, teams_rating, columns, sheet_names[team_balance])
+
+    dump_teams_to_excel(writer, dream_teams_rating, columns, 'Top dream teams')
+    return dream_teams_rating, teams_rating_by_balance
+
+
+def dump_portfolio_to_excel(writer, fantasy_points, pro_players, entries, max_overlap, balance, max_exposure=None, constraints=None):
+    teams_rating = generate_portfolio(fantasy_points, pro_players, entries, max_overlap, balance, max_exposure, constraints)
+    dump_teams_to_excel(writer, teams_rating, ['carry', 'mid', 'offlane', 'support 1', 'support 2', 'cost', 'points'], 'Portfolio')
 
 
 def dump_records(players_points, pro_players, players_names, captain_name):
@@ -338,78 +361,268 @@ def dump_records(players_points, pro_players, players_names, captain_name):
     return team_info
 
 
-def dump_day(path, tournament_id, pro_players, reload_data, min_bound, max_bound, sort_key, balance):
+def dump_day(path, tournament_id, pro_players, reload_data, min_bound, max_bound, sort_key, balance, constraints=None, workbooks=None, tables=None):
+    # workbooks ({path: sheets}) collects the workbook for write_workbooks, otherwise it is written here,
+    # tables ({path: (columns, rows)}) collects its typed tables for write_columnar_tables
     fantasy_points = compute_fantasy_points(tournament_id, pro_players, reload_data=reload_data, min_bound=min_bound, max_bound=max_bound)
     post_calculate_points(fantasy_points, pro_players)
-    with pd.ExcelWriter(path) as writer:
-        dump_points_to_excel(writer, fantasy_points, pro_players, sort_key)
-        dump_captains_to_excel(writer, fantasy_points, pro_players)
-        dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count=1000, balance=balance)
+    sheets = []
+    dump_points_to_excel(sheets, fantasy_points, pro_players, sort_key)
+    dump_captains_to_excel(sheets, fantasy_points, pro_players)
+    teams_ratings = dump_teams_rating_to_excel(sheets, fantasy_points, pro_players, count=1000, balance=balance, constraints=constraints)
+    if workbooks is None:
+        write_workbook(path, sheets)
+    else:
+        workbooks[path] = sheets
+    if tables is not None:
+        tables.update(zip(table_paths(path, DAY_TABLES), [day_players_table(fantasy_points, pro_players), lineups_table(*teams_ratings, LINEUP_POSITIONS)]))
+
+
+LINEUP_POSITIONS = ['carry', 'mid', 'offlane', 'support 1', 'support 2']
+DAY_TABLES = ['players', 'lineups']
+OVERALL_TABLES = ['players', 'matches']
+
+
+def table_paths(path, table_names):
+    # The typed tables of a workbook go next to it: day1.xlsx -> day1.players.parquet, ...
+    return [f'{os.path.splitext(path)[0]}.{table_name}' for table_name in table_names]
+
+
+def overall_table_paths(path, name_prefix):
+    # one set of tables for the overall workbooks, which differ only in the order of the rows
+    return [f'{path}/{name_prefix}overall.{table_name}' for table_name in OVERALL_TABLES]
+
+
+def day_players_table(fantasy_points, pro_players):
+    main_columns = ['total points', 'match count', 'mean points per match', 'mean points per win',
+                    'mean points per lose', 'mean per cost', 'mean duration', 'mean per duration']
+    details_columns = ['kills', 'runes', 'camps_stacked', 'obs_placed', 'last_hits', 'courier_kills',
+                       'towers_killed', 'roshans_killed', 'assists', 'teamfight_participation', 'gold_per_min',
+                       'deaths']
+    columns = [('name', 'string'), ('role', 'string'), ('team', 'string'), ('cost', 'int')]
+    columns += [(column_name, 'int' if column_name == 'match count' else 'float') for column_name in main_columns + details_columns]
+    rows = []
+    for role in ['carry', 'mid', 'offlane', 'support']:
+        for player_name, player_info in fantasy_points[role].items():
+            row = [player_name, role, pro_players[player_name]['team'], pro_players[player_name]['cost']]
+            row += [player_info[column_name] for column_name in main_columns]
+            rows.append(row + [player_info['points details sum'][column_name] for column_name in details_columns])
+    return columns, rows
+
+
+OVERALL_SORT_KEYS = {
+    'overall': 'mean points per match',
+    'overall_sort_by_win': 'mean points per win',
+    'overall_sort_by_lose': 'mean points per lose',
+    'overall_sort_by_shrunk': 'mean points per match shrunk',
+    'overall_sort_by_low': 'mean points per match low'
+}
 
 
-def dump_overall_to_excel(writer, fantasy_points, pro_players, sorting_key):
+def overall_workbooks(path, name_prefix, pro_players, fantasy_points):
+    # The overall workbooks differ only in the order of the rows: one table per role, one argsort per file
+    tables = {}
     for role in ['carry', 'mid', 'offlane', 'support']:
         if len(fantasy_points[role]) == 0:
             continue
 
-        role_points = dict(sorted(fantasy_points[role].items(), key=lambda x: x[1][sorting_key], reverse=True))
         data = list()
-        main_columns = ['match count', 'total points', 'mean points per match', 'mean points per win',
-                        'mean points per lose', 'mean per cost', 'mean duration', 'mean per duration', 'min points', 'max points', 'match points']
+        main_columns = ['match count', 'total points', 'mean points per match', 'mean points per match ci', 'mean points per match shrunk',
+                        'mean points per win', 'mean points per win ci', 'mean points per win shrunk', 'mean points per lose',
+                        'mean points per lose ci', 'mean points per lose shrunk', 'mean per cost', 'mean duration', 'mean per duration',
+                        'min points', 'max points', 'match points']
         columns = ['name', 'team', 'cost'] + main_columns
-        for player_name in role_points:
-            player_info = role_points[player_name]
+        for player_name, player_info in fantasy_points[role].items():
             row = [player_name, pro_players[player_name]['team'], pro_players[player_name]['cost']]
             for column_name in main_columns:
                 row.append(player_info[column_name])
             data.append(row)
-        df = pd.DataFrame(data, columns=columns)
-        sf = StyleFrame(df)
-        sf.A_FACTOR = 4
-        sf.apply_column_style(
-            cols_to_style=['match points'],
-            styler_obj=Styler(font='Courier New', horizontal_alignment=utils.horizontal_alignments.left),
-        )
-        sf.to_excel(writer, sheet_name=role, best_fit=columns)
-
-
-def dump_overall(path: str, pro_players: dict, fantasy_points: dict, sort_key: str):
-    with pd.ExcelWriter(path) as writer:
-        dump_overall_to_excel(writer, fantasy_points, pro_players, sort_key)
+        tables[role] = sheet_table(columns, data)
+
+    workbooks = {}
+    for file_name, sorting_key in OVERALL_SORT_KEYS.items():
+        workbooks[f'{path}/{name_prefix}{file_name}.xlsx'] = [
+            (role, table, descending_order([player_info[sorting_key] for player_info in fantasy_points[role].values()]), ['match points'])
+            for role, table in tables.items()
+        ]
+    return workbooks
+
+
+def overall_players_table(fantasy_points, pro_players):
+    # The overall sheets with numbers for numbers, the winrate in percent, intervals as low and high columns
+    stat_columns = ['total points']
+    for key in ['mean points per match', 'mean points per win', 'mean points per lose']:
+        stat_columns += [key, f'{key} low', f'{key} high', f'{key} shrunk']
+    stat_columns += ['mean per cost', 'mean duration', 'mean per duration', 'min points', 'max points']
+    columns = [('name', 'string'), ('role', 'string'), ('team', 'string'), ('cost', 'int'), ('match count', 'int'), ('wins', 'int'), ('winrate', 'float')]
+    columns += [(column_name, 'float') for column_name in stat_columns]
+    rows = []
+    for role in ['carry', 'mid', 'offlane', 'support']:
+        for player_name, player_info in fantasy_points[role].items():
+            row = [player_name, role, pro_players[player_name]['team'], pro_players[player_name]['cost'], player_info['match count'], player_info['wins count'],
+                   player_info['wins count'] / player_info['match count'] * 100]
+            rows.append(row + [player_info[column_name] for column_name in stat_columns])
+    return columns, rows
+
+
+def overall_matches_table(fantasy_points, pro_players):
+    # One row per player and match: points of the match, the points it adds to the total (split over
+    # the games of the series), the duration in minutes and the points of every scoring category
+    details_columns = ['kills', 'runes', 'camps_stacked', 'obs_placed', 'last_hits', 'courier_kills',
+                       'towers_killed', 'roshans_killed', 'assists', 'teamfight_participation', 'gold_per_min',
+                       'deaths']
+    columns = [('name', 'string'), ('role', 'string'), ('team', 'string'), ('match id', 'int'), ('points', 'float'), ('series points', 'float'), ('win', 'bool'), ('duration', 'float')]
+    columns += [(column_name, 'float') for column_name in details_columns]
+    rows = []
+    for role in ['carry', 'mid', 'offlane', 'support']:
+        for player_name, player_info in fantasy_points[role].items():
+            for match_values in zip(player_info['match ids'], player_info['points'], player_info['fantasy points'], player_info['wins'], player_info['durations'], player_info['points details']):
+                match_id, points, series_points, is_win, duration, points_details = match_values
+                row = [player_name, role, pro_players[player_name]['team'], match_id, points, series_points, is_win, duration / 60]
+                rows.append(row + [points_details[column_name] for column_name in details_columns])
+    return columns, rows
 
 
-def dump_overalls(path: str, name_prefix: str, tournament_id: int, pro_players: dict, reload_data: bool, min_bound: int, max_bound: int) -> dict:
+def dump_overalls(path: str, name_prefix: str, tournament_id: int, pro_players: dict, reload_data: bool, min_bound: int, max_bound: int, workbooks: dict = None, tables: dict = None) -> dict:
     fantasy_points = compute_fantasy_points(tournament_id, pro_players, reload_data=reload_data, min_bound=min_bound, max_bound=max_bound)
     post_calculate_points(fantasy_points, pro_players)
-    dump_overall(f'{path}/{name_prefix}overall.xlsx', pro_players, fantasy_points, 'mean points per match')
-    dump_overall(f'{path}/{name_prefix}overall_sort_by_win.xlsx', pro_players, fantasy_points, 'mean points per win')
-    dump_overall(f'{path}/{name_prefix}overall_sort_by_lose.xlsx', pro_players, fantasy_points, 'mean points per lose')
-    return fantasy_points
+    postproc_rating_intervals(fantasy_points)
+    return dump_overalls_by_points(path, name_prefix, pro_players, fantasy_points, workbooks, tables)
+
 
+def dump_overalls_by_points(path: str, name_prefix: str, pro_players: dict, fantasy_points: dict, workbooks: dict = None, tables: dict = None) -> dict:
+    if workbooks is None:
+        write_workbooks(overall_workbooks(path, name_prefix, pro_players, fantasy_points))
+    else:
+        workbooks.update(overall_workbooks(path, name_prefix, pro_players, fantasy_points))
 
-def dump_overalls_by_points(path: str, name_prefix: str, pro_players: dict, fantasy_points: dict) -> dict:
-    dump_overall(f'{path}/{name_prefix}overall.xlsx', pro_players, fantasy_points, 'mean points per match')
-    dump_overall(f'{path}/{name_prefix}overall_sort_by_win.xlsx', pro_players, fantasy_points, 'mean points per win')
-    dump_overall(f'{path}/{name_prefix}overall_sort_by_lose.xlsx', pro_players, fantasy_points, 'mean points per lose')
+    overall_tables = dict(zip(overall_table_paths(path, name_prefix), [overall_players_table(fantasy_points, pro_players), overall_matches_table(fantasy_points, pro_players)]))
+    if tables is None:
+        write_columnar_tables(overall_tables)
+    else:
+        tables.update(overall_tables)
     return fantasy_points
 
 
+def tournament_inputs_hash(tournament_id, matches, reload_data, arguments):
+    # The match list (as the caller already fetched it), the cached records of its matches, the rosters
+    # and the arguments. A match without a record still to be fetched always counts as a change.
+    record_files = [f'parsed_data/records/{match['match_id']}.json' for match in matches['matches']]
+    missing = [path for path in record_files if not os.path.exists(path)]
+    files = [f'parsed_data/{tournament_id}.json', 'pro_players.json', 'pro_players_actual.json'] + record_files
+    return inputs_hash(files, [arguments, missing, bool(reload_data and missing)])
+
+
+def tournament_outputs(output_path, play_off_first_match, days):
+    outputs = []
+    for day_num in range(1, len(days) + 1):
+        outputs.append(f'{output_path}/day{day_num}.xlsx')
+        outputs += columnar_outputs(table_paths(f'{output_path}/day{day_num}.xlsx', DAY_TABLES))
+    for name_prefix in (['groups_', 'playoff_'] if play_off_first_match else []) + ['']:
+        outputs += [f'{output_path}/{name_prefix}{file_name}.xlsx' for file_name in OVERALL_SORT_KEYS]
+        outputs += columnar_outputs(overall_table_paths(output_path, name_prefix))
+    return outputs
+
+
 def dump_tournament(name: str, tournament_id: int, reload: bool, play_off_first_match: int, days: list, balances: list = None) -> dict:
+    # Workbooks are rebuilt only when the tournament inputs changed since they were written (see manifest.py)
+    # balances has the balance of every day, a day given a list of balances gets a top teams sheet for each
+    # of them from one search over its players
     output_path = f'dota2_fantasy/{name}'
     Path(output_path).mkdir(parents=True, exist_ok=True)
 
+    outputs = tournament_outputs(output_path, play_off_first_match, days)
+    matches = get_matches(tournament_id, reload)
+    if not outdated(MANIFEST_PATH, outputs, tournament_inputs_hash(tournament_id, matches, reload, [play_off_first_match, days, balances])):
+        print(f'{name}: up to date')
+        pro_players_actual = get_pro_players('pro_players_actual.json')
+        fantasy_points = compute_fantasy_points(tournament_id, pro_players_actual, reload_data=False)
+        post_calculate_points(fantasy_points, pro_players_actual)
+        return fantasy_points
+
     pro_players = get_pro_players('pro_players.json')
+    arguments = [play_off_first_match, days, balances]
     days = [1] + days + [9999999999]
+    workbooks = {}
+    tables = {}
     for day_num in range(1, len(days) - 1):
         balance = 100 if balances is None else balances[day_num - 1]
-        dump_day(f'{output_path}/day{day_num}.xlsx', tournament_id, pro_players, reload, days[day_num], days[day_num + 1], 'total points', balance)
+        dump_day(f'{output_path}/day{day_num}.xlsx', tournament_id, pro_players, reload, days[day_num], days[day_num + 1], 'total points', balance, workbooks=workbooks, tables=tables)
 
     pro_players_actual = get_pro_players('pro_players_actual.json')
     if play_off_first_match:
-        dump_overalls(output_path, 'groups_', tournament_id, pro_players_actual, reload, 1, play_off_first_match)
-        dump_overalls(output_path, 'playoff_', tournament_id, pro_players_actual, reload, play_off_first_match, 9999999999)
+        dump_overalls(output_path, 'groups_', tournament_id, pro_players_actual, reload, 1, play_off_first_match, workbooks, tables)
+        dump_overalls(output_path, 'playoff_', tournament_id, pro_players_actual, reload, play_off_first_match, 9999999999, workbooks, tables)
+
+    fantasy_points = dump_overalls(output_path, '', tournament_id, pro_players_actual, reload, 1, 9999999999, workbooks, tables)
+    write_workbooks(workbooks)
+    write_columnar_tables(tables)
+    # A list fetched again by the dump that differs from this one changes the file hash, so the next run rebuilds
+    record_outputs(MANIFEST_PATH, outputs, tournament_inputs_hash(tournament_id, matches, False, arguments))
+    return fantasy_points
+
+
+def fetch_new_records(tournament_id):
+    # Ids of the matches of the tournament whose records were fetched now: the match list is fetched again
+    # and only the matches without a cached record are asked for, a match not parsed yet is asked again
+    # on the next call
+    new_match_ids = []
+    for match in get_matches(tournament_id, True)['matches']:
+        match_id = match['match_id']
+        if os.path.exists(f'parsed_data/records/{match_id}.json'):
+            continue
+
+        try:
+            record = ingest.get_match_record(match_id, True)
+        except Exception as e:
+            print(f"Error: {e}")
+            continue
+
+        if record is not None:
+            new_match_ids.append(match_id)
+    return new_match_ids
+
+
+def watch_tournament(name: str, tournament_id: int, play_off_first_match: int, days: list, balances: list = None, interval: float = 30, polls: int = None):
+    # Live tournament days: every interval seconds the records of new finished matches are fetched
+    # (fetch_new_records) and only the workbooks they change are written again: the days they were played
+    # on and the tournament overall
+    output_path = f'dota2_fantasy/{name}'
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    days = [1] + days + [9999999999]
+    poll = 0
+    while polls is None or poll < polls:
+        if poll:
+            time.sleep(interval)
+        poll += 1
+
+        try:
+            new_match_ids = fetch_new_records(tournament_id)
+        except Exception as e:
+            print(f"Error: {e}")
+            continue
+
+        if not new_match_ids:
+            continue
 
-    return dump_overalls(output_path, '', tournament_id, pro_players_actual, reload, 1, 9999999999)
+        print(f'{name}: {len(new_match_ids)} new matches')
+        pro_players = get_pro_players('pro_players.json')
+        workbooks = {}
+        tables = {}
+        for day_num in range(1, len(days) - 1):
+            if any(days[day_num] <= match_id < days[day_num + 1] for match_id in new_match_ids):
+                balance = 100 if balances is None else balances[day_num - 1]
+                dump_day(f'{output_path}/day{day_num}.xlsx', tournament_id, pro_players, False, days[day_num], days[day_num + 1], 'total points', balance, workbooks=workbooks, tables=tables)
+
+        pro_players_actual = get_pro_players('pro_players_actual.json')
+        if play_off_first_match:
+            for name_prefix, min_bound, max_bound in [('groups_', 1, play_off_first_match), ('playoff_', play_off_first_match, 9999999999)]:
+                if any(min_bound <= match_id < max_bound for match_id in new_match_ids):
+                    dump_overalls(output_path, name_prefix, tournament_id, pro_players_actual, False, min_bound, max_bound, workbooks, tables)
+        dump_overalls(output_path, '', tournament_id, pro_players_actual, False, 1, 9999999999, workbooks, tables)
+        write_workbooks(workbooks)
+        write_columnar_tables(tables)
+        print(f'dump: {", ".join(workbooks)}')
 
 
 def merge_dicts(dict1, dict2, excluded_keys):
@@ -438,27 +651,169 @@ def merge_overalls(overalls: list[dict]) -> dict:
     return overall_fantasy_points
 
 
+def load_query_tournaments(tournaments: list, pro_players: dict, loaded: dict = None, reload_tournaments: tuple = ()) -> dict:
+    # {tournament name: {'digest', 'points'}} with the per-match points of every tournament, a tournament
+    # whose matches and records did not change since it was loaded is kept as it is, reload_tournaments
+    # fetch their match list and the records still missing
+    loaded = loaded or {}
+    query_tournaments = {}
+    for name, tournament_id, *_ in tournaments:
+        if name in reload_tournaments:
+            fantasy_points = compute_fantasy_points(tournament_id, pro_players, reload_data=True)
+            query_tournaments[name] = {'digest': tournament_inputs_hash(tournament_id, get_matches(tournament_id, False), False, []), 'points': fantasy_points}
+            continue
+
+        digest = tournament_inputs_hash(tournament_id, get_matches(tournament_id, False), False, [])
+        if name in loaded and loaded[name]['digest'] == digest:
+            query_tournaments[name] = loaded[name]
+        else:
+            query_tournaments[name] = {'digest': digest, 'points': compute_fantasy_points(tournament_id, pro_players, reload_data=False)}
+    return query_tournaments
+
+
+def query_window(data: dict, pro_players: dict, params: dict) -> dict:
+    # Overall points of tournaments=name,name,... or of the last=N tournaments (all by default), merged
+    # once per data version
+    names = list(data['tournaments'])
+    if 'tournaments' in params:
+        names = params['tournaments'].split(',')
+    elif 'last' in params:
+        names = names[-int(params['last']):]
+
+    window = tuple(names)
+    if window not in data['windows']:
+        fantasy_points = copy.deepcopy(merge_overalls([data['tournaments'][name]['points'] for name in names]))
+        post_calculate_points(fantasy_points, pro_players)
+        postproc_rating_intervals(fantasy_points)
+        data['windows'][window] = fantasy_points
+    return data['windows'][window]
+
+
+def query_routes(state: dict, pro_players: dict) -> dict:
+    # state['data'] is replaced as a whole by a refresh, a query works on the data it started with
+    def players(params):
+        return query_records(overall_players_table(query_window(state['data'], pro_players, params), pro_players), params, ['name', 'team', 'role'], 'mean points per match')
+
+    def matches(params):
+        return query_records(overall_matches_table(query_window(state['data'], pro_players, params), pro_players), params, ['name', 'team', 'role', 'match id'])
+
+    def lineups(params):
+        # balance=100,110,120 answers every balance from one search, the teams are then {balance: teams}
+        fantasy_points = query_window(state['data'], pro_players, params)
+        balances = [int(balance) for balance in params.get('balance', '100').split(',')]
+        if len(balances) > 1:
+            dream_teams, teams_by_balance = generate_teams_for_balances(fantasy_points, pro_players, int(params.get('count', 10)), balances, query_constraints(pro_players, params))
+            return {'teams': {str(balance): teams for balance, teams in teams_by_balance.items()}, 'dream teams': dream_teams}
+        dream_teams, teams = generate_teams(fantasy_points, pro_players, int(params.get('count', 10)), balances[0], query_constraints(pro_players, params))
+        return {'teams': teams, 'dream teams': dream_teams}
+
+    def balances(params):
+        balances = [int(balance) for balance in params['balances'].split(',')] if 'balances' in params else list(range(100, 200, 5))
+        names = [[player_name for player_name, player_data in pro_players.items() if player_data['role'] == role and 'save_as' not in player_data] for role in ['carry', 'mid', 'offlane', 'support']]
+        teams_counts = count_lineups_by_balance(get_cost_groups(pro_players, *names), balances)
+        teams_count = len(names[0]) * len(names[1]) * len(names[2]) * math.comb(len(names[3]), 2)
+        return {'teams count': teams_count, 'balances': {str(balance): teams_counts[balance] for balance in balances}}
+
+    def tournaments(params):
+        return [{'name': name, 'matches': len({match_id for role in tournament['points'].values() for player_info in role.values() for match_id in player_info['match ids']})} for name, tournament in state['data']['tournaments'].items()]
+
+    return {'players': players, 'matches': matches, 'lineups': lineups, 'balances': balances, 'tournaments': tournaments}
+
+
+def serve_queries(pro_players_file: str = 'pro_players_actual.json', tournaments: list = None, port: int = 8000, refresh_interval: float = None, cache_size: int = 256):
+    # Resident query service over the match caches (see service.py), for example
+    #   /players?last=2&role=mid&sort=mean points per win&limit=20
+    #   /matches?name=Yatoro
+    #   /lineups?tournaments=7.37c-the-international-2024&balance=110&max_per_team=2&exclude=Ame
+    #   /lineups?balance=100,110,120
+    #   /balances?balances=100,105,110
+    #   /refresh?reload=7.37c-the-international-2024 (fetches new matches, without reload only changed caches)
+    tournaments = tournaments or [(tournament['name'], tournament['id']) for tournament in load_reports()['tournaments']]
+    pro_players = get_pro_players(pro_players_file)
+    state = {'data': {'tournaments': load_query_tournaments(tournaments, pro_players), 'windows': {}}}
+
+    def refresh(params):
+        reload_tournaments = params['reload'].split(',') if params.get('reload') else []
+        query_tournaments = load_query_tournaments(tournaments, pro_players, state['data']['tournaments'], reload_tournaments)
+        if all(query_tournaments[name] is state['data']['tournaments'][name] for name in query_tournaments):
+            return False
+        state['data'] = {'tournaments': query_tournaments, 'windows': {}}
+        return True
+
+    serve(query_service(query_routes(state, pro_players), refresh, cache_size), port=port, refresh_interval=refresh_interval)
+
+
+def dump_merged_overalls(name_prefix: str, overalls: list[dict], pro_players: dict) -> dict:
+    overall_fantasy_points = merge_overalls(overalls)
+    post_calculate_points(overall_fantasy_points, pro_players)
+    postproc_rating_intervals(overall_fantasy_points)
+    outputs = [f'dota2_fantasy/{name_prefix}{file_name}.xlsx' for file_name in OVERALL_SORT_KEYS] + columnar_outputs(overall_table_paths('dota2_fantasy', name_prefix))
+    digest = inputs_hash(data=[overall_fantasy_points, pro_players])
+    if outdated(MANIFEST_PATH, outputs, digest):
+        dump_overalls_by_points('dota2_fantasy', name_prefix, pro_players, overall_fantasy_points)
+        record_outputs(MANIFEST_PATH, outputs, digest)
+    return overall_fantasy_points
+
+
+def load_reports(config_path: str = 'reports.json') -> dict:
+    # The tournaments and merged windows main() builds, see reports.json, skipped tournaments are left out
+    with open(config_path, 'r', encoding='utf8') as file:
+        reports = json.load(file)
+    reports['tournaments'] = [tournament for tournament in reports['tournaments'] if not tournament.get('skip', False)]
+    return reports
+
+
+def window_tournament_names(reports: dict, window: dict) -> list:
+    # tournaments: names of the tournaments of the window, last: the last N tournaments, all by default
+    names = [tournament['name'] for tournament in reports['tournaments']]
+    if 'tournaments' in window:
+        return window['tournaments']
+    if 'last' in window:
+        return names[-window['last']:]
+    return names
+
+
+def report_tournament(tournament: dict, *fetched) -> dict:
+    return dump_tournament(tournament['name'], tournament['id'], False, tournament['play_off_first_match'], tournament['days'], tournament.get('balances'))
+
+
+def report_window(window: dict, *overalls) -> dict:
+    return dump_merged_overalls(window.get('prefix', ''), list(overalls), get_pro_players(window.get('pro_players', 'pro_players_actual.json')))
+
+
+def report_tasks(reports: dict) -> dict:
+    # fetch:<tournament> (only for tournaments to reload or not cached yet) -> tournament:<tournament>
+    # (scoring and the tournament workbooks) -> window:<window> (merged overalls), workbooks up to date
+    # are not written (manifest.py)
+    tasks = {}
+    for tournament in reports['tournaments']:
+        deps = []
+        if tournament.get('reload', False) or not os.path.exists(f'parsed_data/{tournament['id']}.json'):
+            deps.append(f'fetch:{tournament['name']}')
+            tasks[deps[0]] = task(fetch_new_records, tournament['id'], pool='thread')
+        tasks[f'tournament:{tournament['name']}'] = task(report_tournament, tournament, deps=deps)
+
+    for window in reports.get('windows', []):
+        tasks[f'window:{window['name']}'] = task(report_window, window, deps=[f'tournament:{name}' for name in window_tournament_names(reports, window)])
+    return tasks
+
+
 def main():
-    overalls = [
-        # dump_tournament('7.35d-esl-one-birmingham-2024', 16518, False, 7704010804, []),
-        # dump_tournament('7.35d-pgl-wallachia-2024', 16669, False, 7739857156, [7739857156, 7741332700, 7742965164, 7744813911]),
-        # dump_tournament('7.35d–7.36-dreamleague-season-23', 16632, False, 7751224080, [7751224080, 7753420462, 7755832761, 7758350202]),
-        # dump_tournament('7.36c-1win-series', 16427, False, 0, []),
-        # dump_tournament('7.36c-road-to-the-international-2024-we', 16842, False, 0, []),
-        dump_tournament('7.36c-riyadh-masters-2024', 16881, False, 0, []),
-        dump_tournament('7.36c–7.37-elite-league-season-2', 16905, False, 0, []),
-        dump_tournament('7.36c–7.37-snow-ruyi', 16901, False, 0, []),
-        dump_tournament('7.37b-fissure-universe-episode-3', 16846, False, 0, []),
-        dump_tournament('7.37c-the-international-2024', 16935, True, 0,
-                        [7927665226, 7928915377, 7930304864, 7931849156, 7933465064, 7935041049, 7936398486, 7940501580, 7941965902, 7943623713],
-                        [100, 100, 100, 100, 100, 100, 100, 110, 120, 120])
-    ]
+    parser = argparse.ArgumentParser(description='Builds the reports of a reports file: tournaments are fetched, scored and dumped in parallel, merged windows as soon as their tournaments are done.')
+    parser.add_argument('config', nargs='?', default='reports.json')
+    parser.add_argument('--workers', type=int, default=None, help='processes for scoring and reports, all cores by default')
+    parser.add_argument('--threads', type=int, default=8, help='threads for fetching')
+    parser.add_argument('--only', nargs='+', help='tasks to run (tournament:<name>, window:<name>) with the tasks they depend on')
+    args = parser.parse_args()
 
-    pro_players_actual = get_pro_players('pro_players_actual.json')
+    tasks = report_tasks(load_reports(args.config))
+    if args.only:
+        unknown = [name for name in args.only if name not in tasks]
+        if unknown:
+            parser.error(f'unknown tasks: {", ".join(unknown)}')
+        tasks = required_tasks(tasks, args.only)
 
-    overall_fantasy_points = merge_overalls(overalls)
-    post_calculate_points(overall_fantasy_points, pro_players_actual)
-    dump_overalls_by_points('dota2_fantasy/', '', pro_players_actual, overall_fantasy_points)
+    run_tasks(tasks, args.workers, args.threads)
 
 
 def convert_pro_players_from_cyber():
@@ -476,64 +831,49 @@ def convert_pro_players_from_cyber():
 
 
 def calculate_table_ties(table, matches):
-    values = [0, 1, 2]
-    combinations = itertools.product(values, repeat=len(matches))
-    results = table.copy()
-    results_weighted = table.copy()
-    for team in results:
-        results[team] = 0
-        results_weighted[team] = 0
-
-    combinations_count = 0
-    for combination in combinations:
-        combinations_count += 1
-        combination_table = table.copy()
-        probability = 1.00
-        for index, value in enumerate(combination):
-            match = matches[index]
-            if value == 0:
-                combination_table[match['teams'][0]] += 2
-            elif value == 1:
-                combination_table[match['teams'][0]] += 1
-                combination_table[match['teams'][1]] += 1
-            elif value == 2:
-                combination_table[match['teams'][1]] += 2
-
-            probability *= match['probabilities'][value]
-
-        combination_table = dict(sorted(combination_table.items(), key=lambda x: x[1], reverse=True))
-        table_values = list(combination_table.values())
-        if table_values[0] == table_values[1]:
-            for team, value in combination_table.items():
-                if value == table_values[0]:
-                    results[team] += 1
-                    results_weighted[team] += probability
-
-        if table_values[1] == table_values[2]:
-            if table_values[0] == table_values[1]:
-                continue
+    # Places and ties at every place over every outcome of the remaining matches, by combinations and by
+    # BetBoom coeffs when the matches have probabilities
+    distribution = standings_distribution(table, matches)
+    combinations_count = distribution['combinations']
+    places = range(1, len(distribution['teams']) + 1)
+    weightings = {'by combinations': False}
+    if distribution['probabilities'] is not None:
+        weightings['by BetBoom coeffs'] = True
+
+    result = {}
+    for label, weighted in weightings.items():
+        result[label] = {
+            'places': placement_probabilities(distribution, weighted=weighted),
+            'ties': [tie_probabilities(distribution, weighted=weighted, places=[place]) for place in places]
+        }
 
-            for team, value in combination_table.items():
-                if value == table_values[1]:
-                    results[team] += 1
-                    results_weighted[team] += probability
+    print(f'{combinations_count} combinations, ties for the first or the second place:')
+    for i, team_name in enumerate(distribution['teams']):
+        team_combinations = distribution['counts'][i, :2, 1:].sum()
+        top_ties = f'{team_name}: by combinations: {team_combinations / combinations_count * 100:.0f}% ({team_combinations} of {combinations_count})'
+        if 'by BetBoom coeffs' in result:
+            top_ties += f', by BetBoom coeffs: {sum(ties[team_name] for ties in result["by BetBoom coeffs"]["ties"][:2]) * 100:.0f}%'
+        print(top_ties)
+        for label, team_result in result.items():
+            team_places = ' '.join(f'{probability * 100:.0f}%' for probability in team_result['places'][team_name])
+            team_ties = ' '.join(f'{ties[team_name] * 100:.0f}%' for ties in team_result['ties'])
+            print(f'  {label}: places: {team_places}, ties by place: {team_ties}')
 
-    teams_names = results.keys()
-    results_values = list(results.values())
-    weighted_results_values = list(results_weighted.values())
-    for i, team_name in enumerate(teams_names):
-        print(f'{team_name}: by combinations: {results_values[i] / combinations_count * 100:.0f}% ({results_values[i]} of {combinations_count}), by BetBoom coeffs: {weighted_results_values[i] * 100:.0f}%')
+    return result
 
 
 def calculate_probabilities(matches):
     for match in matches:
-        match['probabilities'] = []
-        margin = 0.00
-        for coefficient in match['coefficients']:
-            margin += 1.00 / coefficient
-        margin -= 1.00
-        for coefficient in match['coefficients']:
-            match['probabilities'].append(1.00 / coefficient - margin / len(match['coefficients']))
+        match['probabilities'] = odds_probabilities(match['coefficients'])
+
+
+def print_maps_prediction(teams, matches, stages, simulations=1_000_000):
+    # teams in seeding order, matches with coefficients rate the teams, stages as in simulator.py
+    prediction = simulate_from_odds(teams, matches, stages, simulations)
+    for team in sorted(teams, key=lambda x: prediction['expected maps'][x], reverse=True):
+        places = ' '.join(f'{place * 100:.0f}%' for place in prediction['places'][team])
+        print(f'{team}: {prediction["expected maps"][team]:.2f} maps, places: {places}')
+    return prediction
 
 
 def calculate_ties():
@@ -599,16 +939,15 @@ def calculate_ties():
     calculate_table_ties(table_d, matches_d)
 
 
+def get_cost_groups(pro_players_actual, carry_names, mid_names, offlane_names, support_names):
+    groups = []
+    for names, size in [(carry_names, 1), (mid_names, 1), (offlane_names, 1), (support_names, 2)]:
+        groups.append(([(player_name, 0, pro_players_actual[player_name]['cost']) for player_name in names], size))
+    return groups
+
+
 def count_valid_teams(pro_players_actual, carry_names, mid_names, offlane_names, support_names, max_cost):
-    teams_count = 0
-    for carry_name in carry_names:
-        for mid_name in mid_names:
-            for offlane_name in offlane_names:
-                for comb in itertools.combinations(support_names, 2):
-                    cost = pro_players_actual[carry_name]['cost'] + pro_players_actual[mid_name]['cost'] + pro_players_actual[offlane_name]['cost'] + sum(pro_players_actual[player]['cost'] for player in comb)
-                    if cost <= max_cost:
-                        teams_count += 1
-    return teams_count
+    return count_lineups_by_balance(get_cost_groups(pro_players_actual, carry_names, mid_names, offlane_names, support_names), [max_cost])[max_cost]
 
 
 def print_balance_distribution():
@@ -623,8 +962,10 @@ def print_balance_distribution():
     print(f'offlane count = {len(offlane_names)}')
     print(f'support count = {len(support_names)}')
     teams_count = len(carry_names) * len(mid_names) * len(offlane_names) * sum(1 for _ in itertools.combinations(support_names, 2))
-    for balance in range(100, 200, 5):
-        teams_count_for_balance = count_valid_teams(pro_players_actual, carry_names, mid_names, offlane_names, support_names, balance)
+    balances = list(range(100, 200, 5))
+    teams_counts = count_lineups_by_balance(get_cost_groups(pro_players_actual, carry_names, mid_names, offlane_names, support_names), balances)
+    for balance in balances:
+        teams_count_for_balance = teams_counts[balance]
         print(f'{balance}: {teams_count_for_balance}/{teams_count} {round(1.0 * teams_count_for_balance / teams_count * 100, 3)}%')
 
 
@@ -0,0 +1,94 @@
+import numpy as np
+
+# Group matches are Bo2 by default: the first team wins 2-0, the series is drawn 1-1 or the second team
+# wins 2-0, a team gets a point per map. A match may set its own 'outcomes' as (first, second) points,
+# 'probabilities' (see main.calculate_probabilities) are in the same order.
+BO2_OUTCOMES = [(2, 0), (1, 1), (0, 2)]
+
+
+def match_outcomes(match):
+    return match.get('outcomes', BO2_OUTCOMES)
+
+
+def is_weighted(matches):
+    return all('probabilities' in match for match in matches)
+
+
+def outcome_distribution(teams, matches):
+    # Every distinct vector of points the matches add, with the number of outcome combinations giving it
+    # and their total probability. Vectors are packed into one integer (a digit per team), after every
+    # match the combinations meeting in the same vector are merged.
+    team_index = {team: index for index, team in enumerate(teams)}
+    weighted = is_weighted(matches)
+    radix = [1] * len(teams)
+    for match in matches:
+        outcomes = match_outcomes(match)
+        radix[team_index[match['teams'][0]]] += max(points for points, _ in outcomes)
+        radix[team_index[match['teams'][1]]] += max(points for _, points in outcomes)
+    place_values = np.cumprod([1] + radix[:-1]).astype(np.int64)
+
+    keys = np.zeros(1, dtype=np.int64)
+    counts = np.ones(1, dtype=np.float64)
+    probabilities = np.ones(1, dtype=np.float64)
+    for match in matches:
+        first = place_values[team_index[match['teams'][0]]]
+        second = place_values[team_index[match['teams'][1]]]
+        outcomes = match_outcomes(match)
+        outcome_probabilities = match['probabilities'] if weighted else [1.0] * len(outcomes)
+        keys = np.concatenate([keys + first * first_points + second * second_points for first_points, second_points in outcomes])
+        counts = np.tile(counts, len(outcomes))
+        probabilities = np.concatenate([probabilities * outcome_probability for outcome_probability in outcome_probabilities])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(keys))
+        probabilities = np.bincount(inverse, weights=probabilities, minlength=len(keys))
+
+    vectors = keys[:, None] // place_values[None, :] % np.array(radix, dtype=np.int64)[None, :]
+    return vectors, counts.round().astype(np.int64), probabilities
+
+
+def standings_distribution(table, matches, chunk_size=1 << 20):
+    # Exact distribution of the final table over all outcomes of the remaining matches. The schedule is
+    # reduced to its distinct point vectors (see outcome_distribution), the places of every vector are
+    # counted in NumPy chunks of about chunk_size table cells.
+    # counts[t][a][l] - combinations where team t has a teams strictly ahead and l other teams level,
+    # probabilities is the same weighted by the match probabilities (None without them).
+    teams = list(table)
+    n = len(teams)
+    vectors, vector_counts, vector_probabilities = outcome_distribution(teams, matches)
+    base = np.array([table[team] for team in teams], dtype=np.int64)
+    team_cells = np.arange(n) * n * n
+
+    counts = np.zeros(n * n * n, dtype=np.int64)
+    probabilities = np.zeros(n * n * n, dtype=np.float64)
+    rows = max(1, chunk_size // (n * n))
+    for start in range(0, len(vectors), rows):
+        stop = start + rows
+        points = base + vectors[start:stop]
+        ahead = (points[:, None, :] > points[:, :, None]).sum(axis=2)
+        level = (points[:, None, :] == points[:, :, None]).sum(axis=2) - 1
+        cells = (team_cells + ahead * n + level).ravel()
+        counts += np.bincount(cells, weights=np.repeat(vector_counts[start:stop], n), minlength=n * n * n).round().astype(np.int64)
+        probabilities += np.bincount(cells, weights=np.repeat(vector_probabilities[start:stop], n), minlength=n * n * n)
+
+    return {
+        'teams': teams,
+        'combinations': int(vector_counts.sum()),
+        'counts': counts.reshape(n, n, n),
+        'probabilities': probabilities.reshape(n, n, n) if is_weighted(matches) else None
+    }
+
+
+def placement_probabilities(distribution, weighted=False):
+    # Chance of every place (1 + teams strictly ahead, level teams share the best place) for every team
+    if weighted:
+        places = distribution['probabilities'].sum(axis=2)
+    else:
+        places = distribution['counts'].sum(axis=2) / distribution['combinations']
+    return {team: places[index] for index, team in enumerate(distribution['teams'])}
+
+
+def tie_probabilities(distribution, weighted=False, places=None):
+    # Chance of finishing level with another team, only at the given places (1-based) when set
+    joint = distribution['probabilities'] if weighted else distribution['counts'] / distribution['combinations']
+    ahead = range(joint.shape[1]) if places is None else [place - 1 for place in places]
+    return {team: joint[index, ahead, 1:].sum() for index, team in enumerate(distribution['teams'])}
@@ -1,17 +1,23 @@
-import os
 import json
-import requests
+import sys
+from pathlib import Path
+
 import numpy as np
-import pandas as pd
-from styleframe import StyleFrame, Styler, utils
 
-token = ''
+import ingest
+
+# the modules both games share are in the shared package next to the game directories
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shared.excel import open_workbook, write_sheet
+from shared.lineups import top_lineups_parallel
 
 
 def get_series(tournament_id, reload_data):
     if reload_data:
+        import requests
+
         url = f'https://api.stratz.com/api/v1/league/{tournament_id}/series'
-        response = requests.get(url, headers={'Authorization': f'Bearer {token}'})
+        response = requests.get(url, headers={'Authorization': f'Bearer {ingest.stratz_token}'})
 
         series = {'series': response.json()}
         with open('parsed_data_stratz/series.json', 'w', encoding='utf8') as file:
@@ -26,18 +32,8 @@ def get_series(tournament_id, reload_data):
 
 
 def get_match_info(match_id, reload_data):
-    if reload_data and not os.path.exists(f'parsed_data_stratz/{match_id}.json'):
-        url = f'https://api.stratz.com/api/v1/match/{match_id}'
-        r = requests.get(url, headers={'Authorization': f'Bearer {token}'})
-        match_info = r.json()
-
-        with open(f'parsed_data_stratz/{match_id}.json', 'w', encoding='utf8') as file:
-            json.dump(match_info, file, indent=2)
-
-        return match_info
-    else:
-        with open(f'parsed_data_stratz/{match_id}.json', 'r', encoding='utf8') as file:
-            return json.load(file)
+    # Stratz only: the roster is keyed by Stratz pro names, OpenDota records carry its own names
+    return ingest.get_match_record(match_id, reload_data, ['stratz'], 'parsed_data_stratz')
 
 
 def get_pro_players():
@@ -64,6 +60,8 @@ def create_fantasy_points_template(pro_players):
 
 
 def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0, max_bound=1e30):
+    account_id_mapping = {player_info['account_id']: player_name for player_name, player_info in pro_players.items() if 'account_id' in player_info}
+    skipped_players = set()
     all_series = get_series(tournament_id, reload_data)
 
     fantasy_points = create_fantasy_points_template(pro_players)
@@ -81,31 +79,35 @@ def compute_fantasy_points(tournament_id, pro_players, reload_data, min_bound=0,
                 print(f"Error: {e}")
                 print(f"Match {match_id} has no saved data.")
             else:
+                if match_info is None:
+                    print(f"Match {match_id} is not ready.")
+                    continue
+
                 try:
                     for player in match_info['players']:
-                        tower_count = 0
-                        for building in player['stats']['farmDistributionReport']['buildings']:
-                            if building['id'] == 0:
-                                tower_count = building['count']
-                                break
-
                         points_details = {
-                            'kills': player['numKills'] * 1.5,
-                            # 0 double damage 1 haste 2 illusion 3 invisibility 4 shield 5 gold 6 magic 7 water 8 wisdom 9 regen
-                            'runes':  sum(1 for rune in player['stats']['runeEvents'] if rune['type'] in ['0', '1', '2', '3', '4', '6', '8', '9']) * 1.25,
-                            'camps_stacked': player['stats']['campStackPerMin'][-1] * 1.5,
-                            'obs_placed': sum(1 for ward in player['stats']['wardPlaced'] if ward['type'] == 0) * 1.5,
-                            'last_hits': player['numLastHits'] * 0.015,
-                            'courier_kills': len(player['stats']['courierKills']) * 2,
-                            'towers_killed': tower_count * 2.5,
-                            'roshans_killed': next((x['count'] for x in player['stats']['farmDistributionReport']['creepType'] if x['id'] == 133), 0) * 5,
-                            'assists': player['numAssists'],
-                            'teamfight_participation': 0, # player['teamfight_participation'] * 15,
-                            'gold_per_min': player['goldPerMinute'] * 0.01,
-                            'deaths': 15 - player['numDeaths']
+                            'kills': player['kills'] * 1.5,
+                            'runes': sum(count for rune, count in player['runes'].items() if rune in ['0', '1', '2', '3', '4', '6', '8', '9']) * 1.25,
+                            'camps_stacked': player['camps_stacked'] * 1.5,
+                            'obs_placed': player['obs_placed'] * 1.5,
+                            'last_hits': player['last_hits'] * 0.015,
+                            'courier_kills': player['courier_kills'] * 2,
+                            'towers_killed': player['towers_killed'] * 2.5,
+                            'roshans_killed': player['roshans_killed'] * 5,
+                            'assists': player['assists'],
+                            'teamfight_participation': player['teamfight_participation'] * 15,
+                            'gold_per_min': player['gold_per_min'] * 0.01,
+                            'deaths': 15 - player['deaths']
                         }
 
-                        player_name = player['steamAccount']['proSteamAccount']['name']
+                        # a player not in the roster by name is looked up by account id, else skipped
+                        player_name = player['name'] if player['name'] in pro_players else account_id_mapping.get(player['account_id'])
+                        if player_name is None:
+                            if player['account_id'] not in skipped_players:
+                                skipped_players.add(player['account_id'])
+                                print(f'{player["name"]} ({player["account_id"]}) not in pro_players')
+
+                            continue
 
                         role = pro_players[player_name]['role']
                         player_info = fantasy_points[role][player_name]
@@ -182,10 +184,7 @@ def dump_points_to_excel(writer, fantasy_points, sorting_key):
             for column_name in details_columns:
                 row.append(player_info['points details sum'][column_name])
             data.append(row)
-        df = pd.DataFrame(data, columns=columns)
-        sf = StyleFrame(df)
-        sf.A_FACTOR = 4
-        sf.to_excel(writer, sheet_name=role, best_fit=columns)
+        write_sheet(writer, role, columns, data)
 
 
 def dump_captains_to_excel(writer, fantasy_points):
@@ -196,10 +195,7 @@ def dump_captains_to_excel(writer, fantasy_points):
     captains_info = sorted(captains_info, key=lambda x: x[1], reverse=True)
 
     columns = ['name', 'points', 'role']
-    df = pd.DataFrame(captains_info, columns=columns)
-    sf = StyleFrame(df)
-    sf.A_FACTOR = 4
-    sf.to_excel(writer, sheet_name='captains rating', best_fit=columns)
+    write_sheet(writer, 'captains rating', columns, captains_info)
 
 
 def calculate_team_points(players_points, pro_players, players_names, captain_name):
@@ -218,25 +214,21 @@ def calculate_team_points(players_points, pro_players, players_names, captain_na
     return team_info
 
 
+def generate_teams(fantasy_points, pro_players, count, balance):
+    groups = []
+    for role, size in [('carry', 1), ('mid', 1), ('offlane', 1), ('support', 2)]:
+        candidates = [(player_name, player_info['total points'], pro_players[player_name]['cost']) for player_name, player_info in fantasy_points[role].items()]
+        groups.append((candidates, size))
+
+    dream_lineups, lineups = top_lineups_parallel(groups, count, balance)
+    dream_teams_rating = [calculate_team_points(players_points, pro_players, names, names[captain_index]) for _, _, names, players_points, captain_index in dream_lineups]
+    teams_rating = [calculate_team_points(players_points, pro_players, names, names[captain_index]) for _, _, names, players_points, captain_index in lineups]
+    return dream_teams_rating, teams_rating
+
+
 def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count, balance):
-    teams_rating = []
-
-    pos4_names = list(fantasy_points['support'])
-    for pos1 in fantasy_points['carry']:
-        for pos2 in fantasy_points['mid']:
-            for pos3 in fantasy_points['offlane']:
-                for pos4_index, pos4 in enumerate(pos4_names):
-                    for pos5_index in range(pos4_index + 1, len(pos4_names)):
-                        pos5 = pos4_names[pos5_index]
-                        players_names = [pos1, pos2, pos3, pos4, pos5]
-                        players_points = [fantasy_points['carry'][pos1]['total points'], fantasy_points['mid'][pos2]['total points'],
-                                          fantasy_points['offlane'][pos3]['total points'], fantasy_points['support'][pos4]['total points'],
-                                          fantasy_points['support'][pos5]['total points']]
-                        for captain_name in players_names:
-                            team_info = calculate_team_points(players_points, pro_players, players_names, captain_name)
-                            teams_rating.append(team_info)
-
-    teams_rating = sorted(teams_rating, key=lambda x: x['points'], reverse=True)
+    dream_teams_rating, teams_rating = generate_teams(fantasy_points, pro_players, count, balance)
+
     columns = ['carry', 'mid', 'offlane', 'support', 'support', 'cost', 'points']
     top_teams_data = list()
     for team_info in teams_rating:
@@ -245,29 +237,19 @@ def dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count, balan
             for column_name in columns:
                 row.append(team_info[column_name])
             top_teams_data.append(row)
-            if len(top_teams_data) == count:
-                break
 
     if len(top_teams_data):
-        top_teams_df = pd.DataFrame(top_teams_data, columns=columns)
-        sf_top_teams_df = StyleFrame(top_teams_df)
-        sf_top_teams_df.A_FACTOR = 4
-        sf_top_teams_df.to_excel(writer, sheet_name='Top teams', best_fit=columns)
+        write_sheet(writer, 'Top teams', columns, top_teams_data)
 
     top_dream_teams_data = list()
 
-    for team_info in teams_rating:
+    for team_info in dream_teams_rating:
         row = list()
         for column_name in columns:
             row.append(team_info[column_name])
         top_dream_teams_data.append(row)
-        if len(top_dream_teams_data) == count:
-            break
 
-    top_dream_teams_df = pd.DataFrame(top_dream_teams_data, columns=columns)
-    sf_top_dream_teams_df = StyleFrame(top_dream_teams_df)
-    sf_top_dream_teams_df.A_FACTOR = 4
-    sf_top_dream_teams_df.to_excel(writer, sheet_name='Top dream teams', best_fit=columns)
+    write_sheet(writer, 'Top dream teams', columns, top_dream_teams_data)
 
 
 def dump_day(name, tournament_id, reload_data, min_bound, max_bound, sort_key, balance):
@@ -275,7 +257,7 @@ def dump_day(name, tournament_id, reload_data, min_bound, max_bound, sort_key, b
 
     fantasy_points = compute_fantasy_points(tournament_id, pro_players, reload_data=reload_data, min_bound=min_bound, max_bound=max_bound)
     post_calculate_points(fantasy_points, pro_players)
-    with pd.ExcelWriter(f'dota2_fantasy/{name}') as writer:
+    with open_workbook(f'dota2_fantasy/{name}') as writer:
         dump_points_to_excel(writer, fantasy_points, sort_key)
         dump_captains_to_excel(writer, fantasy_points)
         # dump_teams_rating_to_excel(writer, fantasy_points, pro_players, count=1000, balance=balance)
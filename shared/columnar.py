@@ -0,0 +1,81 @@
+import importlib
+
+# Typed tables written next to the workbooks for dashboards: Parquet, or Arrow IPC files (.arrow) that
+# pyarrow.ipc.open_file reads from a memory map without copies. Numbers stay numbers (a winrate is a
+# float, not the '55.0%' text of the sheets). pyarrow is optional and imported only when tables are
+# written, without it the tables are skipped.
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+COLUMNAR_FORMAT = 'parquet'
+
+
+def load_pyarrow():
+    try:
+        return importlib.import_module('pyarrow')
+    except ImportError:
+        return None
+
+
+def columnar_outputs(paths, file_format=COLUMNAR_FORMAT):
+    # Files the tables ({path without extension: ...}) are written to, none without pyarrow
+    if load_pyarrow() is None:
+        return []
+    return [f'{path}{COLUMNAR_FORMATS[file_format]}' for path in paths]
+
+
+def arrow_type(pyarrow, type_name):
+    return {'string': pyarrow.string(), 'int': pyarrow.int64(), 'float': pyarrow.float64(), 'bool': pyarrow.bool_()}[type_name]
+
+
+def arrow_table(pyarrow, columns, rows):
+    # columns are (name, type name) pairs, rows are lists in the order of columns
+    return pyarrow.table({
+        name: pyarrow.array([row[index] for row in rows], type=arrow_type(pyarrow, type_name))
+        for index, (name, type_name) in enumerate(columns)
+    })
+
+
+def write_columnar(path, table, file_format=COLUMNAR_FORMAT):
+    if file_format == 'parquet':
+        importlib.import_module('pyarrow.parquet').write_table(table, path)
+        return
+
+    pyarrow = load_pyarrow()
+    ipc = importlib.import_module('pyarrow.ipc')
+    with pyarrow.OSFile(path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def write_columnar_tables(tables, file_format=COLUMNAR_FORMAT):
+    # {path without extension: (columns, rows)}, returns the written files
+    if not tables:
+        return []
+
+    pyarrow = load_pyarrow()
+    if pyarrow is None:
+        print('pyarrow is not installed, tables are not exported')
+        return []
+
+    paths = []
+    for path, (columns, rows) in tables.items():
+        paths.append(f'{path}{COLUMNAR_FORMATS[file_format]}')
+        write_columnar(paths[-1], arrow_table(pyarrow, columns, rows), file_format)
+    return paths
+
+
+def lineups_table(dream_teams_rating, teams_rating_by_balance, positions):
+    # Top teams of every balance and the dream teams (no balance) as one table, the captain in a column
+    # instead of the ' (c)' mark
+    columns = [('balance', 'int'), ('dream', 'bool'), ('rank', 'int')] + [(position, 'string') for position in positions] + [('captain', 'string'), ('cost', 'int'), ('points', 'float')]
+    rows = []
+    for balance, teams_rating in list(teams_rating_by_balance.items()) + [(None, dream_teams_rating)]:
+        for rank, team_info in enumerate(teams_rating, 1):
+            names = [team_info[position].removesuffix(' (c)') for position in positions]
+            captain = next(name for position, name in zip(positions, names) if team_info[position].endswith(' (c)'))
+            rows.append([balance, balance is None, rank] + names + [captain, team_info['cost'], team_info['points']])
+    return columns, rows
+
+
+def table_records(columns, rows):
+    # A table as a list of {column name: value}
+    names = [name for name, _ in columns]
+    return [dict(zip(names, row)) for row in rows]
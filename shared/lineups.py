@@ -0,0 +1,870 @@
+import bisect
+import concurrent.futures
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+import statistics
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# A lineup is described by groups of candidates in team order, each group is (candidates, size) where
+# candidates is a list of (name, points, cost) and size is how many distinct players the group takes:
+#   cs2:   [(snipers, 1), (riflers, 4)]
+#   dota2: [(carries, 1), (mids, 1), (offlaners, 1), (supports, 2)]
+# loop_order lists group indices in the nesting order of the original brute-force loops, equal points
+# are ranked by that enumeration order so the results match the old sorted full lists.
+
+
+def lineup_points(players_points, captain_index):
+    # Same summation order as calculate_team_points, so the floats are bit-identical
+    points = 0
+    for player_index, player_points in enumerate(players_points):
+        points += player_points * 2 if player_index == captain_index else player_points
+    return points
+
+
+def captain_order(players_points):
+    return sorted(range(len(players_points)), key=lambda x: (-players_points[x], x))
+
+
+def iterate_lineups(groups, loop_order=None):
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    choices = [itertools.combinations(range(len(groups[group_index][0])), groups[group_index][1]) for group_index in loop_order]
+    for combination in itertools.product(*choices):
+        chosen = [None] * len(groups)
+        for group_index, indexes in zip(loop_order, combination):
+            chosen[group_index] = indexes
+
+        names = []
+        players_points = []
+        cost = 0
+        for (candidates, _), indexes in zip(groups, chosen):
+            for index in indexes:
+                name, points, player_cost = candidates[index]
+                names.append(name)
+                players_points.append(points)
+                cost += player_cost
+
+        yield tuple(itertools.chain.from_iterable(combination)), names, players_points, cost
+
+
+def push_lineup(heap, count, key, lineup):
+    if len(heap) < count:
+        heapq.heappush(heap, (key, lineup))
+    elif key > heap[0][0]:
+        heapq.heapreplace(heap, (key, lineup))
+
+
+def heap_accepts(heap, count, key):
+    return len(heap) < count or key > heap[0][0]
+
+
+def sorted_lineups(heap):
+    return [lineup for _, lineup in sorted(heap, reverse=True)]
+
+
+def lineup_constraints(pro_players, max_per_team=None, include=(), exclude=(), captain=None, min_cost=None, max_cost=None, include_any=()):
+    # Constraint spec understood by the searches, players are referenced by name:
+    #   max_per_team        - at most that many players of one pro_players team
+    #   include / exclude   - players every lineup must / must not have
+    #   include_any         - players every lineup must have at least one of
+    #   captain             - the only allowed captain, implies include
+    #   min_cost / max_cost - total lineup cost range
+    return {
+        'max_per_team': max_per_team,
+        'teams': {player_name: player_info.get('team') for player_name, player_info in pro_players.items()},
+        'include': list(include),
+        'exclude': list(exclude),
+        'include_any': list(include_any),
+        'captain': captain,
+        'min_cost': min_cost,
+        'max_cost': max_cost
+    }
+
+
+def prepare_groups(groups, constraints=None):
+    # Candidates of every group sorted by points (best first) with the tables the bounds need:
+    #   best[j][r]      - points of the best r candidates starting from position j
+    #   min_cost[j][r]  - cost of the cheapest r candidates starting from position j
+    #   max_cost[j][r]  - cost of the most expensive r candidates starting from position j
+    # Included players are taken out as forced picks, size is what is left to choose, excluded players
+    # are dropped.
+    constraints = constraints or {}
+    fixed = set(constraints.get('include') or ())
+    if constraints.get('captain') is not None:
+        fixed.add(constraints['captain'])
+    removed = fixed | set(constraints.get('exclude') or ())
+    touch = set(constraints.get('include_any') or ())
+    teams = constraints.get('teams') or {}
+
+    prepared = []
+    for candidates, size in groups:
+        forced = [index for index in range(len(candidates)) if candidates[index][0] in fixed]
+        order = sorted((index for index in range(len(candidates)) if candidates[index][0] not in removed), key=lambda x: (-candidates[x][1], x))
+        points = [candidates[index][1] for index in order]
+        costs = [candidates[index][2] for index in order]
+        n = len(order)
+        left = max(size - len(forced), 0)
+
+        best = [[0] * (left + 1) for _ in range(n + 1)]
+        min_cost = [[0] * (left + 1) for _ in range(n + 1)]
+        max_cost = [[0] * (left + 1) for _ in range(n + 1)]
+        for r in range(1, left + 1):
+            best[n][r] = None
+            min_cost[n][r] = None
+            max_cost[n][r] = None
+        for j in range(n - 1, -1, -1):
+            for r in range(1, left + 1):
+                best[j][r] = None if best[j + 1][r - 1] is None else points[j] + best[j + 1][r - 1]
+                options = [x for x in (min_cost[j + 1][r], None if min_cost[j + 1][r - 1] is None else costs[j] + min_cost[j + 1][r - 1]) if x is not None]
+                min_cost[j][r] = min(options) if options else None
+                options = [x for x in (max_cost[j + 1][r], None if max_cost[j + 1][r - 1] is None else costs[j] + max_cost[j + 1][r - 1]) if x is not None]
+                max_cost[j][r] = max(options) if options else None
+
+        prepared.append({
+            'size': left,
+            'forced': forced,
+            'overfull': len(forced) > size,
+            'order': order,
+            'points': points,
+            'costs': costs,
+            'teams': [teams.get(candidates[index][0]) for index in order],
+            'touch': [candidates[index][0] in touch for index in order],
+            'touch_last': max((position for position, index in enumerate(order) if candidates[index][0] in touch), default=-1),
+            'best': best,
+            'min_cost': min_cost,
+            'max_cost': max_cost
+        })
+
+    return prepared
+
+
+def build_lineup(groups, loop_order, chosen):
+    indexes = [sorted(group_chosen) for group_chosen in chosen]
+    names = []
+    players_points = []
+    cost = 0
+    for (candidates, _), group_indexes in zip(groups, indexes):
+        for index in group_indexes:
+            name, points, player_cost = candidates[index]
+            names.append(name)
+            players_points.append(points)
+            cost += player_cost
+
+    order = tuple(itertools.chain.from_iterable(indexes[group_index] for group_index in loop_order))
+    return order, names, players_points, cost
+
+
+def prepare_search(groups, constraints=None):
+    constraints = constraints or {}
+    prepared = prepare_groups(groups, constraints)
+    groups_count = len(prepared)
+    names = [candidate[0] for candidates, _ in groups for candidate in candidates]
+    wanted = set(constraints.get('include') or ())
+    if constraints.get('captain') is not None:
+        wanted.add(constraints['captain'])
+    unknown = wanted - set(names)
+    if unknown:
+        raise ValueError(f'unknown players in constraints: {sorted(unknown)}')
+
+    forced = [groups[group_index][0][index] for group_index, group in enumerate(prepared) for index in group['forced']]
+    teams = constraints.get('teams') or {}
+    team_counts = {}
+    for name, _, _ in forced:
+        if teams.get(name) is not None:
+            team_counts[teams[name]] = team_counts.get(teams[name], 0) + 1
+
+    max_per_team = constraints.get('max_per_team')
+    touch_after = [False] * (groups_count + 1)
+    for group_index in range(groups_count - 1, -1, -1):
+        touch_after[group_index] = touch_after[group_index + 1] or prepared[group_index]['touch_last'] >= 0
+    touched = not constraints.get('include_any') or any(name in constraints['include_any'] for name, _, _ in forced)
+
+    search = {
+        'groups': prepared,
+        'feasible': all(not group['overfull'] and group['best'][0][group['size']] is not None for group in prepared)
+                    and constraints.get('captain') not in (constraints.get('exclude') or ())
+                    and not set(constraints.get('include') or ()) & set(constraints.get('exclude') or ())
+                    and (max_per_team is None or all(x <= max_per_team for x in team_counts.values()))
+                    and (touched or touch_after[0]),
+        'forced_points': sum(points for _, points, _ in forced),
+        'forced_cost': sum(cost for _, _, cost in forced),
+        'forced_max_points': max((points for _, points, _ in forced), default=float('-inf')),
+        'captain': constraints.get('captain'),
+        'captain_points': next((points for name, points, _ in forced if name == constraints.get('captain')), None),
+        'max_per_team': max_per_team,
+        'team_counts': team_counts,
+        'min_cost': constraints.get('min_cost'),
+        'max_cost': constraints.get('max_cost'),
+        'touched': touched,
+        'touch_after': touch_after,
+        'shard_group': next((group_index for group_index, group in enumerate(prepared) if group['size']), None),
+        'best_after': [0] * (groups_count + 1),
+        'min_cost_after': [0] * (groups_count + 1),
+        'max_cost_after': [0] * (groups_count + 1),
+        'max_points_after': [float('-inf')] * (groups_count + 1)
+    }
+    if not search['feasible']:
+        return search
+
+    for group_index in range(groups_count - 1, -1, -1):
+        group = prepared[group_index]
+        search['best_after'][group_index] = search['best_after'][group_index + 1] + group['best'][0][group['size']]
+        search['min_cost_after'][group_index] = search['min_cost_after'][group_index + 1] + group['min_cost'][0][group['size']]
+        search['max_cost_after'][group_index] = search['max_cost_after'][group_index + 1] + group['max_cost'][0][group['size']]
+        search['max_points_after'][group_index] = max(search['max_points_after'][group_index + 1], group['points'][0]) if group['size'] else search['max_points_after'][group_index + 1]
+
+    return search
+
+
+def lineup_captains(search, names, players_points):
+    if search['captain'] is not None:
+        return [names.index(search['captain'])]
+    return captain_order(players_points)
+
+
+def branch_and_bound(groups, search, loop_order, alive, floor, add_lineup, shard=None):
+    # Depth-first search over players sorted by points. For every branch the upper bound is the points so
+    # far, the best points still available per slot and the best possible captain, and min_cost is the
+    # cheapest total the branch can still reach. alive(bound, min_cost) decides whether the branch can
+    # still give a kept lineup, a bound below floor() ends the loop since the next players score less.
+    # Constraints from prepare_search are part of the walk: forced players start in every lineup, a team
+    # at its cap, a cost range or an include_any player the branch can no longer reach cut the branch.
+    # shard = (shards, index) keeps only the lineups whose first chosen player of the first open group
+    # has a sorted position equal to index modulo shards.
+    prepared = search['groups']
+    best_after = search['best_after']
+    min_cost_after = search['min_cost_after']
+    max_cost_after = search['max_cost_after']
+    max_points_after = search['max_points_after']
+    captain_points = search['captain_points']
+    max_per_team = search['max_per_team']
+    team_counts = dict(search['team_counts'])
+    lowest_cost = search['min_cost'] if search['min_cost'] is not None else float('-inf')
+    highest_cost = search['max_cost'] if search['max_cost'] is not None else float('inf')
+    touch_after = search['touch_after']
+    shard_group = search['shard_group']
+    groups_count = len(prepared)
+    chosen = [list(group['forced']) for group in prepared]
+
+    def enter(group_index, points, cost, max_points, touched):
+        while group_index < groups_count and not prepared[group_index]['size']:
+            group_index += 1
+
+        if group_index < groups_count:
+            visit(group_index, prepared[group_index]['size'], 0, points, cost, max_points, touched)
+        elif touched and lowest_cost <= cost <= highest_cost and (shard is None or shard_group is not None or shard[1] == 0):
+            add_lineup(*build_lineup(groups, loop_order, chosen))
+
+    def visit(group_index, left, start, points, cost, max_points, touched):
+        group = prepared[group_index]
+        group_points = group['points']
+        group_costs = group['costs']
+        group_teams = group['teams']
+        group_touch = group['touch']
+        rest_best = group['best']
+        rest_min_cost = group['min_cost']
+        rest_max_cost = group['max_cost']
+        next_group = left == 1
+        for position in range(start, len(group_points) - left + 1):
+            player_points = group_points[position]
+            captain_bound = captain_points if captain_points is not None else max(max_points, player_points, max_points_after[group_index + 1])
+            bound = points + player_points + rest_best[position + 1][left - 1] + best_after[group_index + 1] + captain_bound
+            if bound < floor():
+                break
+
+            if shard is not None and group_index == shard_group and left == group['size'] and position % shard[0] != shard[1]:
+                continue
+
+            is_touch = group_touch[position]
+            if not touched and not is_touch and not touch_after[group_index + 1] and (left == 1 or group['touch_last'] < position):
+                continue
+
+            team = group_teams[position] if max_per_team is not None else None
+            if team is not None and team_counts.get(team, 0) >= max_per_team:
+                continue
+
+            player_cost = cost + group_costs[position]
+            reachable_min_cost = player_cost + rest_min_cost[position + 1][left - 1] + min_cost_after[group_index + 1]
+            reachable_max_cost = player_cost + rest_max_cost[position + 1][left - 1] + max_cost_after[group_index + 1]
+            if reachable_min_cost > highest_cost or reachable_max_cost < lowest_cost or not alive(bound, reachable_min_cost):
+                continue
+
+            chosen[group_index].append(group['order'][position])
+            if team is not None:
+                team_counts[team] = team_counts.get(team, 0) + 1
+            if next_group:
+                enter(group_index + 1, points + player_points, player_cost, max(max_points, player_points), touched or is_touch)
+            else:
+                visit(group_index, left - 1, position + 1, points + player_points, player_cost, max(max_points, player_points), touched or is_touch)
+            if team is not None:
+                team_counts[team] -= 1
+            chosen[group_index].pop()
+
+    if search['feasible']:
+        enter(0, search['forced_points'], search['forced_cost'], search['forced_max_points'], search['touched'])
+
+
+def heap_threshold(heap, count):
+    # Worst kept points with a little slack, so lineups tying with it on points are still explored
+    if len(heap) < count:
+        return float('-inf')
+    points = heap[0][0][0]
+    return points - 1e-9 * max(1.0, abs(points))
+
+
+def search_top_lineups(groups, count, balance=None, loop_order=None, constraints=None, shard=None, shared_thresholds=None):
+    # Raw (key, lineup) heaps of the dream and within-budget top lineups. shared_thresholds holds the
+    # best known thresholds of other shards: the count-th best of any shard is a lower bound of the
+    # count-th best overall, so every shard can prune with the highest one.
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    search = prepare_search(groups, constraints)
+    dream_heap = []
+    heap = []
+
+    def dream_threshold():
+        if shared_thresholds is None:
+            return heap_threshold(dream_heap, count)
+        return max(heap_threshold(dream_heap, count), shared_thresholds[0])
+
+    def budget_threshold():
+        if shared_thresholds is None:
+            return heap_threshold(heap, count)
+        return max(heap_threshold(heap, count), shared_thresholds[1])
+
+    def alive(bound, min_cost):
+        return bound >= dream_threshold() or (balance is not None and min_cost <= balance and bound >= budget_threshold())
+
+    def floor():
+        if balance is None:
+            return dream_threshold()
+        return min(dream_threshold(), budget_threshold())
+
+    def add_lineup(order, names, players_points, cost):
+        in_budget = balance is not None and cost <= balance
+        negated_order = tuple(-x for x in order)
+        for captain_index in lineup_captains(search, names, players_points):
+            points = lineup_points(players_points, captain_index)
+            key = (points, negated_order, -captain_index)
+            dream_accepts = heap_accepts(dream_heap, count, key)
+            accepts = in_budget and heap_accepts(heap, count, key)
+            if not dream_accepts and not accepts:
+                break
+
+            lineup = (points, cost, names, players_points, captain_index)
+            if dream_accepts:
+                push_lineup(dream_heap, count, key, lineup)
+            if accepts:
+                push_lineup(heap, count, key, lineup)
+
+        if shared_thresholds is not None:
+            shared_thresholds[0] = max(shared_thresholds[0], heap_threshold(dream_heap, count))
+            shared_thresholds[1] = max(shared_thresholds[1], heap_threshold(heap, count))
+
+    branch_and_bound(groups, search, loop_order, alive, floor, add_lineup, shard)
+    return dream_heap, heap
+
+
+def top_lineups(groups, count, balance=None, loop_order=None, constraints=None):
+    dream_heap, heap = search_top_lineups(groups, count, balance, loop_order, constraints)
+    dream_lineups = sorted_lineups(dream_heap)
+    return dream_lineups, sorted_lineups(heap) if balance is not None else dream_lineups
+
+
+parallel_workers = None
+parallel_min_lineups = 20_000_000
+
+worker_state = {}
+
+
+def lineups_total(groups):
+    return math.prod(math.comb(len(candidates), size) for candidates, size in groups)
+
+
+def share_array(values):
+    array = np.asarray(values)
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+    return memory, (memory.name, array.dtype.str, len(array))
+
+
+def attach_array(description):
+    name, dtype, length = description
+    memory = shared_memory.SharedMemory(name=name)
+    worker_state.setdefault('memory', []).append(memory)
+    return np.ndarray((length,), dtype=dtype, buffer=memory.buf)
+
+
+def init_lineup_worker(points_description, costs_description, sizes, thresholds):
+    # Candidates are rebuilt once per worker from the shared roster arrays, a name is (group, index)
+    points = attach_array(points_description).tolist()
+    costs = attach_array(costs_description).tolist()
+    groups = []
+    start = 0
+    for group_index, (length, size) in enumerate(sizes):
+        groups.append(([((group_index, index), points[start + index], costs[start + index]) for index in range(length)], size))
+        start += length
+
+    worker_state['groups'] = groups
+    worker_state['thresholds'] = thresholds
+
+
+def search_lineup_shard(count, balance, loop_order, constraints, shard):
+    dream_heap, heap = search_top_lineups(worker_state['groups'], count, balance, loop_order, constraints, shard, worker_state['thresholds'])
+    return sorted(dream_heap, reverse=True), sorted(heap, reverse=True)
+
+
+def worker_constraints(groups, constraints):
+    # The same spec with player names replaced by the (group, index) names the workers use
+    if constraints is None:
+        return None
+
+    worker_names = {}
+    for group_index, (candidates, _) in enumerate(groups):
+        for index, (name, _, _) in enumerate(candidates):
+            worker_names.setdefault(name, (group_index, index))
+
+    unknown = [name for name in list(constraints.get('include') or ()) + [constraints.get('captain')] if name is not None and name not in worker_names]
+    if unknown:
+        raise ValueError(f'unknown players in constraints: {sorted(unknown)}')
+
+    return {
+        **constraints,
+        'teams': {worker_names[name]: team for name, team in (constraints.get('teams') or {}).items() if name in worker_names},
+        'include': [worker_names[name] for name in constraints.get('include') or ()],
+        'exclude': [worker_names[name] for name in constraints.get('exclude') or () if name in worker_names],
+        # unknown names stay as they are and match no worker candidate, as they match no candidate in top_lineups
+        'include_any': [worker_names.get(name, name) for name in constraints.get('include_any') or ()],
+        'captain': worker_names.get(constraints.get('captain'))
+    }
+
+
+def top_lineups_parallel(groups, count, balance=None, loop_order=None, constraints=None, workers=None):
+    # Same result as top_lineups, the search is split by the first player of group 0 over a process pool
+    # and the local top count heaps are merged. Small pools are searched in place.
+    workers = workers or parallel_workers or os.cpu_count() or 1
+    if workers == 1 or lineups_total(groups) < parallel_min_lineups:
+        return top_lineups(groups, count, balance, loop_order, constraints)
+
+    shards = max(1, min(len(groups[0][0]), workers * 4))
+    points_memory, points_description = share_array([points for candidates, _ in groups for _, points, _ in candidates])
+    costs_memory, costs_description = share_array([cost for candidates, _ in groups for _, _, cost in candidates])
+    thresholds = multiprocessing.RawArray('d', [float('-inf'), float('-inf')])
+    sizes = [(len(candidates), size) for candidates, size in groups]
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, shards), initializer=init_lineup_worker,
+                                                    initargs=(points_description, costs_description, sizes, thresholds)) as executor:
+            tasks = [(count, balance, loop_order, worker_constraints(groups, constraints), (shards, index)) for index in range(shards)]
+            results = list(executor.map(search_lineup_shard, *zip(*tasks)))
+    finally:
+        for memory in [points_memory, costs_memory]:
+            memory.close()
+            memory.unlink()
+
+    def merge(heaps):
+        lineups = []
+        for _, (points, cost, worker_names, players_points, captain_index) in itertools.islice(heapq.merge(*heaps, reverse=True), count):
+            names = [groups[group_index][0][index][0] for group_index, index in worker_names]
+            lineups.append((points, cost, names, players_points, captain_index))
+        return lineups
+
+    dream_lineups = merge([dream_heap for dream_heap, _ in results])
+    return dream_lineups, merge([heap for _, heap in results]) if balance is not None else dream_lineups
+
+
+def lineup_frontier(groups, count, max_balance=None, min_balance=None, loop_order=None, constraints=None):
+    # Top lineups per total cost, computed once for every balance up to max_balance. A lineup costing c
+    # is only kept if it is in the top count of all lineups costing at most c, which is exactly what a
+    # query for any balance >= c can need, so a balance query is a merge of the levels it can afford.
+    # Lineups cheaper than min_balance only ever compete together, they share the min_balance level.
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    search = prepare_search(groups, constraints)
+    levels = {}
+    prefix = {'costs': [], 'thresholds': [], 'dirty': False}
+
+    def refresh_prefix():
+        # The count-th best points at one level bounds the count-th best of every cheaper-or-equal prefix
+        if prefix['dirty']:
+            prefix['costs'] = sorted(levels)
+            prefix['thresholds'] = list(itertools.accumulate((heap_threshold(levels[level], count) for level in prefix['costs']), max))
+            prefix['dirty'] = False
+
+    def prefix_threshold(cost):
+        refresh_prefix()
+        position = bisect.bisect_right(prefix['costs'], cost)
+        return prefix['thresholds'][position - 1] if position else float('-inf')
+
+    def level_of(cost):
+        return cost if min_balance is None else max(cost, min_balance)
+
+    def alive(bound, min_cost):
+        return (max_balance is None or min_cost <= max_balance) and bound >= prefix_threshold(level_of(min_cost))
+
+    def floor():
+        return prefix_threshold(level_of(search['forced_cost'] + search['min_cost_after'][0]))
+
+    def add_lineup(order, names, players_points, cost):
+        if max_balance is not None and cost > max_balance:
+            return
+
+        level = level_of(cost)
+        heap = levels.setdefault(level, [])
+        negated_order = tuple(-x for x in order)
+        for captain_index in lineup_captains(search, names, players_points):
+            points = lineup_points(players_points, captain_index)
+            key = (points, negated_order, -captain_index)
+            if not heap_accepts(heap, count, key) or points < prefix_threshold(level):
+                break
+
+            push_lineup(heap, count, key, (points, cost, names, players_points, captain_index))
+            prefix['dirty'] = True
+
+    branch_and_bound(groups, search, loop_order, alive, floor, add_lineup)
+
+    frontier = {'count': count, 'min_balance': min_balance, 'levels': {}, 'pareto': []}
+    for level in sorted(levels):
+        frontier['levels'][level] = sorted(levels[level], reverse=True)
+        best_points = frontier['levels'][level][0][0][0]
+        if not frontier['pareto'] or best_points > frontier['pareto'][-1][1]:
+            frontier['pareto'].append((level, best_points))
+
+    return frontier
+
+
+def frontier_lineups(frontier, balance=None, count=None):
+    if count is None:
+        count = frontier['count']
+
+    if balance is not None and frontier['min_balance'] is not None and balance < frontier['min_balance']:
+        raise ValueError(f'balance {balance} is below the frontier min_balance {frontier["min_balance"]}')
+
+    affordable = [lineups for level, lineups in frontier['levels'].items() if balance is None or level <= balance]
+    merged = heapq.merge(*affordable, reverse=True)
+    return [lineup for _, lineup in itertools.islice(merged, count)]
+
+
+def top_lineups_for_balances(groups, count, balances, loop_order=None, constraints=None):
+    # One frontier answers every balance, dream teams come from a single search without a balance
+    dream_lineups, _ = top_lineups(groups, count, None, loop_order, constraints)
+    frontier = lineup_frontier(groups, count, max(balances), min(balances), loop_order, constraints)
+    return dream_lineups, {balance: frontier_lineups(frontier, balance) for balance in balances}
+
+
+def best_first_lineups(groups, balance=None, loop_order=None, constraints=None, accepts=None):
+    # Lineups in the same order as top_lineups without a count: a heap of partial lineups ordered by
+    # their upper bound, a partial lineup either takes its next candidate or skips it. accepts(names) is
+    # asked when a partial or complete lineup leaves the heap, so a caller may tighten it between
+    # lineups as long as it never accepts again what it once refused.
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    search = prepare_search(groups, constraints)
+    if not search['feasible']:
+        return
+
+    prepared = search['groups']
+    best_after = search['best_after']
+    min_cost_after = search['min_cost_after']
+    max_cost_after = search['max_cost_after']
+    max_points_after = search['max_points_after']
+    max_per_team = search['max_per_team']
+    lowest_cost = search['min_cost'] if search['min_cost'] is not None else float('-inf')
+    highest_cost = min(x for x in (search['max_cost'], balance, float('inf')) if x is not None)
+    teams = (constraints or {}).get('teams') or {}
+    groups_count = len(prepared)
+    heap = []
+    serial = itertools.count()
+
+    def push(group_index, left, position, points, cost, max_points, picks, touched):
+        while not left and group_index + 1 < groups_count:
+            group_index += 1
+            left = prepared[group_index]['size']
+            position = 0
+
+        if not left:
+            if not touched or not lowest_cost <= cost <= highest_cost:
+                return
+
+            chosen = [[] for _ in range(groups_count)]
+            for pick_group, index in picks:
+                chosen[pick_group].append(index)
+            order, names, players_points, lineup_cost = build_lineup(groups, loop_order, chosen)
+            for captain_index in lineup_captains(search, names, players_points):
+                points = lineup_points(players_points, captain_index)
+                heapq.heappush(heap, (-points, 1, order, captain_index, (points, lineup_cost, names, players_points, captain_index)))
+            return
+
+        group = prepared[group_index]
+        if position > len(group['points']) - left or not (touched or group['touch_last'] >= position or search['touch_after'][group_index + 1]):
+            return
+
+        reachable_min_cost = cost + group['min_cost'][position][left] + min_cost_after[group_index + 1]
+        reachable_max_cost = cost + group['max_cost'][position][left] + max_cost_after[group_index + 1]
+        if reachable_min_cost > highest_cost or reachable_max_cost < lowest_cost:
+            return
+
+        captain_bound = search['captain_points'] if search['captain_points'] is not None else max(max_points, group['points'][position], max_points_after[group_index + 1])
+        bound = points + group['best'][position][left] + best_after[group_index + 1] + captain_bound
+        bound += 1e-9 * max(1.0, abs(bound))
+        heapq.heappush(heap, (-bound, 0, next(serial), (group_index, left, position, points, cost, max_points, picks, touched)))
+
+    def picks_names(picks):
+        return [groups[pick_group][0][index][0] for pick_group, index in picks]
+
+    forced = tuple((group_index, index) for group_index, group in enumerate(prepared) for index in group['forced'])
+    push(0, prepared[0]['size'], 0, search['forced_points'], search['forced_cost'], search['forced_max_points'], forced, search['touched'])
+    while heap:
+        item = heapq.heappop(heap)
+        if item[1]:
+            lineup = item[4]
+            if accepts is None or accepts(lineup[2]):
+                yield lineup
+            continue
+
+        group_index, left, position, points, cost, max_points, picks, touched = item[3]
+        if accepts is not None and not accepts(picks_names(picks)):
+            continue
+
+        group = prepared[group_index]
+        push(group_index, left, position + 1, points, cost, max_points, picks, touched)
+
+        team = group['teams'][position] if max_per_team is not None else None
+        if team is not None and sum(teams.get(name) == team for name in picks_names(picks)) >= max_per_team:
+            continue
+
+        player_points = group['points'][position]
+        push(group_index, left - 1, position + 1, points + player_points, cost + group['costs'][position], max(max_points, player_points), picks + ((group_index, group['order'][position]),), touched or group['touch'][position])
+
+
+def lineup_portfolio(groups, entries, max_overlap, balance=None, max_exposure=None, loop_order=None, constraints=None):
+    # Greedy multi-entry portfolio: every pick is the best lineup sharing at most max_overlap players with
+    # each lineup picked before. max_exposure caps the share of entries a player may appear in, a number
+    # for every player or a dict by name. All picks come from one best_first_lineups stream.
+    picked = []
+    picked_names = []
+    exposure = {}
+
+    def player_cap(name):
+        share = max_exposure.get(name) if isinstance(max_exposure, dict) else max_exposure
+        return None if share is None else math.floor(share * entries + 1e-9)
+
+    def accepts(names):
+        for name in names:
+            cap = player_cap(name)
+            if cap is not None and exposure.get(name, 0) >= cap:
+                return False
+        names = set(names)
+        return all(len(names & lineup_names) <= max_overlap for lineup_names in picked_names)
+
+    for lineup in best_first_lineups(groups, balance, loop_order, constraints, accepts):
+        picked.append(lineup)
+        picked_names.append(set(lineup[2]))
+        for name in lineup[2]:
+            exposure[name] = exposure.get(name, 0) + 1
+        if len(picked) == entries:
+            break
+
+    return picked
+
+
+def lineup_variance(covariance, names, captain_index):
+    # covariance is {'names': [...], 'matrix': players x players}, the captain counts twice
+    indices = [covariance['index'][name] for name in names]
+    weights = np.ones(len(indices))
+    weights[captain_index] = 2.0
+    return max(0.0, float(weights @ covariance['matrix'][np.ix_(indices, indices)] @ weights))
+
+
+def top_lineups_by_percentile(groups, count, covariance, percentile=0.5, balance=None, loop_order=None, constraints=None):
+    # Best lineups by a percentile of their points, taken as normal with the lineup mean and the variance
+    # from the players' covariance (which must be positive semidefinite). Lineups come from
+    # best_first_lineups by mean, the standard deviation of a lineup is at most the weighted sum of the
+    # players' ones, so the stream stops once no lineup left can beat the count-th score.
+    # Returns (score, variance, lineup) best first.
+    covariance = dict(covariance, index={name: index for index, name in enumerate(covariance['names'])})
+    z = statistics.NormalDist().inv_cdf(percentile)
+    deviations = sorted((math.sqrt(max(0.0, covariance['matrix'][index, index])) for index in covariance['index'].values()), reverse=True)
+    max_deviation = sum(deviations[:sum(size for _, size in groups)]) + deviations[0] if deviations else 0.0
+
+    heap = []
+    for serial, lineup in enumerate(best_first_lineups(groups, balance, loop_order, constraints)):
+        if len(heap) == count and lineup[0] + max(z, 0.0) * max_deviation < heap[0][0][0]:
+            break
+        variance = lineup_variance(covariance, lineup[2], lineup[4])
+        score = lineup[0] + z * math.sqrt(variance)
+        push_lineup(heap, count, (score, -serial), (score, variance, lineup))
+
+    return sorted_lineups(heap)
+
+
+def cost_unit(groups):
+    return math.gcd(*(int(cost) for candidates, _ in groups for _, _, cost in candidates)) or 1
+
+
+def choose_counts(seed, shifts, size):
+    # "Choose size distinct candidates" over a histogram: layer j holds the ways to pick j of the
+    # candidates seen so far, every candidate shifts layer j - 1 into layer j by its own offsets
+    layers = np.zeros((size + 1,) + seed.shape, dtype=np.int64)
+    layers[0] = seed
+    for shift in shifts:
+        target = tuple(slice(offset, None) for offset in shift)
+        source = tuple(slice(0, dimension - offset) for dimension, offset in zip(seed.shape, shift))
+        for j in range(size, 0, -1):
+            layers[j][target] += layers[j - 1][source]
+    return layers[size]
+
+
+def lineup_cost_counts(groups):
+    # counts[c] is the number of lineups costing exactly c * unit, captains are not counted separately
+    unit = cost_unit(groups)
+    max_cost = sum(sum(sorted((int(cost) // unit for _, _, cost in candidates), reverse=True)[:size]) for candidates, size in groups)
+    counts = np.zeros(max_cost + 1, dtype=np.int64)
+    counts[0] = 1
+    for candidates, size in groups:
+        counts = choose_counts(counts, [(int(cost) // unit,) for _, _, cost in candidates], size)
+    return counts, unit
+
+
+def count_lineups_by_balance(groups, balances):
+    counts, unit = lineup_cost_counts(groups)
+    cumulative = np.cumsum(counts)
+    return {balance: int(cumulative[min(int(balance) // unit, len(cumulative) - 1)]) if balance >= 0 else 0 for balance in balances}
+
+
+def lineup_cost_points_counts(groups, points_step=1.0):
+    # counts[c][b] is the number of lineups costing c * unit and scoring about offset + b * points_step with
+    # the best captain. Every lineup is counted once, under its highest scorer: for each captain only the
+    # players ranked after it (by points) can fill the other slots.
+    unit = cost_unit(groups)
+    players = [(points, group_index, index, int(cost) // unit)
+               for group_index, (candidates, _) in enumerate(groups) for index, (_, points, cost) in enumerate(candidates)]
+    players.sort(key=lambda x: (-x[0], x[1], x[2]))
+    min_points = min(player[0] for player in players)
+    lineup_size = sum(size for _, size in groups)
+    offset = (lineup_size + 1) * min_points
+    bins = [int(round((player[0] - min_points) / points_step)) for player in players]
+
+    shape = (sum(sorted((player[3] for player in players), reverse=True)[:lineup_size]) + 1, (lineup_size + 1) * max(bins) + 1)
+    counts = np.zeros(shape, dtype=np.int64)
+    for captain, (_, captain_group, _, captain_cost) in enumerate(players):
+        histogram = np.zeros(shape, dtype=np.int64)
+        histogram[captain_cost, bins[captain] * 2] = 1
+        for group_index, (_, size) in enumerate(groups):
+            shifts = [(player[3], bins[position]) for position, player in enumerate(players) if position > captain and player[1] == group_index]
+            histogram = choose_counts(histogram, shifts, size - 1 if group_index == captain_group else size)
+        counts += histogram
+
+    return counts, unit, offset, points_step
+
+
+def share_lineups_above(groups, min_points, balances, points_step=1.0):
+    # Share of the lineups within each balance that score at least min_points with the best captain,
+    # points are rounded to points_step per player
+    counts, unit, offset, points_step = lineup_cost_points_counts(groups, points_step)
+    first_bin = max(0, int(math.ceil((min_points - offset) / points_step - 1e-9)))
+    by_cost = np.cumsum(counts, axis=0)
+    shares = {}
+    for balance in balances:
+        row = by_cost[min(int(balance) // unit, len(by_cost) - 1)] if balance >= 0 else np.zeros(counts.shape[1], dtype=np.int64)
+        total = row.sum()
+        shares[balance] = float(row[first_bin:].sum() / total) if total else 0.0
+    return shares
+
+
+def combination_arrays(candidates, size):
+    count = math.comb(len(candidates), size)
+    indexes = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(len(candidates)), size)), dtype=np.int64, count=count * size).reshape(count, size)
+    points = np.array([points for _, points, _ in candidates], dtype=np.float64)
+    costs = np.array([cost for _, _, cost in candidates], dtype=np.float64)
+    return {
+        'indexes': indexes,
+        'cost': costs[indexes].sum(axis=1),
+        'points': points[indexes].sum(axis=1),
+        'max points': points[indexes].max(axis=1) if size else np.full(len(indexes), -np.inf)
+    }
+
+
+def iterate_lineup_chunks(groups, chunk_size=1 << 20, loop_order=None):
+    # Every lineup in enumeration order, chunk by chunk: the trailing groups of loop_order are broadcast
+    # into one inner block once, the leading groups are walked in blocks of rows against it. Yields the
+    # number of the first lineup in the chunk with flat cost and best-captain points arrays.
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    arrays = [combination_arrays(*groups[group_index]) for group_index in loop_order]
+    if any(len(group_arrays['cost']) == 0 for group_arrays in arrays):
+        return
+
+    inner_cost = np.zeros(1)
+    inner_points = np.zeros(1)
+    inner_max = np.full(1, -np.inf)
+    split = len(arrays)
+    while split > 0 and len(inner_cost) * len(arrays[split - 1]['cost']) <= chunk_size:
+        split -= 1
+        group_arrays = arrays[split]
+        inner_cost = (group_arrays['cost'][:, None] + inner_cost[None, :]).ravel()
+        inner_points = (group_arrays['points'][:, None] + inner_points[None, :]).ravel()
+        inner_max = np.maximum(group_arrays['max points'][:, None], inner_max[None, :]).ravel()
+
+    outer_dimensions = [len(group_arrays['cost']) for group_arrays in arrays[:split]]
+    outer_count = math.prod(outer_dimensions)
+    rows = max(1, chunk_size // len(inner_cost))
+    for start in range(0, outer_count, rows):
+        rows_count = min(start + rows, outer_count) - start
+        outer_cost = np.zeros(rows_count)
+        outer_points = np.zeros(rows_count)
+        outer_max = np.full(rows_count, -np.inf)
+        if split:
+            outer_indexes = np.unravel_index(np.arange(start, start + rows_count), outer_dimensions)
+            for group_arrays, indexes in zip(arrays, outer_indexes):
+                outer_cost += group_arrays['cost'][indexes]
+                outer_points += group_arrays['points'][indexes]
+                outer_max = np.maximum(outer_max, group_arrays['max points'][indexes])
+
+        cost = (outer_cost[:, None] + inner_cost[None, :]).ravel()
+        points = (outer_points[:, None] + inner_points[None, :] + np.maximum(outer_max[:, None], inner_max[None, :])).ravel()
+        yield start * len(inner_cost), cost, points
+
+
+def lineups_above(groups, min_points, balance=None, chunk_size=1 << 20, loop_order=None):
+    # Every lineup scoring at least min_points with its best captain (and fitting the balance), best first.
+    # The chunks are filtered with masks, only the survivors are rebuilt with exact points.
+    if loop_order is None:
+        loop_order = range(len(groups))
+
+    numbers = []
+    slack = 1e-9 * max(1.0, abs(min_points))
+    for first, cost, points in iterate_lineup_chunks(groups, chunk_size, loop_order):
+        mask = points >= min_points - slack
+        if balance is not None:
+            mask &= cost <= balance
+        numbers.append(np.flatnonzero(mask) + first)
+
+    if not numbers:
+        return []
+
+    numbers = np.concatenate(numbers)
+    arrays = {group_index: combination_arrays(*groups[group_index])['indexes'] for group_index in loop_order}
+    combinations = np.unravel_index(numbers, [len(arrays[group_index]) for group_index in loop_order])
+    found = []
+    for row in range(len(numbers)):
+        chosen = [None] * len(groups)
+        for group_index, combination in zip(loop_order, combinations):
+            chosen[group_index] = arrays[group_index][combination[row]].tolist()
+
+        order, names, players_points, cost = build_lineup(groups, loop_order, chosen)
+        captain_index = captain_order(players_points)[0]
+        points = lineup_points(players_points, captain_index)
+        if points >= min_points:
+            found.append(((points, tuple(-x for x in order)), (points, cost, names, players_points, captain_index)))
+
+    return sorted_lineups(found)
@@ -0,0 +1,115 @@
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import time
+
+# Output files are recorded in a manifest with the hash of everything they were built from: input files
+# (match caches, rosters), plain data (arguments, already computed points) and the code: this package
+# and the directories in code_paths, where a game adds its own, which holds the scoring rules. An output
+# is rebuilt only when that hash changes.
+code_paths = [os.path.dirname(os.path.abspath(__file__))]
+code_digest = None
+
+
+def code_version():
+    global code_digest
+    if code_digest is None:
+        digest = hashlib.sha256()
+        for path in sorted(path for code_path in code_paths for path in glob.glob(os.path.join(code_path, '*.py'))):
+            digest.update(os.path.relpath(path, os.path.dirname(code_paths[0])).encode())
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+        code_digest = digest.hexdigest()
+    return code_digest
+
+
+def inputs_hash(files=(), data=None):
+    digest = hashlib.sha256(code_version().encode())
+    for path in files:
+        digest.update(path.encode())
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+        else:
+            digest.update(b'missing')
+    digest.update(json.dumps(data, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf8') as file:
+        return json.load(file)
+
+
+def outdated(manifest_path, outputs, digest):
+    manifest = load_manifest(manifest_path)
+    return any(not os.path.exists(output) or manifest.get(os.path.normpath(output)) != digest for output in outputs)
+
+
+LOCK_STALE_SECONDS = 30
+LOCK_TIMEOUT = 120
+
+
+def lock_is_stale(lock_path):
+    # A lock left by a killed run: its process is gone, or it is older than any manifest update takes.
+    # os.kill(pid, 0) only probes on POSIX, on Windows it would send a CTRL+C, there the age decides.
+    try:
+        with open(lock_path, 'r', encoding='utf8') as file:
+            pid = int(file.read() or 0)
+        age = time.time() - os.path.getmtime(lock_path)
+    except (OSError, ValueError):
+        return False
+
+    if age > LOCK_STALE_SECONDS:
+        return True
+    if pid and os.name == 'posix':
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return False
+
+
+@contextlib.contextmanager
+def manifest_lock(manifest_path, timeout=LOCK_TIMEOUT):
+    # Reports written by parallel processes update the same manifest, one at a time: the lock is a file
+    # created exclusively next to the manifest, holding the pid of its owner
+    lock_path = f'{manifest_path}.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(descriptor, str(os.getpid()).encode())
+            break
+        except FileExistsError:
+            if lock_is_stale(lock_path):
+                print(f'removing stale lock {lock_path}')
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(lock_path)
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{manifest_path} is locked by {lock_path} for more than {timeout} s')
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(descriptor)
+        os.remove(lock_path)
+
+
+def record_outputs(manifest_path, outputs, digest):
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    with manifest_lock(manifest_path):
+        manifest = load_manifest(manifest_path)
+        for output in outputs:
+            manifest[os.path.normpath(output)] = digest
+        # written aside and moved over, a reader never sees half a manifest
+        with open(f'{manifest_path}.tmp', 'w', encoding='utf8') as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+        os.replace(f'{manifest_path}.tmp', manifest_path)
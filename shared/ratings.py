@@ -0,0 +1,72 @@
+import numpy as np
+
+# Bootstrap confidence intervals and empirical Bayes (shrunk) means of the per-map or per-match points of
+# every player at once, over flat arrays of all the points. Both games rank their overall sheets by them.
+
+
+def bootstrap_means(values, players, players_count, rng, resamples, chunk_size=1 << 22):
+    # Bootstrap means of every player with maps (values sorted by player), a resample draws every map of
+    # a player from the player's own maps. Resamples go in chunks of about chunk_size draws.
+    counts = np.bincount(players, minlength=players_count)
+    present = np.flatnonzero(counts)
+    lengths = counts[present]
+    starts = np.cumsum(lengths) - lengths
+    map_starts = np.repeat(starts, lengths)
+    map_lengths = np.repeat(lengths, lengths)
+    means = np.empty((resamples, len(present)))
+    rows = max(1, chunk_size // max(1, len(values)))
+    for start in range(0, resamples, rows):
+        chunk = min(rows, resamples - start)
+        draws = map_starts + (rng.random((chunk, len(values))) * map_lengths).astype(np.int64)
+        means[start:start + chunk] = np.add.reduceat(values[draws], starts, axis=1) / lengths
+    return present, means
+
+
+def shrunk_means(values, players, players_count, groups):
+    # Empirical Bayes (normal-normal) estimate of every player's mean: shrunk toward the mean of their
+    # group (role) by the map variance against the spread of the players' means in the group
+    counts = np.bincount(players, minlength=players_count).astype(np.float64)
+    sums = np.bincount(players, weights=values, minlength=players_count)
+    means = sums / np.maximum(counts, 1)
+    squares = np.bincount(players, weights=(values - means[players]) ** 2, minlength=players_count)
+    shrunk = means.copy()
+    for group in set(groups):
+        members = np.array([index for index in range(players_count) if groups[index] == group and counts[index] > 0], dtype=np.int64)
+        if len(members) < 2:
+            continue
+        prior_mean = sums[members].sum() / counts[members].sum()
+        noise = squares[members].sum() / max(1.0, (counts[members] - 1).clip(0).sum())
+        spread = max(np.var(means[members]) - np.mean(noise / counts[members]), 1e-9)
+        weights = counts[members] / noise / (counts[members] / noise + 1 / spread) if noise > 0 else np.ones(len(members))
+        shrunk[members] = weights * means[members] + (1 - weights) * prior_mean
+    return shrunk
+
+
+def rating_intervals(fantasy_points: dict, groups: dict, keys: list, resamples: int = 1000, confidence: float = 0.9, seed: int = 0):
+    # fantasy_points is {name: player_info} with the 'points' and 'wins' lists, groups {name: group} the
+    # groups (roles) players are shrunk toward. keys are the names of the mean points, per win and per
+    # lose, each gets '<key> low' / '<key> high' / '<key> ci' and '<key> shrunk'.
+    names = list(fantasy_points)
+    player_groups = [groups.get(player_name) for player_name in names]
+    players = np.repeat(np.arange(len(names)), [len(fantasy_points[player_name]['points']) for player_name in names])
+    values = np.concatenate([fantasy_points[player_name]['points'] for player_name in names]).astype(np.float64)
+    wins = np.concatenate([fantasy_points[player_name]['wins'] for player_name in names]).astype(bool)
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2 * 100
+    for key, selected in zip(keys, [np.ones(len(values), dtype=bool), wins, ~wins]):
+        present, means = bootstrap_means(values[selected], players[selected], len(names), rng, resamples)
+        lows = np.full(len(names), np.nan)
+        highs = np.full(len(names), np.nan)
+        if len(present):
+            lows[present], highs[present] = np.percentile(means, [tail, 100 - tail], axis=0)
+        shrunk = shrunk_means(values[selected], players[selected], len(names), player_groups)
+        for player_index, player_name in enumerate(names):
+            player_info = fantasy_points[player_name]
+            if np.isnan(lows[player_index]):
+                player_info[f'{key} low'] = player_info[f'{key} high'] = player_info[f'{key} shrunk'] = 0
+                player_info[f'{key} ci'] = ''
+                continue
+            player_info[f'{key} low'] = np.round(lows[player_index], 3)
+            player_info[f'{key} high'] = np.round(highs[player_index], 3)
+            player_info[f'{key} shrunk'] = np.round(shrunk[player_index], 3)
+            player_info[f'{key} ci'] = f'{player_info[f'{key} low']:.1f} - {player_info[f'{key} high']:.1f}'
@@ -0,0 +1,65 @@
+import concurrent.futures
+import multiprocessing
+
+# A graph of tasks ({name: task}) run as soon as their dependencies are done: a task gets its args and
+# then the results of its dependencies in order. 'thread' tasks (fetching pages and records) go to a
+# thread pool, 'process' tasks (scoring, reports) to a process pool, so independent events and
+# tournaments use every core. Process task functions have to be module level functions.
+# The process pool starts its workers from a forkserver: forking the main process while the fetching
+# threads run could copy a lock one of them holds (stdout in print) into the child and hang it. The
+# workers already share the cores, so the pools a task would open itself (parallel lineup search,
+# workbook writing) run in the worker instead.
+
+
+def task(function, *args, deps=(), pool='process'):
+    return {'function': function, 'args': args, 'deps': list(deps), 'pool': pool}
+
+
+def required_tasks(tasks, names):
+    # the named tasks with everything they depend on
+    required = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in required:
+            required.add(name)
+            stack += tasks[name]['deps']
+    return {name: tasks[name] for name in tasks if name in required}
+
+
+def init_task_worker():
+    from shared import excel, lineups
+
+    lineups.parallel_workers = 1
+    excel.parallel_workers = 1
+
+
+def run_tasks(tasks, workers=None, threads=8):
+    for name, task_info in tasks.items():
+        for dep in task_info['deps']:
+            if dep not in tasks:
+                raise ValueError(f'{name} depends on unknown task {dep}')
+
+    results = {}
+    pending = dict(tasks)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as thread_pool, concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('forkserver'), initializer=init_task_worker) as process_pool:
+        while pending or running:
+            for name, task_info in list(pending.items()):
+                if all(dep in results for dep in task_info['deps']):
+                    executor = thread_pool if task_info['pool'] == 'thread' else process_pool
+                    future = executor.submit(task_info['function'], *task_info['args'], *[results[dep] for dep in task_info['deps']])
+                    running[future] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f'dependency cycle: {", ".join(sorted(pending))}')
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                print(f'done: {name}')
+
+    return results
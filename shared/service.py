@@ -0,0 +1,146 @@
+import collections
+import http.server
+import json
+import math
+import threading
+import time
+import urllib.parse
+
+from shared.columnar import table_records
+from shared.lineups import lineup_constraints
+
+# A local HTTP/JSON service over aggregates loaded once. Routes are functions of the query parameters
+# ({name: value}, the last value of a repeated name) returning anything json can dump. Answers are kept
+# in an LRU cache keyed by the route, the parameters and the data version; refresh (a function returning
+# True when it applied new data) bumps the version, on /refresh or every refresh_interval seconds.
+
+
+def json_value(value):
+    # numpy scalars and arrays
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def query_service(routes, refresh=None, cache_size=256):
+    return {
+        'routes': routes,
+        'refresh': refresh,
+        'cache': collections.OrderedDict(),
+        'cache size': cache_size,
+        'version': 0,
+        'lock': threading.Lock(),
+        'refresh lock': threading.Lock(),
+        'hits': 0,
+        'misses': 0
+    }
+
+
+def answer(service, route, params):
+    # the encoded answer of the route, from the cache when the same query was asked for this version
+    key = (route, tuple(sorted(params.items())), service['version'])
+    with service['lock']:
+        if key in service['cache']:
+            service['cache'].move_to_end(key)
+            service['hits'] += 1
+            return service['cache'][key]
+
+    body = json.dumps(service['routes'][route](params), default=json_value).encode()
+    with service['lock']:
+        service['misses'] += 1
+        service['cache'][key] = body
+        while len(service['cache']) > service['cache size']:
+            service['cache'].popitem(last=False)
+    return body
+
+
+def refresh_service(service, params=None):
+    # one refresh at a time, queries keep being answered from the old data until it is done
+    with service['refresh lock']:
+        changed = service['refresh'] is not None and service['refresh'](params or {})
+        if changed:
+            with service['lock']:
+                service['version'] += 1
+                service['cache'].clear()
+    return {'changed': bool(changed), 'version': service['version']}
+
+
+def service_status(service):
+    with service['lock']:
+        return {'version': service['version'], 'cached': len(service['cache']), 'hits': service['hits'], 'misses': service['misses'], 'routes': sorted(service['routes'])}
+
+
+def query_records(table, params, filters, sort_key=None):
+    # Rows of a table as records, filtered by the given columns, sorted by sort=column, cut by limit=N
+    records = table_records(*table)
+    for column_name in filters:
+        if column_name in params:
+            records = [record for record in records if str(record[column_name]) == params[column_name]]
+    sort_key = params.get('sort', sort_key)
+    if sort_key is not None:
+        if sort_key not in dict(table[0]):
+            raise KeyError(sort_key)
+        records.sort(key=lambda record: -math.inf if record[sort_key] is None else record[sort_key], reverse=True)
+    return records[:int(params['limit'])] if 'limit' in params else records
+
+
+def query_constraints(pro_players, params):
+    # max_per_team, include, exclude, include_any (comma separated names), captain, min_cost, max_cost
+    if not any(name in params for name in ['max_per_team', 'include', 'exclude', 'include_any', 'captain', 'min_cost', 'max_cost']):
+        return None
+
+    names = {name: params[name].split(',') if params.get(name) else [] for name in ['include', 'exclude', 'include_any']}
+    numbers = {name: int(params[name]) if name in params else None for name in ['max_per_team', 'min_cost', 'max_cost']}
+    return lineup_constraints(pro_players, numbers['max_per_team'], names['include'], names['exclude'], params.get('captain'), numbers['min_cost'], numbers['max_cost'], names['include_any'])
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        service = self.server.service
+        url = urllib.parse.urlsplit(self.path)
+        route = url.path.strip('/')
+        params = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        try:
+            if route == 'refresh':
+                status, body = 200, json.dumps(refresh_service(service, params)).encode()
+            elif route == 'status':
+                status, body = 200, json.dumps(service_status(service)).encode()
+            elif route in service['routes']:
+                status, body = 200, answer(service, route, params)
+            else:
+                status, body = 404, json.dumps({'error': f'unknown route: {route}'}).encode()
+        except (KeyError, ValueError) as e:
+            status, body = 400, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def refresh_loop(service, refresh_interval):
+    while True:
+        time.sleep(refresh_interval)
+        try:
+            refresh_service(service)
+        except Exception as e:
+            print(f'Error: {e}')
+
+
+def serve(service, host='127.0.0.1', port=8000, refresh_interval=None):
+    server = http.server.ThreadingHTTPServer((host, port), QueryHandler)
+    server.service = service
+    if refresh_interval:
+        threading.Thread(target=refresh_loop, args=(service, refresh_interval), daemon=True).start()
+
+    print(f'serving on http://{host}:{server.server_port}/ ({", ".join(sorted(service["routes"]))}, refresh, status)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,317 @@
+import concurrent.futures
+import math
+import os
+
+import numpy as np
+
+# Vectorized Monte Carlo over whole tournaments: every array has one row per simulated tournament, a
+# stage works on positions 0..k-1 of the current seeding and returns the place (1-based, shared by
+# teams finishing together) of every position. Stages are dicts:
+#   {'format': 'round_robin', 'teams': k, 'groups': 2, 'best_of': 2, 'tiebreaks': ['points', 'map_difference', 'random']}
+#   {'format': 'swiss', 'teams': 16, 'wins': 3, 'losses': 3, 'best_of': 1, 'decider_best_of': 3}
+#   {'format': 'single_elimination', 'teams': 8, 'best_of': 3, 'final_best_of': 5}
+#   {'format': 'double_elimination', 'teams': 8, 'best_of': 3, 'final_best_of': 5}
+# 'teams' is how many of the best seeded teams after the previous stage play it (all by default).
+# Round robin points are maps won for an even best_of (Bo2 groups) and series won otherwise.
+
+
+def odds_probabilities(coefficients):
+    # Bookmaker odds to outcome probabilities, the margin is taken off every outcome evenly
+    margin = 0.00
+    for coefficient in coefficients:
+        margin += 1.00 / coefficient
+    margin -= 1.00
+    return [1.00 / coefficient - margin / len(coefficients) for coefficient in coefficients]
+
+
+def series_win_probability(map_probability, best_of):
+    need = best_of // 2 + 1
+    return sum(math.comb(need - 1 + lost, lost) * map_probability ** need * (1 - map_probability) ** lost for lost in range(need))
+
+
+def map_win_probability(match):
+    # Bo2 odds are (2-0, 1-1, 0-2), odds with two outcomes are for the series of match['best_of'] maps
+    probabilities = match['probabilities']
+    if len(probabilities) == 3:
+        return probabilities[0] + probabilities[1] / 2
+
+    series_probability = probabilities[0] / (probabilities[0] + probabilities[1])
+    low, high = 0.0, 1.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if series_win_probability(middle, match.get('best_of', 3)) < series_probability:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def ratings_from_matches(teams, matches, regularization=1e-3):
+    # Logistic map ratings: a map between a and b is won by a with 1 / (1 + exp(rb - ra)). The ratings
+    # are the least squares fit of the odds, teams without odds stay close to 0.
+    team_index = {team: index for index, team in enumerate(teams)}
+    rows = []
+    targets = []
+    for match in matches:
+        probability = min(max(map_win_probability(match), 1e-6), 1 - 1e-6)
+        row = np.zeros(len(teams))
+        row[team_index[match['teams'][0]]] = 1.0
+        row[team_index[match['teams'][1]]] = -1.0
+        rows.append(row)
+        targets.append(math.log(probability / (1 - probability)))
+
+    rows.append(np.sqrt(regularization) * np.eye(len(teams)))
+    targets.extend([0.0] * len(teams))
+    ratings, *_ = np.linalg.lstsq(np.vstack(rows), np.array(targets), rcond=None)
+    return dict(zip(teams, ratings))
+
+
+def map_probabilities(teams, ratings):
+    values = np.array([ratings.get(team, 0.0) for team in teams])
+    return 1.0 / (1.0 + np.exp(values[None, :] - values[:, None]))
+
+
+def play_series(rng, probabilities, first, second, best_of):
+    # Maps won by both sides and maps played for arrays of pairings, an even best_of plays every map
+    map_wins = rng.random(first.shape + (best_of,)) < probabilities[first, second][..., None]
+    if best_of % 2 == 0:
+        first_maps = map_wins.sum(axis=-1)
+        return first_maps, best_of - first_maps, np.full(first.shape, best_of)
+
+    need = best_of // 2 + 1
+    first_wins = np.cumsum(map_wins, axis=-1)
+    second_wins = np.cumsum(~map_wins, axis=-1)
+    played = ((first_wins >= need) | (second_wins >= need)).argmax(axis=-1) + 1
+    first_maps = np.take_along_axis(first_wins, played[..., None] - 1, axis=-1)[..., 0]
+    return first_maps, played - first_maps, played
+
+
+def add_by_column(totals, columns, values):
+    # totals[row, columns[row, j]] += values[row, j], also when a row repeats a column
+    rows, width = totals.shape
+    cells = (np.arange(rows)[:, None] * width + columns).ravel()
+    totals += np.bincount(cells, weights=values.ravel().astype(np.float64), minlength=rows * width).reshape(rows, width).astype(totals.dtype)
+
+
+def play_positions(rng, probabilities, teams, maps_played, first, second, best_of):
+    # Series between stage positions, maps played are added to the teams
+    first_teams = np.take_along_axis(teams, first, axis=1)
+    second_teams = np.take_along_axis(teams, second, axis=1)
+    first_maps, second_maps, played = play_series(rng, probabilities, first_teams, second_teams, best_of)
+    add_by_column(maps_played, first_teams, played)
+    add_by_column(maps_played, second_teams, played)
+    return first_maps, second_maps
+
+
+def round_robin_stage(rng, probabilities, teams, maps_played, stage):
+    simulations, k = teams.shape
+    groups_count = stage.get('groups', 1)
+    best_of = stage.get('best_of', 2)
+    # Snake seeding: 1 2 .. g g .. 2 1 1 2 ..
+    groups = [[] for _ in range(groups_count)]
+    for position in range(k):
+        cycle, offset = divmod(position, groups_count)
+        groups[offset if cycle % 2 == 0 else groups_count - 1 - offset].append(position)
+
+    pairs = np.array([(a, b) for group in groups for i, a in enumerate(group) for b in group[i + 1:]], dtype=np.int64).reshape(-1, 2)
+    first = np.broadcast_to(pairs[:, 0], (simulations, len(pairs)))
+    second = np.broadcast_to(pairs[:, 1], (simulations, len(pairs)))
+    first_maps, second_maps = play_positions(rng, probabilities, teams, maps_played, first, second, best_of)
+
+    maps_won = np.zeros((simulations, k))
+    maps_lost = np.zeros((simulations, k))
+    add_by_column(maps_won, first, first_maps)
+    add_by_column(maps_won, second, second_maps)
+    add_by_column(maps_lost, first, second_maps)
+    add_by_column(maps_lost, second, first_maps)
+    if best_of % 2 == 0:
+        points = maps_won
+    else:
+        points = np.zeros((simulations, k))
+        add_by_column(points, first, first_maps > second_maps)
+        add_by_column(points, second, second_maps > first_maps)
+
+    tiebreak_values = {
+        'points': -points,
+        'map_difference': maps_lost - maps_won,
+        'maps_won': -maps_won,
+        'seed': np.broadcast_to(np.arange(k), (simulations, k)),
+        'random': rng.random((simulations, k))
+    }
+    keys = [tiebreak_values[tiebreak] for tiebreak in reversed(stage.get('tiebreaks', ['points', 'map_difference', 'random']))]
+
+    places = np.zeros((simulations, k), dtype=np.int64)
+    for group_index, group in enumerate(groups):
+        group_keys = [key[:, group] for key in keys]
+        ranked = np.lexsort(group_keys, axis=-1) if group_keys else np.broadcast_to(np.arange(len(group)), (simulations, len(group)))
+        ranks = np.empty_like(ranked)
+        np.put_along_axis(ranks, ranked, np.arange(len(group))[None, :], axis=1)
+        places[:, group] = ranks * groups_count + 1
+    return places
+
+
+def swiss_stage(rng, probabilities, teams, maps_played, stage):
+    # Teams with the same record meet, the best seed against the worst one. With a power of two teams
+    # the records are the same in every simulation, so the pairings are found once per round.
+    simulations, k = teams.shape
+    wins_needed = stage.get('wins', 3)
+    losses_allowed = stage.get('losses', 3)
+    wins = np.zeros((simulations, k), dtype=np.int64)
+    losses = np.zeros((simulations, k), dtype=np.int64)
+    seeds = np.broadcast_to(np.arange(k), (simulations, k))
+    while True:
+        active = (wins < wins_needed) & (losses < losses_allowed)
+        active_count = int(active[0].sum())
+        if active_count < 2:
+            break
+
+        key = np.where(active, -wins * k + seeds, np.iinfo(np.int64).max)
+        ranked = np.argsort(key, axis=1, kind='stable')[:, :active_count]
+        records = np.take_along_axis(wins, ranked[:1], axis=1)[0]
+        first_indexes = []
+        second_indexes = []
+        deciders = []
+        start = 0
+        while start < active_count:
+            stop = start
+            while stop < active_count and records[stop] == records[start]:
+                stop += 1
+            for offset in range((stop - start) // 2):
+                first_indexes.append(start + offset)
+                second_indexes.append(stop - 1 - offset)
+                losses_before = int(np.take_along_axis(losses, ranked[:1, start:start + 1], axis=1)[0, 0])
+                deciders.append(records[start] == wins_needed - 1 or losses_before == losses_allowed - 1)
+            start = stop
+
+        deciders = np.array(deciders, dtype=bool)
+        first = ranked[:, first_indexes]
+        second = ranked[:, second_indexes]
+        for decider, best_of in [(False, stage.get('best_of', 1)), (True, stage.get('decider_best_of', stage.get('best_of', 1)))]:
+            selected = deciders == decider
+            if not selected.any():
+                continue
+            first_maps, second_maps = play_positions(rng, probabilities, teams, maps_played, first[:, selected], second[:, selected], best_of)
+            first_won = first_maps > second_maps
+            add_by_column(wins, first[:, selected], first_won)
+            add_by_column(losses, first[:, selected], ~first_won)
+            add_by_column(wins, second[:, selected], ~first_won)
+            add_by_column(losses, second[:, selected], first_won)
+
+    record = wins * (losses_allowed + 1) - losses
+    return 1 + (record[:, None, :] > record[:, :, None]).sum(axis=2)
+
+
+def bracket_order(size):
+    # Seeds in bracket order, 1 meets size, the two best seeds can only meet in the final
+    order = [0]
+    while len(order) < size:
+        order = [x for seed in order for x in (seed, 2 * len(order) - 1 - seed)]
+    return order
+
+
+def knockout(rng, probabilities, teams, maps_played, first, second, best_of):
+    first_maps, second_maps = play_positions(rng, probabilities, teams, maps_played, first, second, best_of)
+    first_won = first_maps > second_maps
+    return np.where(first_won, first, second), np.where(first_won, second, first)
+
+
+def single_elimination_stage(rng, probabilities, teams, maps_played, stage):
+    simulations, k = teams.shape
+    places = np.ones((simulations, k), dtype=np.int64)
+    alive = np.broadcast_to(np.array(bracket_order(k)), (simulations, k))
+    while alive.shape[1] > 1:
+        best_of = stage.get('final_best_of', stage.get('best_of', 3)) if alive.shape[1] == 2 else stage.get('best_of', 3)
+        alive, eliminated = knockout(rng, probabilities, teams, maps_played, alive[:, 0::2], alive[:, 1::2], best_of)
+        np.put_along_axis(places, eliminated, alive.shape[1] + 1, axis=1)
+    return places
+
+
+def double_elimination_stage(rng, probabilities, teams, maps_played, stage):
+    # Upper bracket losers drop to the lower bracket, in reverse order to avoid instant rematches
+    simulations, k = teams.shape
+    best_of = stage.get('best_of', 3)
+    places = np.ones((simulations, k), dtype=np.int64)
+    upper = np.broadcast_to(np.array(bracket_order(k)), (simulations, k))
+    upper, lower = knockout(rng, probabilities, teams, maps_played, upper[:, 0::2], upper[:, 1::2], best_of)
+    lower, eliminated = knockout(rng, probabilities, teams, maps_played, lower[:, 0::2], lower[:, 1::2], best_of)
+    np.put_along_axis(places, eliminated, upper.shape[1] + lower.shape[1] + 1, axis=1)
+    while upper.shape[1] > 1:
+        upper, dropped = knockout(rng, probabilities, teams, maps_played, upper[:, 0::2], upper[:, 1::2], best_of)
+        lower, eliminated = knockout(rng, probabilities, teams, maps_played, lower, dropped[:, ::-1], best_of)
+        np.put_along_axis(places, eliminated, upper.shape[1] + lower.shape[1] + 1, axis=1)
+        if lower.shape[1] > 1:
+            lower, eliminated = knockout(rng, probabilities, teams, maps_played, lower[:, 0::2], lower[:, 1::2], best_of)
+            np.put_along_axis(places, eliminated, upper.shape[1] + lower.shape[1] + 1, axis=1)
+
+    final_best_of = stage.get('final_best_of', best_of)
+    _, eliminated = knockout(rng, probabilities, teams, maps_played, upper, lower, final_best_of)
+    np.put_along_axis(places, eliminated, 2, axis=1)
+    return places
+
+
+stage_formats = {
+    'round_robin': round_robin_stage,
+    'swiss': swiss_stage,
+    'single_elimination': single_elimination_stage,
+    'double_elimination': double_elimination_stage
+}
+
+
+def simulate_batch(probabilities, stages, simulations, seed):
+    # Histograms of final places and maps played for one batch of tournaments
+    rng = np.random.default_rng(seed)
+    n = len(probabilities)
+    order = np.tile(np.arange(n), (simulations, 1))
+    team_places = np.tile(np.arange(1, n + 1), (simulations, 1))
+    maps_played = np.zeros((simulations, n), dtype=np.int64)
+    for stage in stages:
+        k = stage.get('teams', order.shape[1])
+        stage_teams = order[:, :k]
+        stage_places = stage_formats[stage['format']](rng, probabilities, stage_teams, maps_played, stage)
+        ranked = np.lexsort((np.broadcast_to(np.arange(k), (simulations, k)), stage_places), axis=-1)
+        rest = order[:, k:]
+        np.put_along_axis(team_places, stage_teams, stage_places, axis=1)
+        np.put_along_axis(team_places, rest, np.maximum(np.take_along_axis(team_places, rest, axis=1), k + 1), axis=1)
+        order = np.concatenate([np.take_along_axis(stage_teams, ranked, axis=1), rest], axis=1)
+
+    team_cells = np.arange(n)[None, :]
+    places = np.bincount((team_cells * (n + 1) + team_places).ravel(), minlength=n * (n + 1)).reshape(n, n + 1)
+    max_maps = int(maps_played.max())
+    maps = np.bincount((team_cells * (max_maps + 1) + maps_played).ravel(), minlength=n * (max_maps + 1)).reshape(n, max_maps + 1)
+    return places, maps
+
+
+def simulate_tournament(teams, ratings, stages, simulations, batch_size=100_000, workers=None, seed=None):
+    # Distributions of final places and maps played per team over the simulated tournaments, the
+    # batches run on a process pool. teams is the initial seeding, best first.
+    probabilities = map_probabilities(teams, ratings)
+    batches = [min(batch_size, simulations - start) for start in range(0, simulations, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(batches) == 1:
+        results = [simulate_batch(probabilities, stages, batch, batch_seed) for batch, batch_seed in zip(batches, seeds)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(batches))) as executor:
+            results = list(executor.map(simulate_batch, [probabilities] * len(batches), [stages] * len(batches), batches, seeds))
+
+    n = len(teams)
+    places = sum(result_places for result_places, _ in results)
+    maps = np.zeros((n, max(result_maps.shape[1] for _, result_maps in results)), dtype=np.int64)
+    for _, result_maps in results:
+        maps[:, :result_maps.shape[1]] += result_maps
+
+    return {
+        'teams': list(teams),
+        'simulations': simulations,
+        'places': {team: places[index, 1:] / simulations for index, team in enumerate(teams)},
+        'maps played': {team: maps[index] / simulations for index, team in enumerate(teams)},
+        'expected maps': {team: float(maps[index] @ np.arange(maps.shape[1]) / simulations) for index, team in enumerate(teams)}
+    }
+
+
+def simulate_from_odds(teams, matches, stages, simulations, batch_size=100_000, workers=None, seed=None):
+    # matches with bookmaker 'coefficients' (or 'probabilities') seed the team ratings
+    for match in matches:
+        if 'probabilities' not in match:
+            match['probabilities'] = odds_probabilities(match['coefficients'])
+    return simulate_tournament(teams, ratings_from_matches(teams, matches), stages, simulations, batch_size, workers, seed)